@@ -1,99 +1,274 @@
-import os
-import yaml
-from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
-from ..core.deepseek_client import DeepSeekClient
-from ..core.content_parser import ContentParser
-from ..core.notebook_manager import NotebookManager
-from ..core.output import Output, OutputType
-from ..core.config import config
-
-class BaseAgent(ABC):
-    """基础智能体类"""
-    
-    def __init__(self, api_key: str, agent_type: str, notebook_manager: Optional[NotebookManager] = None):
-        self.agent_type = agent_type
-        self.client = DeepSeekClient(api_key, enable_thinking=config.deepseek.think_mode)
-        self.parser = ContentParser()
-        self.manager = notebook_manager if notebook_manager else NotebookManager()
-        self.prompts = self._load_prompts()
-        
-    def _load_prompts(self) -> Dict[str, Any]:
-        """加载提示词模板"""
-        prompts_path = os.path.join(os.path.dirname(__file__), '../prompts/prompts.yaml')
-        with open(prompts_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
-    
-    def _get_prompt(self, category: str, key: str, **kwargs) -> str:
-        """获取格式化后的提示词"""
-        if category in self.prompts and key in self.prompts[category]:
-            template = self.prompts[category][key]
-            return template.format(**kwargs)
-        return ""
-    
-    def _get_retry_prompt(self, task_description: str, context: Dict[str, Any]) -> str:
-        """获取重试时的提示词，包含错误上下文"""
-        error_history = context.get('previous_errors', [])
-        previous_code = context.get('previous_generated_code', '')
-        retry_attempt = context.get('retry_attempt', 1)
-        
-        # 新增：获取cell上下文和错误上下文
-        cell_context = context.get('cell_context', '暂无上下文')
-        recent_errors = context.get('error_context', [])
-        
-        # 如果有错误历史，使用专门的错误恢复提示词
-        if error_history:
-            return self._get_prompt('error_recovery_prompts', 'task_retry_with_context',
-                                task_description=task_description,
-                                context=str(context),
-                                cell_context=cell_context,
-                                error_history="\n".join([f"- {error}" for error in error_history]),
-                                recent_errors="\n".join([f"- {error.get('message', '未知错误')}" for error in recent_errors[-3:]]),
-                                previous_code=previous_code if previous_code else "无")
-        
-        # 否则使用普通提示词，但包含完整的上下文信息
-        return self._get_prompt('task_prompts', f'{self.agent_type}_task',
-                            task_description=task_description,
-                            context=str(context),
-                            cell_context=cell_context)
-    
-    def generate_response(self, system_prompt: str, user_prompt: str) -> str:
-        """生成响应"""
-        return self.client.generate_with_retry(system_prompt, user_prompt)
-    
-    def create_markdown_output(self, content: str) -> Output:
-        """创建Markdown输出"""
-        return Output(OutputType.MARKDOWN, content)
-    
-    def create_code_output(self, code: str, execute: bool = True) -> Output:
-        """创建代码输出"""
-        return Output(OutputType.CODE, code, execute)
-    
-    def create_execution_output(self, result: str) -> Output:
-        """创建执行结果输出"""
-        return Output(OutputType.EXECUTION_RESULT, result)
-    
-    def add_output_to_notebook(self, output: Output, notebook):
-        """添加输出到notebook - 修复返回逻辑"""
-        if output.output_type == OutputType.MARKDOWN:
-            notebook = self.manager.add_markdown_cell(notebook, output.content)
-        elif output.output_type == OutputType.CODE:
-            notebook = self.manager.add_code_cell(notebook, output.content)
-            if output.execute:
-                # 执行代码并获取结果
-                execution_result = self.manager.execute_cell_safely(
-                    self.manager.executor, output.content, len(notebook.cells)-1
-                )
-                # 重新加载notebook以确保输出被正确保存
-                notebook = self.manager.load_notebook()
-        elif output.output_type == OutputType.EXECUTION_RESULT:
-            notebook = self.manager.add_markdown_cell(notebook, f"**执行结果**:\n```\n{output.content}\n```")
-        
-        # 确保最终保存notebook
-        self.manager.save_notebook(notebook)
-        return notebook  # 返回更新后的notebook
-    
-    @abstractmethod
-    def execute_task(self, task_description: str, context: Dict[str, Any]) -> List[Output]:
-        """执行任务 - 子类必须实现"""
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Tuple
+from ..core.registry import get_registry
+from ..core.content_parser import ContentParser, StreamingContentParser
+from ..core.notebook_manager import NotebookManager
+from ..core.output import Output, OutputType
+from ..core.config import config
+from ..core.context_budget import get_context_budgeter
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('BaseAgent')
+
+class BaseAgent(ABC):
+    """基础智能体类"""
+    
+    def __init__(self, api_key: str, agent_type: str, notebook_manager: Optional[NotebookManager] = None):
+        self.agent_type = agent_type
+        # API客户端和提示词模板在进程内共享，避免重复建立连接和解析YAML
+        registry = get_registry()
+        self.client = registry.get_client(api_key, enable_thinking=config.deepseek.think_mode)
+        self.parser = ContentParser()
+        self.manager = notebook_manager if notebook_manager else NotebookManager()
+        self.prompt_templates = registry.get_prompts()
+        self.last_context_cuts = []  # 最近一次构建提示词时被裁剪的上下文段落
+    
+    @property
+    def prompts(self) -> Dict[str, Any]:
+        """提示词模板的原始内容"""
+        return self.prompt_templates.data
+    
+    def _get_prompt(self, category: str, key: str, **kwargs) -> str:
+        """获取格式化后的提示词"""
+        return self.prompt_templates.get(category, key, **kwargs)
+    
+    def _get_retry_prompt(self, task_description: str, context: Dict[str, Any]) -> str:
+        """获取重试时的提示词，包含错误上下文"""
+        error_history = context.get('previous_errors', [])
+        previous_code = context.get('previous_generated_code', '')
+        retry_attempt = context.get('retry_attempt', 1)
+        
+        # 新增：获取cell上下文和错误上下文
+        cell_context = context.get('cell_context', '暂无上下文')
+        recent_errors = context.get('error_context', [])
+        
+        # 如果有错误历史，使用专门的错误恢复提示词
+        if error_history:
+            return self._build_user_prompt('agent_retry', 'error_recovery_prompts', 'task_retry_with_context', context,
+                                           fixed={'task_description': task_description},
+                                           sections={
+                                               'cell_context': cell_context,
+                                               'error_history': "\n".join([f"- {error}" for error in error_history]),
+                                               'recent_errors': "\n".join([f"- {error.get('message', '未知错误')}" for error in recent_errors[-3:]]),
+                                               'previous_code': previous_code if previous_code else "无",
+                                           },
+                                           duplicates={
+                                               'cell_context': ('cell_context',),
+                                               'recent_errors': ('error_context',),
+                                               'error_history': ('previous_errors',),
+                                               'previous_code': ('previous_generated_code',),
+                                           })
+        
+        # 否则使用普通提示词，但包含完整的上下文信息
+        return self._build_user_prompt('agent_task', 'task_prompts', f'{self.agent_type}_task', context,
+                                       fixed={'task_description': task_description},
+                                       sections={'cell_context': cell_context},
+                                       duplicates={'cell_context': ('cell_context',)})
+    
+    def _build_user_prompt(self, call_site: str, category: str, key: str, context: Dict[str, Any],
+                           fixed: Dict[str, Any], sections: Dict[str, str] = None,
+                           duplicates: Dict[str, Tuple[str, ...]] = None) -> str:
+        """
+        按调用点的token预算构建用户提示词
+
+        fixed中的字段不参与裁剪；sections中的字段和上下文的各个键按优先级裁剪。
+        duplicates记录字段与上下文键的重复关系，模板引用了该字段时上下文中不再重复放入这些键。
+        """
+        sections = sections or {}
+        budgeter = get_context_budgeter()
+        if budgeter is None:
+            return self._get_prompt(category, key, **fixed, **sections, context=str(context))
+        
+        # 只保留模板实际引用的字段，避免未使用的字段占用预算
+        fields = self.prompt_templates.fields(category, key)
+        if fields is not None:
+            sections = {name: text for name, text in sections.items() if name in fields}
+        exclude = [k for name in sections for k in (duplicates or {}).get(name, ())]
+        
+        # 模板本身和固定字段占用的token不可裁剪，剩余部分分配给上下文段落
+        overhead = budgeter.count_tokens(
+            self._get_prompt(category, key, **fixed, **{name: '' for name in sections}, context=''))
+        budget = max(getattr(config.context_budget, call_site) - overhead, 0)
+        fitted, cuts = budgeter.fit(budget, sections, context, exclude)
+        if cuts:
+            logger.info(f"{call_site} 提示词超出预算，裁剪了: " +
+                        ", ".join(f"{cut['section']}({cut['action']} {cut['tokens']}->{cut['kept']})" for cut in cuts))
+        self.last_context_cuts = cuts
+        return self._get_prompt(category, key, **fixed, **fitted)
+    
+    def generate_response(self, system_prompt: str, user_prompt: str, temperature: Optional[float] = None) -> str:
+        """生成响应"""
+        return self.client.generate_with_retry(system_prompt, user_prompt, temperature=temperature)
+    
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, temperature: Optional[float] = None) -> str:
+        """异步生成响应"""
+        return await self.client.agenerate_with_retry(system_prompt, user_prompt, temperature=temperature)
+    
+    def parse_task_response(self, response: str) -> List[Output]:
+        """把模型响应解析为markdown输出和需要执行的代码输出"""
+        outputs = []
+        if response:
+            python_code, markdown_content = self.parser.extract_python_code(response)
+            
+            if markdown_content:
+                outputs.append(self.create_markdown_output(markdown_content))
+            
+            if python_code:
+                outputs.append(self.create_code_output(python_code, execute=True))
+        
+        return outputs
+    
+    def create_markdown_output(self, content: str) -> Output:
+        """创建Markdown输出"""
+        return Output(OutputType.MARKDOWN, content)
+    
+    def create_code_output(self, code: str, execute: bool = True) -> Output:
+        """创建代码输出"""
+        return Output(OutputType.CODE, code, execute)
+    
+    def create_execution_output(self, result: str) -> Output:
+        """创建执行结果输出"""
+        return Output(OutputType.EXECUTION_RESULT, result)
+    
+    def add_output_to_notebook(self, output: Output, notebook):
+        """添加输出到notebook - 修复返回逻辑"""
+        if output.output_type == OutputType.MARKDOWN:
+            notebook = self.manager.add_markdown_cell(notebook, output.content)
+        elif output.output_type == OutputType.CODE:
+            notebook = self.manager.add_code_cell(notebook, output.content)
+            if output.execute:
+                # 执行代码并获取结果
+                execution_result = self.manager.execute_cell_safely(
+                    self.manager.executor, output.content, len(notebook.cells)-1
+                )
+                # 执行后的输出已同步到manager持有的notebook
+                notebook = self.manager.nb
+        elif output.output_type == OutputType.EXECUTION_RESULT:
+            notebook = self.manager.add_markdown_cell(notebook, f"**执行结果**:\n```\n{output.content}\n```")
+        
+        # 添加cell和执行时已经保存过notebook，这里无需再次保存
+        return notebook  # 返回更新后的notebook
+    
+    async def aadd_output_to_notebook(self, output: Output, notebook):
+        """异步添加输出到notebook"""
+        if output.output_type == OutputType.MARKDOWN:
+            notebook = await self.manager.aadd_markdown_cell(notebook, output.content)
+        elif output.output_type == OutputType.CODE:
+            notebook = await self.manager.aadd_code_cell(notebook, output.content)
+            if output.execute:
+                await self.manager.aexecute_cell_safely(
+                    self.manager.executor, output.content, len(notebook.cells)-1
+                )
+                notebook = self.manager.nb
+        elif output.output_type == OutputType.EXECUTION_RESULT:
+            notebook = await self.manager.aadd_markdown_cell(notebook, f"**执行结果**:\n```\n{output.content}\n```")
+        
+        return notebook
+    
+    def build_lean_prompts(self, task_description: str, context: Dict[str, Any]) -> Tuple[str, str]:
+        """精简模式的提示词：智能体自身的系统提示词加上结构化输出的要求"""
+        system_prompt = (self._get_prompt('system_prompts', f'{self.agent_type}_agent') + "\n"
+                         + self._get_prompt('system_prompts', 'lean_format'))
+        user_prompt = self._build_user_prompt('agent_task', 'task_prompts', 'lean_task', context,
+                                              fixed={'task_description': task_description,
+                                                     'agent_type': self.agent_type},
+                                              sections={'cell_context': context.get('cell_context', '暂无上下文')},
+                                              duplicates={'cell_context': ('cell_context',)})
+        return system_prompt, user_prompt
+    
+    async def aexecute_lean_task(self, task_description: str, context: Dict[str, Any]) -> Tuple[List[Output], Dict[str, Any]]:
+        """
+        精简模式：一次模型调用同时生成任务指令、说明、代码和自我评估
+        
+        Returns:
+            tuple: (outputs, assessment)，assessment 为 {'complete': bool, 'reason': str}
+        """
+        response = await self.agenerate_response(*self.build_lean_prompts(task_description, context))
+        result = self.parser.parse_lean_response(response)
+        outputs = []
+        if result['task']:
+            outputs.append(self.create_markdown_output(f"**任务指令**\n\n{result['task']}"))
+        if result['markdown']:
+            outputs.append(self.create_markdown_output(result['markdown']))
+        if result['code']:
+            outputs.append(self.create_code_output(result['code'], execute=True))
+        assessment = result['assessment']
+        outputs.append(self.create_markdown_output(
+            f"**自我评估**: {'完成' if assessment['complete'] else '未完成'}\n\n{assessment['reason']}"))
+        return outputs, assessment
+    
+    def execute_task(self, task_description: str, context: Dict[str, Any]) -> List[Output]:
+        """执行任务"""
+        system_prompt, user_prompt = self.build_task_prompts(task_description, context)
+        response = self.generate_response(system_prompt, user_prompt)
+        return self.parse_task_response(response)
+    
+    async def aexecute_task(self, task_description: str, context: Dict[str, Any]) -> List[Output]:
+        """异步执行任务"""
+        system_prompt, user_prompt = self.build_task_prompts(task_description, context)
+        response = await self.agenerate_response(system_prompt, user_prompt)
+        return self.parse_task_response(response)
+    
+    async def astream_task(self, task_description: str, context: Dict[str, Any], notebook) -> Tuple[List[Output], Any]:
+        """
+        流式执行任务 - 边生成边把markdown写入notebook，代码块闭合后立即开始执行，不等待响应结束
+        
+        Returns:
+            tuple: (outputs, notebook)，outputs 已写入notebook并记录了所在的cell索引
+        """
+        system_prompt, user_prompt = self.build_task_prompts(task_description, context)
+        stream_parser = StreamingContentParser()
+        outputs = []
+        executions = []
+        markdown_output, markdown_raw = None, ""
+        
+        async def emit(events):
+            nonlocal notebook, markdown_output, markdown_raw
+            for kind, text in events:
+                if kind == 'markdown':
+                    markdown_raw += text
+                    content = self.parser.clean_markdown(markdown_raw)
+                    if not content:
+                        continue
+                    if markdown_output is None:
+                        markdown_output = self.create_markdown_output(content)
+                        markdown_output.cell_index = len(notebook.cells)
+                        outputs.append(markdown_output)
+                        notebook = await self.manager.aadd_markdown_cell(notebook, content)
+                    elif content != markdown_output.content:
+                        markdown_output.content = content
+                        notebook = await self.manager.aupdate_markdown_cell(notebook, markdown_output.cell_index, content)
+                else:
+                    # 代码块之后的markdown写入新的cell
+                    markdown_output, markdown_raw = None, ""
+                    code_output = self.create_code_output(text, execute=True)
+                    code_output.cell_index = len(notebook.cells)
+                    outputs.append(code_output)
+                    notebook = await self.manager.aadd_code_cell(notebook, text)
+                    execution = self.manager.aexecute_cell_safely(self.manager.executor, text, code_output.cell_index)
+                    if self.manager.executor.in_memory:
+                        # 执行与剩余响应的生成并行进行
+                        executions.append(asyncio.create_task(execution))
+                    else:
+                        # nbconvert后端会从磁盘重新加载notebook，不能与cell写入并行
+                        await execution
+                        notebook = self.manager.nb
+        
+        try:
+            async for delta in self.client.astream(system_prompt, user_prompt):
+                await emit(stream_parser.feed(delta))
+            await emit(stream_parser.finish())
+        finally:
+            # 生成中途失败时也要等待已开始的执行结束，避免与重试时的回滚并发
+            results = await asyncio.gather(*executions, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        
+        return outputs, self.manager.nb
+    
+    @abstractmethod
+    def build_task_prompts(self, task_description: str, context: Dict[str, Any]) -> Tuple[str, str]:
+        """构建任务的系统提示词和用户提示词 - 子类必须实现"""
         pass
\ No newline at end of file
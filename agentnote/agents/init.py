@@ -1,15 +1,15 @@
-from .base_agent import BaseAgent
-from .commander_agent import CommanderAgent
-from .observe_agent import ObserveAgent
-from .orient_agent import OrientAgent
-from .decision_agent import DecisionAgent
-from .action_agent import ActionAgent
-
-__all__ = [
-    'BaseAgent',
-    'CommanderAgent', 
-    'ObserveAgent',
-    'OrientAgent',
-    'DecisionAgent',
-    'ActionAgent'
+from .base_agent import BaseAgent
+from .commander_agent import CommanderAgent
+from .observe_agent import ObserveAgent
+from .orient_agent import OrientAgent
+from .decision_agent import DecisionAgent
+from .action_agent import ActionAgent
+
+__all__ = [
+    'BaseAgent',
+    'CommanderAgent', 
+    'ObserveAgent',
+    'OrientAgent',
+    'DecisionAgent',
+    'ActionAgent'
 ]
\ No newline at end of file
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+AgentNote 批量任务入口 - 用进程池并行执行任务文件中的多个任务
+
+任务文件每行一个任务：纯文本为任务描述，或JSON对象 {"id": ..., "mission": ...}；
+空行和以 # 开头的行被忽略。每个任务在 <批次目录>/<任务id>/ 下拥有独立的notebook、
+工作目录和内核，结果、状态和notebook路径在每个任务结束后写入汇总文件。
+
+用法:
+    python -m agentnote.batch missions.txt --workers 8
+    python -m agentnote.batch missions.txt --batch-dir environment/batch_night --resume
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from agentnote.core.config import config
+from agentnote.utils.config_loader import load_config_from_yaml
+from agentnote.utils.setup_logger import get_logger
+
+logger = get_logger('Batch')
+
+
+def load_missions(path: str) -> List[Dict[str, str]]:
+    """读取任务文件"""
+    missions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                mission, mission_id = item['mission'], item.get('id')
+            else:
+                mission, mission_id = line, None
+            mission_id = str(mission_id) if mission_id is not None else f"m{len(missions) + 1:04d}"
+            missions.append({'id': mission_id, 'mission': mission})
+
+    ids = [m['id'] for m in missions]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"任务id重复: {duplicates}")
+    for mission_id in ids:
+        if not re.fullmatch(r'[\w.-]+', mission_id):
+            raise ValueError(f"任务id只能包含字母、数字、下划线、点和横线: {mission_id!r}")
+    return missions
+
+
+def _init_worker(config_data: Dict[str, Any], batch_dir: str):
+    """工作进程初始化：继承主进程的配置，API日志按进程分开写入"""
+    config.update_from_dict(config_data)
+    config.api_log.path = os.path.join(batch_dir, f"deepseek_api_log.{os.getpid()}.jsonl")
+
+
+def _run_mission(item: Dict[str, str], batch_dir: str, api_key: str) -> Dict[str, Any]:
+    """在工作进程中执行一个任务，notebook、内核工作目录、账本和追踪记录都放在任务自己的目录下"""
+    from agentnote.agents.commander_agent import CommanderAgent
+
+    mission_dir = os.path.join(batch_dir, item['id'])
+    config.notebook.directory = mission_dir
+    config.budget.ledger_path = os.path.join(mission_dir, "token_ledger.jsonl")
+    config.tracing.dir = mission_dir
+
+    result = {'id': item['id'], 'mission': item['mission'], 'worker': os.getpid(),
+              'directory': mission_dir, 'started': datetime.now().isoformat()}
+    start = time.perf_counter()
+    commander = None
+    try:
+        commander = CommanderAgent(api_key)
+        success = commander.execute_mission(item['mission'])
+        history = commander.mission_history[-1]
+        result.update({
+            'status': 'completed',
+            'success': success,
+            'usage': history.get('usage'),
+            'budget_exceeded': history.get('budget_exceeded'),
+            'time_breakdown': history.get('time_breakdown'),
+        })
+    except Exception as e:
+        logger.exception(f"任务 {item['id']} 执行异常", exc_info=e)
+        result.update({'status': 'error', 'success': False, 'error': f"{type(e).__name__}: {e}"})
+
+    if commander is not None and commander.current_circle is not None:
+        result['notebook'] = commander.current_circle.manager.notebook_path
+    result['wall_time'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _write_summary(path: str, summary: Dict[str, Any]):
+    """原子地写入汇总文件，批量执行中途中断时已完成的结果不会丢失"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_batch(missions: List[Dict[str, str]], batch_dir: str, workers: int = None,
+              api_key: str = None, resume: bool = False, summary_path: str = None) -> Dict[str, Any]:
+    """并行执行一批任务，返回汇总结果"""
+    workers = workers or config.batch.workers
+    api_key = api_key or config.deepseek.api_key
+    os.makedirs(batch_dir, exist_ok=True)
+    summary_path = summary_path or os.path.join(batch_dir, "summary.json")
+
+    # 续跑时跳过上次已完成的任务
+    results: Dict[str, Dict[str, Any]] = {}
+    if resume and os.path.exists(summary_path):
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            for result in json.load(f).get('results', []):
+                if result.get('status') == 'completed':
+                    results[result['id']] = result
+        logger.info(f"续跑批次 {batch_dir}，跳过已完成的 {len(results)} 个任务")
+    pending = [m for m in missions if m['id'] not in results]
+
+    summary = {
+        'batch_dir': batch_dir,
+        'started': datetime.now().isoformat(),
+        'finished': None,
+        'workers': workers,
+        'total': len(missions),
+    }
+    order = {m['id']: i for i, m in enumerate(missions)}
+
+    def update_summary():
+        ordered = sorted(results.values(), key=lambda r: order.get(r['id'], len(order)))
+        summary.update({
+            'completed': sum(1 for r in ordered if r.get('status') == 'completed'),
+            'succeeded': sum(1 for r in ordered if r.get('success')),
+            'failed': sum(1 for r in ordered if not r.get('success')),
+            'results': ordered,
+        })
+        _write_summary(summary_path, summary)
+
+    update_summary()
+    if pending:
+        # 工作进程中有后台事件循环线程和内核，使用spawn避免fork带来的状态复制问题
+        pool_kwargs = {}
+        if config.batch.max_missions_per_worker > 0 and sys.version_info >= (3, 11):
+            pool_kwargs['max_tasks_per_child'] = config.batch.max_missions_per_worker
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(asdict(config), batch_dir),
+                                 **pool_kwargs) as pool:
+            futures = {pool.submit(_run_mission, item, batch_dir, api_key): item for item in pending}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 工作进程崩溃（如内存不足被杀）时记录为错误，不影响其他任务
+                    result = {'id': item['id'], 'mission': item['mission'], 'status': 'error',
+                              'success': False, 'error': f"{type(e).__name__}: {e}"}
+                results[item['id']] = result
+                update_summary()
+                logger.info(f"[{len(results)}/{len(missions)}] {item['id']}: {result['status']}, "
+                            f"{'成功' if result.get('success') else '失败'}")
+
+    summary['finished'] = datetime.now().isoformat()
+    update_summary()
+    logger.info(f"批量执行完成: 成功 {summary['succeeded']}/{summary['total']}，汇总文件: {summary_path}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AgentNote 批量任务执行')
+    parser.add_argument('missions', help='任务文件，每行一个任务（纯文本或JSON）')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认取配置 batch.workers')
+    parser.add_argument('--batch-dir', default=None, help='批次目录，默认 <notebook目录>/batch_<时间戳>')
+    parser.add_argument('--summary', default=None, help='汇总文件，默认 <批次目录>/summary.json')
+    parser.add_argument('--resume', action='store_true', help='跳过汇总文件中已完成的任务')
+    parser.add_argument('--config', default='config.yaml', help='配置文件')
+    args = parser.parse_args(argv)
+
+    load_config_from_yaml(args.config)
+    if config.deepseek.backend == "replay":
+        api_key = "replay"
+    else:
+        api_key = os.getenv('DEEPSEEK_API_KEY') or config.deepseek.api_key
+    if not api_key:
+        logger.error("需要通过 DEEPSEEK_API_KEY 环境变量或配置文件提供DeepSeek API密钥")
+        return 1
+
+    missions = load_missions(args.missions)
+    batch_dir = args.batch_dir or os.path.join(config.notebook.directory,
+                                               f"batch_{time.strftime('%Y%m%d_%H%M%S')}")
+    summary = run_batch(missions, batch_dir, args.workers, api_key, args.resume, args.summary)
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
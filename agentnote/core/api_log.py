@@ -0,0 +1,196 @@
+import io
+import os
+import glob
+import gzip
+import json
+import queue
+import atexit
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterator, List
+from .config import config
+from ..utils.setup_logger import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = get_logger('ApiLog')
+
+_STOP = object()
+
+class ApiLogWriter:
+    """
+    API调用日志写入器 - 调用方只把记录放入有界队列，由后台线程批量写盘
+
+    文件超过大小上限时轮转为带时间戳的分段并按配置压缩（gzip/zstd）。
+    启用提示词去重时，提示词以内容哈希引用，同一分段中每个提示词的原文只写一次。
+    """
+
+    def __init__(self, path: str, queue_size: int = 1000, batch_size: int = 64, max_mb: float = 50,
+                 max_segments: int = 0, compression: str = "gzip", dedup_prompts: bool = False):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_segments = max_segments
+        self.compression = compression
+        if compression == "zstd" and zstandard is None:
+            logger.warning("未安装zstandard，轮转的日志改用gzip压缩")
+            self.compression = "gzip"
+        self.dedup_prompts = dedup_prompts
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._seen_prompts = set()  # 当前分段中已写出原文的提示词
+        self._thread = threading.Thread(target=self._run, name='ApiLogWriter', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, entry: Dict[str, Any]):
+        """提交一条日志记录；队列已满时等待后台线程写出，限制内存占用"""
+        self._queue.put(entry)
+
+    def flush(self):
+        """等待已提交的记录全部写盘"""
+        self._queue.join()
+
+    def close(self):
+        """写出剩余记录并停止后台线程"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # 取出队列中已有的记录，合并为一次写入
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(entry is _STOP for entry in batch)
+            try:
+                self._write_batch([entry for entry in batch if entry is not _STOP])
+            except Exception as e:
+                logger.error(f"写入API日志失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write_batch(self, entries: List[Dict[str, Any]]):
+        if not entries:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        lines = []
+        for entry in entries:
+            if self.dedup_prompts:
+                entry = self._dedup(entry, lines)
+            lines.append(json.dumps(entry, ensure_ascii=False))
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _dedup(self, entry: Dict[str, Any], lines: List[str]) -> Dict[str, Any]:
+        """把请求中的提示词替换为哈希引用，首次出现时先写出提示词原文"""
+        request = dict(entry.get('request') or {})
+        for field in ('system_prompt', 'user_prompt'):
+            text = request.pop(field, None)
+            if text is None:
+                continue
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+            if digest not in self._seen_prompts:
+                self._seen_prompts.add(digest)
+                lines.append(json.dumps({'prompt': digest, 'text': text}, ensure_ascii=False))
+            request[f'{field}_ref'] = digest
+        return {**entry, 'request': request}
+
+    def _rotate(self):
+        """把当前文件轮转为带时间戳的分段，压缩并清理超出数量的旧分段"""
+        self._file.close()
+        self._file = None
+        self._seen_prompts.clear()
+        segment = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, segment)
+
+        if self.compression == "gzip":
+            with open(segment, 'rb') as src, gzip.open(segment + '.gz', 'wb') as dst:
+                dst.writelines(src)
+            os.remove(segment)
+        elif self.compression == "zstd":
+            with open(segment, 'rb') as src, open(segment + '.zst', 'wb') as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+            os.remove(segment)
+
+        if self.max_segments > 0:
+            segments = [p for p in log_segments(self.path) if p != self.path]
+            for old in segments[:-self.max_segments]:
+                os.remove(old)
+
+
+def log_segments(path: str) -> List[str]:
+    """日志的所有分段，按时间从旧到新排列，当前文件在最后"""
+    segments = sorted(p for p in glob.glob(glob.escape(path) + '.*') if not p.endswith('.tmp'))
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+def _open_segment(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"读取 {path} 需要安装zstandard")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_api_log(path: str) -> Iterator[Dict[str, Any]]:
+    """按时间顺序读取日志的所有分段，还原以哈希引用的提示词"""
+    prompts = {}
+    for segment in log_segments(path):
+        with _open_segment(segment) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'prompt' in entry and 'text' in entry:
+                    prompts[entry['prompt']] = entry['text']
+                    continue
+                request = entry.get('request')
+                if request:
+                    for field in ('system_prompt', 'user_prompt'):
+                        ref = request.pop(f'{field}_ref', None)
+                        if ref is not None:
+                            request[field] = prompts.get(ref)
+                yield entry
+
+
+_writers: Dict[str, ApiLogWriter] = {}
+_writers_lock = threading.Lock()
+
+def get_api_log_writer(path: str = None) -> ApiLogWriter:
+    """获取写入指定日志文件的进程级共享写入器"""
+    path = os.path.abspath(path or config.api_log.path)
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = ApiLogWriter(path,
+                                  queue_size=config.api_log.queue_size,
+                                  batch_size=config.api_log.batch_size,
+                                  max_mb=config.api_log.max_mb,
+                                  max_segments=config.api_log.max_segments,
+                                  compression=config.api_log.compression,
+                                  dedup_prompts=config.api_log.dedup_prompts)
+            _writers[path] = writer
+        return writer
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Coroutine
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """获取进程级后台事件循环，同步接口的所有调用都在该循环上运行"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='AgentNoteLoop', daemon=True)
+            _loop_thread.start()
+        return _loop
+
+def submit(coro: Coroutine) -> concurrent.futures.Future:
+    """把协程提交到后台事件循环，不等待结果；可通过返回的Future取消"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop())
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    在同步代码中运行协程并返回结果
+
+    协程统一提交到后台事件循环，因此在已有事件循环的环境（如Jupyter）中同样可用，
+    并且异步客户端在多次调用之间始终绑定同一个事件循环
+    """
+    loop = _get_background_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("不能在异步执行路径中调用同步接口，请改用对应的异步方法")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -0,0 +1,128 @@
+import os
+import copy
+import base64
+import hashlib
+import mimetypes
+from typing import Dict, Any, List, Optional
+from .config import config
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('BlobStore')
+
+# 以base64保存在notebook中的二进制输出类型（svg是文本，不在此列）
+BINARY_MIME_PREFIXES = ('image/', 'audio/', 'video/')
+BINARY_MIME_TYPES = ('application/pdf',)
+
+
+class BlobStore:
+    """
+    内容寻址的输出存储 - 图片等二进制输出按内容哈希保存在notebook旁的隐藏目录中
+
+    相同内容只保存一份，cell中删除对应的base64数据，在元数据 agentnote.blobs 中记录引用；
+    只有显式导出时才把数据还原到notebook中。
+    """
+
+    def __init__(self, notebook_path: str, enabled: bool = True):
+        self.root = os.path.dirname(os.path.abspath(notebook_path))
+        self.directory = os.path.join(self.root, f".{os.path.basename(notebook_path)}.blobs")
+        self.enabled = enabled
+
+    @classmethod
+    def from_config(cls, notebook_path: str) -> 'BlobStore':
+        return cls(notebook_path, config.notebook.blob_store)
+
+    def put(self, data: bytes, mime: str) -> Dict[str, Any]:
+        """保存二进制内容，已存在相同内容时直接复用，返回引用"""
+        digest = hashlib.sha256(data).hexdigest()
+        name = digest + (mimetypes.guess_extension(mime) or '.bin')
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            metrics.count('blob_dedup_hits')
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with metrics.timer('notebook_io', op='blob_write', bytes=len(data)), open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return {'sha256': digest, 'path': os.path.relpath(path, self.root), 'bytes': len(data)}
+
+    def get(self, ref: Dict[str, Any]) -> Optional[bytes]:
+        """读取引用的内容，文件不存在时返回None"""
+        path = os.path.join(self.root, ref['path'])
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            logger.warning(f"输出文件不存在: {path}")
+            return None
+
+    def externalize(self, cell) -> bool:
+        """
+        把cell刚执行得到的二进制输出移入存储，返回cell是否被修改
+
+        cell的输出被新的执行结果替换后调用，之前记录的引用随旧输出一起作废。
+        """
+        if not self.enabled or cell.cell_type != 'code':
+            return False
+        refs = []
+        for i, output in enumerate(cell.get('outputs', [])):
+            if output.output_type not in ('execute_result', 'display_data'):
+                continue
+            for key in [key for key, value in output.get('data', {}).items()
+                        if is_binary_mime(key) and isinstance(value, str)]:
+                ref = {'output': i, 'key': key, **self.put(base64.b64decode(output.data.pop(key)), key)}
+                refs.append(ref)
+                if not output.data:
+                    output.data['text/plain'] = f"[{key} 已保存到 {ref['path']}]"
+
+        metadata = cell.metadata.get('agentnote', {})
+        if refs:
+            cell.metadata.setdefault('agentnote', {})['blobs'] = refs
+        elif 'blobs' in metadata:
+            del metadata['blobs']
+        else:
+            return False
+        return True
+
+    def inline(self, cell):
+        """返回二进制输出还原到outputs中的cell副本，没有引用的cell原样返回"""
+        refs = blob_refs(cell)
+        if not refs:
+            return cell
+        cell = copy.deepcopy(cell)
+        for ref in refs:
+            data = self.get(ref)
+            if data is not None and ref['output'] < len(cell.outputs):
+                cell.outputs[ref['output']].data[ref['key']] = base64.b64encode(data).decode('ascii')
+        del cell.metadata['agentnote']['blobs']
+        if not cell.metadata['agentnote']:
+            del cell.metadata['agentnote']
+        return cell
+
+    def inline_notebook(self, nb):
+        """返回所有二进制输出都还原后的notebook副本（导出完整notebook时使用）"""
+        inlined = copy.copy(nb)
+        inlined.cells = [self.inline(cell) for cell in nb.cells]
+        return inlined
+
+    def collect_garbage(self, nb) -> int:
+        """删除notebook中已没有cell引用的文件，返回删除的数量"""
+        if not os.path.isdir(self.directory):
+            return 0
+        referenced = {os.path.basename(ref['path']) for cell in nb.cells for ref in blob_refs(cell)}
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name not in referenced:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        return removed
+
+
+def is_binary_mime(mime: str) -> bool:
+    return (mime.startswith(BINARY_MIME_PREFIXES) and mime != 'image/svg+xml') or mime in BINARY_MIME_TYPES
+
+
+def blob_refs(cell) -> List[Dict[str, Any]]:
+    """cell中已移入存储的二进制输出的引用"""
+    return list(cell.get('metadata', {}).get('agentnote', {}).get('blobs', []))
@@ -1,151 +1,228 @@
-import time
-from typing import Dict, Any, List
-from .phase import Phase, PhaseType
-from .context import Context
-from .notebook_manager import NotebookManager
-from .evaluator import PhaseEvaluator, CircleEvaluator
-from ..utils.setup_logger import get_logger
-
-logger = get_logger('Circle')
-
-class Circle:
-    """OODA循环"""
-    
-    def __init__(self, 
-                 mission: str, 
-                 context: Context, 
-                 deepseek_client, 
-                 circle_evaluator: CircleEvaluator, 
-                 phase_evaluator: PhaseEvaluator,):
-        self.mission = mission
-        self.context = context
-        self.client = deepseek_client
-        self.manager = NotebookManager()
-        self.circle_evaluator = circle_evaluator
-        self.phase_evaluator = phase_evaluator
-        self.phases = []
-        self.current_phase_index = 0
-        self.completed = False
-        self.success = False
-        self.retry_count = 0
-        
-        self.goal = f"通过OODA循环完成任务: {mission}"
-        self.cell_context = ""  # 存储该循环的所有cell内容
-        
-        # 初始化notebook
-        self.nb = self.manager.initialize_notebook()
-        
-        # 添加任务标题
-        self.manager.add_markdown_cell(self.nb, f"# OODA循环任务: {mission}\n\n开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    def execute(self) -> bool:
-        """执行OODA循环"""
-        max_circles = 5
-        
-        for circle_num in range(max_circles):
-            logger.info(f"\n=== 开始OODA循环 {circle_num + 1} ===")
-            
-            # 记录循环开始的cell索引
-            start_cell_index = len(self.nb.cells)
-            
-            circle_context = {
-                'circle_number': circle_num + 1,
-                'goal': self.goal,
-                'start_cell_index': start_cell_index
-            }
-            self.context.set_circle_context(circle_num + 1, circle_context)
-            
-            # 执行四个阶段，传入共享的NotebookManager
-            phases = [
-                Phase(PhaseType.OBSERVE, self.context, self.client, self.phase_evaluator, self.manager),
-                Phase(PhaseType.ORIENT, self.context, self.client, self.phase_evaluator, self.manager),
-                Phase(PhaseType.DECISION, self.context, self.client, self.phase_evaluator, self.manager),
-                Phase(PhaseType.ACTION, self.context, self.client, self.phase_evaluator, self.manager)
-            ]
-            
-            success = True
-            for phase in phases:
-                phase_success, self.nb = phase.execute(self.nb)  # 接收更新后的notebook
-                if not phase_success:
-                    success = False
-                    break
-            
-            # 收集该循环的所有cell内容作为上下文
-            end_cell_index = len(self.nb.cells)
-            self.cell_context = self._collect_cell_context(start_cell_index, end_cell_index)
-            
-            circle_context.update({
-                'completed': True,
-                'success': success,
-                'end_cell_index': end_cell_index,
-                'cell_context': self.cell_context
-            })
-            self.context.set_circle_context(circle_num + 1, circle_context)
-            
-            # 评估循环是否成功 - 使用注入的评估器，并传入goal和context
-            circle_success, evaluate_response = self.circle_evaluator.evaluate_circle_success(
-                self.context.get_all(),  # 现在包含完整的上下文信息
-                self.goal,
-                self.cell_context
-            )
-            
-            self.manager.add_markdown_cell(self.nb, evaluate_response + "\n---\n## 循环评估结果: " + '成功' if circle_success else '失败')
-            
-            if circle_success:
-                logger.info(f"OODA循环 {circle_num + 1} 执行成功")
-                self.success = True
-                self.completed = True
-                break  # 这里已经正确跳出循环
-            else:
-                logger.warning(f"🔄 OODA循环 {circle_num + 1} 未完成目标，准备下一循环")
-                # 更新上下文，为下一循环做准备
-                self.context.update({
-                    'previous_circle': circle_num + 1,
-                    'circle_feedback': f"第{circle_num + 1}循环未达成目标",
-                    'circle_goal': self.goal,
-                    'circle_context': self.cell_context
-                })
-        
-        # 添加完成标记
-        if self.completed:
-            status = "成功" if self.success else "未完成"
-            self.manager.add_markdown_cell(self.nb, 
-                f"## 任务完成\n\n状态: {status}\n完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        else:
-            self.manager.add_markdown_cell(self.nb,
-                f"## 任务终止\n\n已达到最大循环次数\n终止时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        return self.success
-
-    
-    def _collect_cell_context(self, start_index: int, end_index: int) -> str:
-        """收集指定范围内的cell内容作为上下文"""
-        context_parts = []
-        for i in range(start_index, min(end_index, len(self.nb.cells))):
-            cell = self.nb.cells[i]
-            if cell.cell_type == 'markdown':
-                context_parts.append(f"Markdown Cell {i}: {cell.source}")
-            elif cell.cell_type == 'code':
-                context_parts.append(f"Code Cell {i}: {cell.source}")
-                # 如果有输出，也包含输出
-                if hasattr(cell, 'outputs') and cell.outputs:
-                    for output in cell.outputs:
-                        if output.output_type == 'stream':
-                            context_parts.append(f"Output: {output.text}")
-                        elif output.output_type == 'execute_result' and 'text/plain' in output.data:
-                            context_parts.append(f"Result: {output.data['text/plain']}")
-        
-        return "\n".join(context_parts)
-    
-    def get_status(self) -> Dict[str, Any]:
-        """获取循环状态"""
-        return {
-            'mission': self.mission,
-            'goal': self.goal,
-            'completed': self.completed,
-            'success': self.success,
-            'current_phase': self.current_phase_index,
-            'total_phases': len(self.phases),
-            'retry_count': self.retry_count,
-            'cell_context_length': len(self.cell_context) if self.cell_context else 0
+import time
+import asyncio
+from typing import Dict, Any, List, Optional
+from .phase import Phase, PhaseType
+from .context import Context
+from .notebook_manager import NotebookManager
+from .evaluator import PhaseEvaluator, CircleEvaluator
+from .rule_evaluator import with_rules
+from .async_utils import run_sync
+from .registry import get_registry
+from .config import config
+from .ledger import BudgetExceeded, ledger_scope, is_degraded
+from .tracing import span
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('Circle')
+
+class Circle:
+    """OODA循环"""
+    
+    def __init__(self, 
+                 mission: str, 
+                 context: Context, 
+                 deepseek_client, 
+                 circle_evaluator: CircleEvaluator, 
+                 phase_evaluator: PhaseEvaluator,
+                 notebook_dir: Optional[str] = None):
+        self.mission = mission
+        self.context = context
+        self.client = deepseek_client
+        # notebook所在目录也是内核的工作目录和回滚跟踪的范围
+        self.manager = NotebookManager(directory=notebook_dir)
+        self.circle_evaluator = circle_evaluator
+        # 按配置先用规则评估阶段，无法确定时再调用传入的评估器
+        self.phase_evaluator = with_rules(phase_evaluator, self.manager, context)
+        self.phases = []
+        self.current_circle = 0
+        self.current_phase_index = 0
+        self.completed = False
+        self.success = False
+        self.retry_count = 0
+        
+        self.goal = f"通过OODA循环完成任务: {mission}"
+        self.cell_context = ""  # 存储该循环的所有cell内容
+        
+        # 初始化notebook
+        self.nb = self.manager.initialize_notebook()
+        
+        # 添加任务标题
+        self.manager.add_markdown_cell(self.nb, f"# OODA循环任务: {mission}\n\n开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    def execute(self) -> bool:
+        """执行OODA循环"""
+        return run_sync(self.aexecute())
+    
+    async def aexecute(self) -> bool:
+        """异步执行OODA循环"""
+        stop_reason = "已达到最大循环次数"
+        try:
+            stop_reason = await self._arun_circles() or stop_reason
+        except BudgetExceeded as e:
+            # 预算耗尽时停止任务，保留已生成的notebook
+            logger.error(f"❌ {e}")
+            stop_reason = f"超出预算: {e}"
+        except asyncio.CancelledError:
+            # 任务被取消：记录终止原因并关闭内核后继续向上传递取消
+            logger.warning("任务已取消")
+            self.manager.executor.interrupt()
+            stop_reason = "任务已取消"
+            raise
+        except Exception as e:
+            # 阶段外的模型调用（评估等）出错时同样要关闭内核，异常继续向上传递
+            logger.error(f"❌ 任务执行异常: {e}")
+            stop_reason = f"执行异常: {type(e).__name__}: {e}"
+            raise
+        finally:
+            # 无论以何种方式结束都要关闭内核、释放注册表中的智能体，否则manager和内核一直存活
+            await asyncio.shield(self._afinish(stop_reason))
+        return self.success
+    
+    async def _afinish(self, stop_reason: str):
+        """写入任务结束标记，关闭内核并释放智能体"""
+        try:
+            # 添加完成标记
+            if self.completed:
+                status = "成功" if self.success else "未完成"
+                await self.manager.aadd_markdown_cell(self.nb, 
+                    f"## 任务完成\n\n状态: {status}\n完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+            else:
+                await self.manager.aadd_markdown_cell(self.nb,
+                    f"## 任务终止\n\n{stop_reason}\n终止时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        finally:
+            # 任务结束，关闭该notebook的内核
+            try:
+                await self.manager.aclose()
+            finally:
+                get_registry().release_agents(self.manager)
+
+    async def _arun_circles(self):
+        """依次执行OODA循环，提前停止时返回停止原因"""
+        max_circles = 5
+        
+        for circle_num in range(max_circles):
+            with ledger_scope(str(circle_num + 1)), span(f"circle {circle_num + 1}", 'circle', circle=circle_num + 1) as circle_span:
+                logger.info(f"\n=== 开始OODA循环 {circle_num + 1} ===")
+                
+                # 记录循环开始的cell索引
+                start_cell_index = len(self.nb.cells)
+                
+                circle_context = {
+                    'circle_number': circle_num + 1,
+                    'goal': self.goal,
+                    'start_cell_index': start_cell_index
+                }
+                self.context.set_circle_context(circle_num + 1, circle_context)
+                
+                # 执行四个阶段，传入共享的NotebookManager
+                self.current_circle = circle_num + 1
+                self.phases = phases = [
+                    Phase(PhaseType.OBSERVE, self.context, self.client, self.phase_evaluator, self.manager),
+                    Phase(PhaseType.ORIENT, self.context, self.client, self.phase_evaluator, self.manager),
+                    Phase(PhaseType.DECISION, self.context, self.client, self.phase_evaluator, self.manager),
+                    Phase(PhaseType.ACTION, self.context, self.client, self.phase_evaluator, self.manager)
+                ]
+                
+                for phase, next_phase in zip(phases, phases[1:]):
+                    phase.next_phase = next_phase
+                
+                success = True
+                for index, phase in enumerate(phases):
+                    self.current_phase_index = index
+                    phase_success, self.nb = await phase.aexecute(self.nb)  # 接收更新后的notebook
+                    if not phase_success:
+                        success = False
+                        break
+                
+                # 收集该循环的所有cell内容作为上下文
+                end_cell_index = len(self.nb.cells)
+                self.cell_context = self._collect_cell_context(start_cell_index, end_cell_index)
+                
+                circle_context.update({
+                    'completed': True,
+                    'success': success,
+                    'end_cell_index': end_cell_index,
+                    'cell_context': self.cell_context
+                })
+                self.context.set_circle_context(circle_num + 1, circle_context)
+                
+                if config.ooda.lean_mode and success:
+                    # 精简模式：最后阶段的评估与循环评估合并为一次调用
+                    final_phase = phases[-1]
+                    phase_success, circle_success, evaluate_response = \
+                        await self.circle_evaluator.aevaluate_final_phase_and_circle(
+                            final_phase.phase_type.value,
+                            self.context.get_all(),
+                            final_phase.goal,
+                            self.goal,
+                            self.cell_context
+                        )
+                    if not phase_success:
+                        logger.warning(f"🔄 {final_phase.phase_type.value} 阶段未通过评估")
+                        final_phase.success = False
+                        circle_success = False
+                else:
+                    # 评估循环是否成功 - 使用注入的评估器，并传入goal和context
+                    circle_success, evaluate_response = await self.circle_evaluator.aevaluate_circle_success(
+                        self.context.get_all(),  # 现在包含完整的上下文信息
+                        self.goal,
+                        self.cell_context
+                    )
+                
+                await self.manager.aadd_markdown_cell(self.nb, evaluate_response + "\n---\n## 循环评估结果: " + '成功' if circle_success else '失败')
+                
+                circle_span.set(success=circle_success)
+                if circle_success:
+                    logger.info(f"OODA循环 {circle_num + 1} 执行成功")
+                    self.success = True
+                    self.completed = True
+                    break  # 这里已经正确跳出循环
+                else:
+                    logger.warning(f"🔄 OODA循环 {circle_num + 1} 未完成目标，准备下一循环")
+                    # 更新上下文，为下一循环做准备
+                    self.context.update({
+                        'previous_circle': circle_num + 1,
+                        'circle_feedback': f"第{circle_num + 1}循环未达成目标",
+                        'circle_goal': self.goal,
+                        'circle_context': self.cell_context
+                    })
+            
+            if is_degraded():
+                logger.warning("预算不足，不再开始新的循环")
+                return "预算不足，不再开始新的循环"
+        return None
+
+    
+    def _collect_cell_context(self, start_index: int, end_index: int) -> str:
+        """收集指定范围内的cell内容作为上下文"""
+        context_parts = []
+        for i in range(start_index, min(end_index, len(self.nb.cells))):
+            cell = self.nb.cells[i]
+            if cell.cell_type == 'markdown':
+                context_parts.append(f"Markdown Cell {i}: {cell.source}")
+            elif cell.cell_type == 'code':
+                context_parts.append(f"Code Cell {i}: {cell.source}")
+                # 如果有输出，也包含输出
+                if hasattr(cell, 'outputs') and cell.outputs:
+                    for output in cell.outputs:
+                        if output.output_type == 'stream':
+                            context_parts.append(f"Output: {output.text}")
+                        elif output.output_type == 'execute_result' and 'text/plain' in output.data:
+                            context_parts.append(f"Result: {output.data['text/plain']}")
+        
+        return "\n".join(context_parts)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取循环状态"""
+        return {
+            'mission': self.mission,
+            'goal': self.goal,
+            'completed': self.completed,
+            'success': self.success,
+            'current_circle': self.current_circle,
+            'current_phase': self.current_phase_index,
+            'phase': self.phases[self.current_phase_index].get_status() if self.phases else None,
+            'total_phases': len(self.phases),
+            'retry_count': self.retry_count,
+            'cell_context_length': len(self.cell_context) if self.cell_context else 0
         }
\ No newline at end of file
@@ -1,66 +1,173 @@
-import os
-from dataclasses import dataclass, field
-from typing import Dict, Any
-
-@dataclass
-class NotebookConfig:
-    update_mode: str = "append"
-    notebook_name: str = "ooda_notebook.ipynb"
-    code_cell_tag: str = "agent-code-cell"
-    markdown_cell_tag: str = "agent-markdown-cell"
-    max_cells: int = 300
-    sleep_interval: int = 1
-    export_json: bool = True
-    json_output_file: str = "ooda_notebook_cells.json"
-
-    context_max_cells: int = 10
-    include_code_in_context: bool = True
-    include_markdown_in_context: bool = True
-    include_outputs_in_context: bool = True
-    add_timestamp: bool = True
-
-@dataclass
-class DeepSeekConfig:
-    api_key: str = ""
-    base_url: str = "https://api.deepseek.com"
-    model: str = "deepseek-chat"
-    temperature: float = 0.7
-    max_tokens: int = 4000
-    think_mode: bool = False
-    debug: bool = False
-
-@dataclass
-class AgentConfig:
-    max_retries: int = 3
-    retry_delay: int = 2
-    enable_auto_fix: bool = True
-    enable_execution: bool = True
-    commander_debug: bool = False
-
-@dataclass
-class OODAConfig:
-    max_circles: int = 5
-    max_phase_retries: int = 3
-    max_task_retries: int = 2
-    enable_circle_reflection: bool = True
-    enable_phase_reflection: bool = True
-    enable_task_reflection: bool = True
-
-@dataclass
-class Config:
-    notebook: NotebookConfig = field(default_factory=NotebookConfig)
-    deepseek: DeepSeekConfig = field(default_factory=DeepSeekConfig)
-    agent: AgentConfig = field(default_factory=AgentConfig)
-    ooda: OODAConfig = field(default_factory=OODAConfig)
-    
-    def update_from_dict(self, config_dict: Dict[str, Any]):
-        """从字典更新配置"""
-        for section, values in config_dict.items():
-            if hasattr(self, section):
-                section_obj = getattr(self, section)
-                for key, value in values.items():
-                    if hasattr(section_obj, key):
-                        setattr(section_obj, key, value)
-
-# 全局配置实例
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Any, List
+
+@dataclass
+class NotebookConfig:
+    update_mode: str = "append"
+    notebook_name: str = "ooda_notebook.ipynb"
+    directory: str = "environment"  # notebook所在目录，也是内核的工作目录
+    code_cell_tag: str = "agent-code-cell"
+    markdown_cell_tag: str = "agent-markdown-cell"
+    max_cells: int = 300
+    sleep_interval: int = 1
+    export_json: bool = True
+    json_output_file: str = "ooda_notebook_cells.json"
+
+    context_max_cells: int = 10
+    include_code_in_context: bool = True
+    include_markdown_in_context: bool = True
+    include_outputs_in_context: bool = True
+    add_timestamp: bool = True
+    durability: str = "batch"  # none: 仅在检查点写盘; batch: 后台定时写盘; every-cell: 每次修改都写盘并fsync
+    flush_interval: float = 2.0  # batch模式下后台写盘的间隔（秒）
+    journal: bool = False  # 以追加操作日志代替整体重写notebook
+    journal_compact_every: int = 200  # 追加多少条操作后压缩为完整的notebook文件
+    spill_threshold: int = 65536  # 超过该字节数的文本输出转存到notebook旁的文件，0表示不转存
+    spill_preview_lines: int = 20  # 转存后cell中保留的首尾行数
+    spill_preview_chars: int = 2000  # 首尾预览各自的最大字符数
+    fast_io: bool = True  # 中间读写跳过nbformat校验（安装orjson时用orjson），调试时关闭；关闭notebook和导出时总是校验
+    blob_store: bool = True  # 图片等二进制输出按内容哈希保存到notebook旁的文件，只在导出时还原
+
+@dataclass
+class DeepSeekConfig:
+    api_key: str = ""
+    base_url: str = "https://api.deepseek.com"
+    model: str = "deepseek-chat"
+    temperature: float = 0.7
+    evaluation_temperature: float = 0.0  # 阶段/循环评估使用的温度，低温度使评估结果稳定且可缓存
+    max_tokens: int = 4000
+    think_mode: bool = False
+    stream: bool = False  # 流式生成：边生成边写入notebook，代码块生成完毕即开始执行
+    backend: str = "api"  # api: 调用真实API; replay: 回放API日志中记录的响应
+    replay_log: str = "deepseek_api_log.jsonl"
+    replay_latency_scale: float = 1.0  # 回放时模型延迟的缩放比例，0表示不等待
+    debug: bool = False
+
+@dataclass
+class AgentConfig:
+    max_retries: int = 3
+    retry_delay: int = 2
+    enable_auto_fix: bool = True
+    enable_execution: bool = True
+    commander_debug: bool = False
+
+@dataclass
+class OODAConfig:
+    max_circles: int = 5
+    max_phase_retries: int = 3
+    max_task_retries: int = 2
+    enable_circle_reflection: bool = True
+    enable_phase_reflection: bool = True
+    enable_task_reflection: bool = True
+    lean_mode: bool = False  # 精简模式：每个阶段一次模型调用，最后阶段的评估与循环评估合并
+    speculative_phases: bool = False  # 评估阶段的同时预取下一阶段指挥官任务的模型响应，评估未通过时丢弃
+
+@dataclass
+class ExecutorConfig:
+    backend: str = "kernel"  # kernel: 常驻内核逐cell执行; nbconvert: 每次重新执行整个notebook
+    kernel_name: str = "python3"
+    timeout: int = 600
+    startup_timeout: int = 60
+    enable_snapshots: bool = True  # 任务重试前回滚内核状态和工作目录文件
+    snapshot_max_file_mb: int = 50  # 超过该大小的文件不备份
+    pool_size: int = 1  # 预启动内核数量，0表示不使用内核池
+    kernel_pool_max_uses: int = 5  # 内核被复用的最大次数，超过后替换为新内核；1表示每个任务使用全新内核
+    preload_modules: List[str] = field(default_factory=lambda: [
+        "numpy", "pandas", "matplotlib.pyplot", "networkx"
+    ])
+    preflight: bool = True  # 执行前检查语法、导入模块和未定义名称，不通过时不执行直接返回错误
+
+@dataclass
+class CacheConfig:
+    enabled: bool = True
+    path: str = "llm_cache.sqlite"
+    memory_entries: int = 256  # 内存LRU层保留的响应数
+    max_disk_mb: float = 200  # 磁盘层总大小上限，超过后按最近访问时间淘汰
+    ttl_hours: float = 168  # 磁盘层条目的有效期
+    busy_timeout: float = 5.0  # 其他进程（如批量运行的工作进程）写入时等待数据库锁的秒数
+    max_temperature: float = 0.3  # 只缓存温度不高于该值的请求，高温度的采样结果每次应当不同
+
+@dataclass
+class ApiLogConfig:
+    path: str = "deepseek_api_log.jsonl"
+    queue_size: int = 1000  # 待写入记录的队列上限，写盘跟不上时调用方等待
+    batch_size: int = 64  # 后台线程每次最多合并写入的记录数
+    max_mb: float = 50  # 超过该大小后轮转为新的分段
+    max_segments: int = 0  # 保留的轮转分段数，0表示全部保留
+    compression: str = "gzip"  # 轮转分段的压缩方式: none / gzip / zstd
+    dedup_prompts: bool = False  # 提示词按内容哈希引用，重复的提示词只写一次
+
+@dataclass
+class ContextBudgetConfig:
+    enabled: bool = True
+    encoding: str = "cl100k_base"  # tiktoken编码名，未安装tiktoken时按字符估算
+    min_section_tokens: int = 64  # 截断段落时至少保留的token数，再超出预算则整段丢弃
+    # 各调用点用户提示词的token预算
+    agent_task: int = 6000
+    agent_retry: int = 6000
+    commander_task: int = 4000
+    phase_evaluation: int = 6000
+    circle_evaluation: int = 8000
+
+@dataclass
+class BudgetConfig:
+    max_tokens: int = 0  # 单个任务的token上限（提示词+生成），0表示不限制
+    max_cost: float = 0.0  # 单个任务的估算费用上限，0表示不限制
+    on_exceed: str = "stop"  # stop: 达到上限时停止任务; degrade: 超过degrade_ratio后不再重试、不再开始新循环，达到上限时停止
+    degrade_ratio: float = 0.8
+    # 估算费用使用的单价（每百万token）
+    price_input: float = 0.27
+    price_input_cached: float = 0.07
+    price_output: float = 1.10
+    ledger_path: str = "token_ledger.jsonl"  # 任务结束时追加写入账本，为空则不保存
+
+@dataclass
+class EvaluationConfig:
+    rule_based: bool = False  # 先根据cell的执行结果在本地判定阶段是否成功，无法确定时再调用模型评估
+    trust_clean_execution: bool = False  # 代码全部执行成功且都有输出时直接判定阶段成功
+
+@dataclass
+class TracingConfig:
+    enabled: bool = True
+    dir: str = "traces"  # 每个任务的追踪记录导出为 <notebook名>.trace.json（Chrome trace-event格式）
+
+@dataclass
+class BatchConfig:
+    workers: int = 4  # 批量执行时的工作进程数
+    max_missions_per_worker: int = 0  # 每个工作进程执行多少个任务后替换为新进程（释放内存），0表示不替换
+
+@dataclass
+class ServiceConfig:
+    host: str = "127.0.0.1"  # HTTP服务监听地址
+    port: int = 8765
+    workers: int = 2  # 同时执行的任务数
+    db_path: str = "agentnote_jobs.sqlite"  # 持久化任务队列
+
+@dataclass
+class Config:
+    notebook: NotebookConfig = field(default_factory=NotebookConfig)
+    deepseek: DeepSeekConfig = field(default_factory=DeepSeekConfig)
+    agent: AgentConfig = field(default_factory=AgentConfig)
+    ooda: OODAConfig = field(default_factory=OODAConfig)
+    executor: ExecutorConfig = field(default_factory=ExecutorConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    api_log: ApiLogConfig = field(default_factory=ApiLogConfig)
+    context_budget: ContextBudgetConfig = field(default_factory=ContextBudgetConfig)
+    budget: BudgetConfig = field(default_factory=BudgetConfig)
+    evaluation: EvaluationConfig = field(default_factory=EvaluationConfig)
+    tracing: TracingConfig = field(default_factory=TracingConfig)
+    batch: BatchConfig = field(default_factory=BatchConfig)
+    service: ServiceConfig = field(default_factory=ServiceConfig)
+    
+    def update_from_dict(self, config_dict: Dict[str, Any]):
+        """从字典更新配置"""
+        for section, values in config_dict.items():
+            if hasattr(self, section):
+                section_obj = getattr(self, section)
+                for key, value in values.items():
+                    if hasattr(section_obj, key):
+                        setattr(section_obj, key, value)
+
+# 全局配置实例
 config = Config()
\ No newline at end of file
@@ -1,66 +1,399 @@
-import re
-import ast
-from typing import Tuple, Optional
-
-class ContentParser:
-    """内容解析器 - 专门处理Python代码和Markdown的分离"""
-    
-    @staticmethod
-    def extract_python_code(content: str) -> Tuple[Optional[str], str]:
-        """
-        从内容中提取Python代码
-        
-        Args:
-            content: DeepSeek返回的内容字符串
-            
-        Returns:
-            tuple: (python_code, markdown_content)
-                   python_code: 提取的Python代码，如果没有则为None
-                   markdown_content: 去除Python代码后的Markdown内容
-        """
-        if not content:
-            return None, ""
-        
-        # 定义Python代码块的正则表达式模式
-        code_block_pattern = r'```(?:python)?\s*(.*?)\s*```'
-        
-        # 查找所有代码块
-        code_blocks = re.findall(code_block_pattern, content, re.DOTALL)
-        
-        # 提取Python代码（只取第一个Python代码块）
-        python_code = None
-        if code_blocks:
-            python_code = code_blocks[0].strip()
-        
-        # 从原始内容中移除代码块，得到Markdown内容
-        markdown_content = re.sub(code_block_pattern, '', content, flags=re.DOTALL).strip()
-        
-        # 清理Markdown内容中的多余空行
-        markdown_content = re.sub(r'\n\s*\n', '\n\n', markdown_content)
-        
-        return python_code, markdown_content
-    
-    @staticmethod
-    def validate_python_code(code: str) -> Tuple[bool, str]:
-        """验证Python代码的语法"""
-        if not code:
-            return False, "代码为空"
-        
-        # 尝试编译代码来检查语法
-        compile(code, '<string>', 'exec')
-        return True, "代码语法正确"
-    
-    @staticmethod
-    def extract_imports(code: str) -> list:
-        """提取代码中的导入语句"""
-        if not code:
-            return []
-        
-        tree = ast.parse(code)
-        imports = []
-        
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.Import, ast.ImportFrom)):
-                imports.append(ast.unparse(node))
-        
-        return imports
\ No newline at end of file
+import re
+import ast
+import json
+import builtins
+from typing import Tuple, Optional, Set, List, Dict, Any
+
+class ContentParser:
+    """内容解析器 - 专门处理Python代码和Markdown的分离"""
+    
+    @staticmethod
+    def extract_python_code(content: str) -> Tuple[Optional[str], str]:
+        """
+        从内容中提取Python代码
+        
+        Args:
+            content: DeepSeek返回的内容字符串
+            
+        Returns:
+            tuple: (python_code, markdown_content)
+                   python_code: 提取的Python代码，如果没有则为None
+                   markdown_content: 去除Python代码后的Markdown内容
+        """
+        if not content:
+            return None, ""
+        
+        # 定义Python代码块的正则表达式模式
+        code_block_pattern = r'```(?:python)?\s*(.*?)\s*```'
+        
+        # 查找所有代码块
+        code_blocks = re.findall(code_block_pattern, content, re.DOTALL)
+        
+        # 提取Python代码（只取第一个Python代码块）
+        python_code = None
+        if code_blocks:
+            python_code = code_blocks[0].strip()
+        
+        # 从原始内容中移除代码块，得到Markdown内容
+        markdown_content = re.sub(code_block_pattern, '', content, flags=re.DOTALL)
+        
+        return python_code, ContentParser.clean_markdown(markdown_content)
+    
+    @staticmethod
+    def clean_markdown(markdown_content: str) -> str:
+        """去除首尾空白并清理Markdown内容中的多余空行"""
+        return re.sub(r'\n\s*\n', '\n\n', markdown_content.strip())
+    
+    @staticmethod
+    def parse_lean_response(content: str) -> Dict[str, Any]:
+        """
+        解析精简模式的结构化响应
+        
+        响应应为一个JSON对象，包含 task、markdown、code 和 assessment 字段；
+        允许外层包裹```json代码块或夹带说明文字。
+        
+        Returns:
+            dict: task/markdown/code 为字符串，assessment 为 {'complete': bool, 'reason': str}
+        
+        Raises:
+            ValueError: 响应中没有合法的JSON对象
+        """
+        if not content:
+            raise ValueError("精简模式响应为空")
+        text = content.strip()
+        fenced = re.search(r'```(?:json)?\s*(\{.*\})\s*```', text, re.DOTALL)
+        if fenced:
+            text = fenced.group(1)
+        elif not text.startswith('{'):
+            start, end = text.find('{'), text.rfind('}')
+            if start == -1 or end <= start:
+                raise ValueError("精简模式响应中没有JSON对象")
+            text = text[start:end + 1]
+        try:
+            # 模型常在字符串中直接输出换行，允许控制字符
+            data = json.loads(text, strict=False)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"精简模式响应不是合法的JSON: {e}") from e
+        if not isinstance(data, dict):
+            raise ValueError("精简模式响应不是JSON对象")
+        
+        assessment = data.get('assessment')
+        if not isinstance(assessment, dict):
+            # 缺少自我评估时按未完成处理
+            assessment = {'complete': False, 'reason': str(assessment or '响应中缺少自我评估')}
+        complete = assessment.get('complete')
+        if isinstance(complete, str):
+            complete = complete.strip().lower() in ('true', 'yes', '是', '完成')
+        
+        def text_field(name: str) -> str:
+            value = data.get(name)
+            return value.strip() if isinstance(value, str) else ""
+        
+        code = text_field('code')
+        if '```' in code:
+            # 模型有时仍会把代码包在代码块中
+            code = ContentParser.extract_python_code(code)[0] or ""
+        
+        return {
+            'task': text_field('task'),
+            'markdown': ContentParser.clean_markdown(text_field('markdown')),
+            'code': code,
+            'assessment': {'complete': bool(complete), 'reason': str(assessment.get('reason', ''))},
+        }
+    
+    @staticmethod
+    def validate_python_code(code: str) -> Tuple[bool, str]:
+        """验证Python代码的语法"""
+        if not code:
+            return False, "代码为空"
+        
+        # 尝试编译代码来检查语法
+        compile(code, '<string>', 'exec')
+        return True, "代码语法正确"
+    
+    @staticmethod
+    def extract_imports(code: str) -> list:
+        """提取代码中的导入语句"""
+        if not code:
+            return []
+        
+        tree = ast.parse(code)
+        imports = []
+        
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                imports.append(ast.unparse(node))
+        
+        return imports
+    
+    @staticmethod
+    def analyze_names(code: str) -> Tuple[Set[str], Set[str]]:
+        """
+        分析代码在全局命名空间中定义和使用的名称
+        
+        Args:
+            code: Python代码
+            
+        Returns:
+            tuple: (defines, uses)
+                   defines: 该代码定义或修改的全局名称（赋值、import、def/class、属性/下标赋值）
+                   uses: 该代码读取的、在读取前未由自身定义的全局名称（不含内置名称）
+        
+        Raises:
+            SyntaxError: 代码无法解析（例如包含IPython魔法命令）
+        """
+        tree = ast.parse(code)
+        visitor = _NameVisitor()
+        for stmt in tree.body:
+            visitor.visit(stmt)
+        uses = {name for name in visitor.uses if not hasattr(builtins, name)}
+        return visitor.defines, uses
+
+    @staticmethod
+    def preflight_targets(code: str) -> Tuple[List[str], List[str]]:
+        """
+        提取执行前需要在内核中检查的模块和名称
+        
+        Args:
+            code: Python代码
+            
+        Returns:
+            tuple: (modules, names)
+                   modules: 绝对导入的顶层模块名
+                   names: 在函数体外读取、且在整段代码中都没有绑定的名称（不含内置名称）；
+                          代码包含 from x import * 时无法判断，返回空列表
+        
+        Raises:
+            SyntaxError: 代码无法解析
+        """
+        tree = ast.parse(code)
+        modules, bound, loads = [], set(), set()
+        star_import = False
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level == 0 and node.module:
+                    modules.append(node.module.split('.')[0])
+                star_import = star_import or any(alias.name == '*' for alias in node.names)
+            bound.update(_bound_names(node))
+        _collect_eager_loads(tree, loads)
+        names = [] if star_import else sorted(
+            name for name in loads - bound if not hasattr(builtins, name))
+        return list(dict.fromkeys(modules)), names
+
+
+class StreamingContentParser:
+    """
+    流式内容解析器 - extract_python_code 的增量版本
+    
+    逐段输入模型的增量输出，代码块闭合时立即产出代码，Markdown按段落产出。
+    与 extract_python_code 一致：只有第一个代码块作为代码，其余代码块被丢弃，
+    未闭合的代码块按Markdown处理。
+    """
+    
+    FENCE = '```'
+    
+    def __init__(self):
+        self._buffer = ""
+        self._in_code = False
+        self._code_seen = False
+    
+    def feed(self, delta: str) -> List[Tuple[str, str]]:
+        """
+        输入一段增量文本
+        
+        Returns:
+            list: [(kind, text)]，kind 为 'markdown'（Markdown片段）或 'code'（完整的代码块）
+        """
+        self._buffer += delta
+        events = []
+        while True:
+            index = self._buffer.find(self.FENCE)
+            if not self._in_code:
+                if index == -1:
+                    # 只产出到最后一个段落边界，未完成的段落可能是代码块的开头
+                    boundary = self._buffer.rfind('\n\n')
+                    if boundary > 0:
+                        events.append(('markdown', self._buffer[:boundary]))
+                        self._buffer = self._buffer[boundary:]
+                    break
+                if index > 0:
+                    events.append(('markdown', self._buffer[:index]))
+                self._buffer = self._buffer[index + len(self.FENCE):]
+                self._in_code = True
+            else:
+                if index == -1:
+                    break
+                body = self._buffer[:index]
+                self._buffer = self._buffer[index + len(self.FENCE):]
+                self._in_code = False
+                code = re.sub(r'^(?:python)?\s*', '', body).strip()
+                if not self._code_seen and code:
+                    events.append(('code', code))
+                self._code_seen = True
+        return events
+    
+    def finish(self) -> List[Tuple[str, str]]:
+        """输入结束，产出剩余内容"""
+        rest = self.FENCE + self._buffer if self._in_code else self._buffer
+        self._buffer = ""
+        self._in_code = False
+        return [('markdown', rest)] if rest else []
+
+
+class _NameVisitor(ast.NodeVisitor):
+    """按语句顺序收集顶层命名空间的定义与使用"""
+    
+    def __init__(self):
+        self.defines = set()
+        self.uses = set()
+    
+    def _load(self, name: str):
+        if name not in self.defines:
+            self.uses.add(name)
+    
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self._load(node.id)
+        else:
+            self.defines.add(node.id)
+    
+    def visit_Assign(self, node):
+        # 先访问右值，保证 x = x + 1 中的 x 记为使用
+        self.visit(node.value)
+        for target in node.targets:
+            self.visit(target)
+    
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        self.visit(node.target)
+    
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        base = _base_name(node.target)
+        if base:
+            self._load(base)
+            self.defines.add(base)
+    
+    def visit_Attribute(self, node):
+        # df.x = ... 视为对 df 的修改
+        base = _base_name(node)
+        if isinstance(node.ctx, ast.Store) and base:
+            self._load(base)
+            self.defines.add(base)
+        else:
+            self.generic_visit(node)
+    
+    def visit_Subscript(self, node):
+        # df['a'] = ... 视为对 df 的修改
+        base = _base_name(node)
+        if isinstance(node.ctx, (ast.Store, ast.Del)) and base:
+            self._load(base)
+            self.defines.add(base)
+            self.visit(node.slice)
+        else:
+            self.generic_visit(node)
+    
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.defines.add(alias.asname or alias.name.split('.')[0])
+    
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name != '*':
+                self.defines.add(alias.asname or alias.name)
+    
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.visit(node.target)
+        for stmt in node.body + node.orelse:
+            self.visit(stmt)
+    
+    def _visit_scope(self, node, args=None):
+        """函数/类/lambda/推导式内部：自由变量记为使用，局部名称不外泄"""
+        inner = _NameVisitor()
+        if args is not None:
+            for arg in args.posonlyargs + args.args + args.kwonlyargs:
+                inner.defines.add(arg.arg)
+            for arg in (args.vararg, args.kwarg):
+                if arg is not None:
+                    inner.defines.add(arg.arg)
+        body = node.body if isinstance(node.body, list) else [node.body]
+        for stmt in body:
+            inner.visit(stmt)
+        for name in inner.uses:
+            self._load(name)
+    
+    def visit_FunctionDef(self, node):
+        for expr in node.decorator_list + node.args.defaults + node.args.kw_defaults:
+            if expr is not None:
+                self.visit(expr)
+        self.defines.add(node.name)
+        self._visit_scope(node, node.args)
+    
+    visit_AsyncFunctionDef = visit_FunctionDef
+    
+    def visit_ClassDef(self, node):
+        for expr in node.decorator_list + node.bases:
+            self.visit(expr)
+        self.defines.add(node.name)
+        self._visit_scope(node)
+    
+    def visit_Lambda(self, node):
+        self._visit_scope(node, node.args)
+    
+    def _visit_comprehension(self, node):
+        inner = _NameVisitor()
+        for generator in node.generators:
+            inner.visit(generator.iter)
+            inner.visit(generator.target)
+            for cond in generator.ifs:
+                inner.visit(cond)
+        for attr in ('elt', 'key', 'value'):
+            if hasattr(node, attr):
+                inner.visit(getattr(node, attr))
+        for name in inner.uses:
+            self._load(name)
+    
+    visit_ListComp = visit_SetComp = visit_GeneratorExp = visit_DictComp = _visit_comprehension
+
+
+def _bound_names(node) -> List[str]:
+    """节点在任意作用域中绑定的名称"""
+    if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+        return [node.id]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, ast.arg):
+        return [node.arg]
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return [alias.asname or alias.name.split('.')[0] for alias in node.names if alias.name != '*']
+    if isinstance(node, (ast.Global, ast.Nonlocal)):
+        return list(node.names)
+    name = getattr(node, 'name', None) or getattr(node, 'rest', None)
+    # except ... as e / match语句中的捕获名称
+    if isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar, ast.MatchMapping)) and name:
+        return [name]
+    return []
+
+
+def _collect_eager_loads(node, loads: Set[str]):
+    """收集定义时就会求值的名称读取，函数和lambda的函数体在调用时才执行，不计入"""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        for expr in node.args.defaults + node.args.kw_defaults + getattr(node, 'decorator_list', []):
+            if expr is not None:
+                _collect_eager_loads(expr, loads)
+        return
+    if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+        loads.add(node.id)
+    for child in ast.iter_child_nodes(node):
+        _collect_eager_loads(child, loads)
+
+
+def _base_name(node) -> Optional[str]:
+    """获取 a.b[c].d 形式表达式最左侧的名称"""
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
@@ -0,0 +1,200 @@
+import threading
+from typing import Dict, Any, List, Tuple, Optional, Iterable
+from .config import config
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = get_logger('ContextBudget')
+
+REQUIRED = 100  # 优先级达到该值的段落不会被整段丢弃
+
+# 各段落的优先级（越小越先被截断/丢弃）和截断时保留的一端。
+# 错误、cell内容等按时间追加的段落保留末尾（最近的内容），其余保留开头。
+SECTION_RULES: Dict[str, Tuple[int, str]] = {
+    'mission': (REQUIRED, 'head'),
+    'retry_attempt': (90, 'head'),
+    'last_error_type': (90, 'head'),
+    'last_error_details': (85, 'tail'),
+    'error_history': (80, 'tail'),
+    'previous_errors': (80, 'tail'),
+    'previous_code': (75, 'head'),
+    'previous_generated_code': (75, 'head'),
+    'cell_context': (70, 'tail'),
+    'circle_goal': (65, 'head'),
+    'circle_feedback': (65, 'head'),
+    'previous_circle': (65, 'head'),
+    'recent_errors': (60, 'tail'),
+    'total_errors': (50, 'head'),
+    'error_context': (40, 'tail'),
+    'circle_context': (30, 'tail'),
+    'previous_outputs_count': (20, 'head'),
+}
+DEFAULT_RULE = (50, 'head')
+
+TRUNCATED_MARK = "...[已截断]"
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or 0x3000 <= code <= 0x303F
+            or 0xFF00 <= code <= 0xFFEF)
+
+
+class ContextBudgeter:
+    """
+    上下文预算器 - 用本地分词器统计token数，按调用点的预算裁剪提示词中的上下文
+
+    每个模板字段和上下文中的每个键都是一个段落。超出预算时按优先级从低到高先把非必需段落
+    截断到最小保留长度，仍然超出则整段丢弃，最后才截断必需段落（如任务描述）；
+    结果只取决于输入内容，相同输入总是得到相同的提示词。
+    未安装tiktoken时按字符估算：中日韩字符每个计1个token，其余每4个字符计1个token。
+    """
+
+    def __init__(self, encoding: str = "cl100k_base", min_section_tokens: int = 64):
+        self.min_section_tokens = min_section_tokens
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning(f"加载分词器 {encoding} 失败，改用字符估算: {e}")
+
+    def count_tokens(self, text: str) -> int:
+        """统计文本的token数"""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        cjk = sum(1 for ch in text if _is_cjk(ch))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int, keep: str = 'head') -> str:
+        """把文本截断到不超过max_tokens，keep指定保留开头（head）还是末尾（tail）"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        budget = max_tokens - self.count_tokens(TRUNCATED_MARK)
+        if budget <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            kept = self._encoding.decode(tokens[:budget] if keep == 'head' else tokens[-budget:])
+        else:
+            # 二分查找不超过预算的最长前缀/后缀
+            lo, hi = 0, len(text)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                part = text[:mid] if keep == 'head' else text[-mid:]
+                if self.count_tokens(part) <= budget:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            kept = text[:lo] if keep == 'head' else text[len(text) - lo:]
+        return kept + TRUNCATED_MARK if keep == 'head' else TRUNCATED_MARK + kept
+
+    @staticmethod
+    def render_value(value: Any) -> str:
+        """把上下文中的值转换为提示词文本"""
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (list, tuple)):
+            return "\n".join(f"- {item}" for item in value) if value else "无"
+        return str(value)
+
+    def fit(self, budget: int, sections: Dict[str, str], context: Optional[Dict[str, Any]] = None,
+            exclude: Iterable[str] = ()) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+        """
+        把模板字段和上下文裁剪到预算内
+
+        返回裁剪后的字段（上下文渲染为 'context' 字段）和被裁剪段落的报告。
+        exclude 中的上下文键已作为单独字段出现在提示词中，不再重复放入上下文。
+        """
+        exclude = set(exclude)
+        entries = []  # [名称, 规则键, 标签, 文本]，截断时保留标签
+        for name, text in sections.items():
+            entries.append([name, name, "", text or ""])
+        if context is not None:
+            for key, value in context.items():
+                if key in exclude:
+                    continue
+                entries.append([f"context.{key}", key, f"{key}: ", self.render_value(value)])
+
+        tokens = {entry[0]: self.count_tokens(entry[2] + entry[3]) for entry in entries}
+        over = sum(tokens.values()) - budget
+        cuts = []
+
+        if over > 0:
+            order = sorted(entries, key=lambda e: (SECTION_RULES.get(e[1], DEFAULT_RULE)[0], e[0]))
+
+            # 1. 按优先级从低到高把非必需段落截断到最小保留长度
+            for entry in order:
+                if over <= 0:
+                    break
+                if SECTION_RULES.get(entry[1], DEFAULT_RULE)[0] >= REQUIRED:
+                    continue
+                over = self._shrink(entry, tokens, over, self.min_section_tokens, cuts)
+
+            # 2. 整段丢弃非必需的段落
+            for entry in order:
+                if over <= 0:
+                    break
+                if SECTION_RULES.get(entry[1], DEFAULT_RULE)[0] >= REQUIRED or not tokens[entry[0]]:
+                    continue
+                over -= tokens[entry[0]]
+                self._record(cuts, entry[0], 'dropped', tokens[entry[0]], 0)
+                entry[2] = entry[3] = ""
+                tokens[entry[0]] = 0
+
+            # 3. 仍然超出时继续截断必需段落
+            for entry in order:
+                if over <= 0:
+                    break
+                over = self._shrink(entry, tokens, over, 0, cuts)
+
+        fitted = {name: text for name, _, _, text in entries if not name.startswith("context.")}
+        if context is not None:
+            fitted['context'] = "\n".join(label + text for name, _, label, text in entries
+                                          if name.startswith("context.") and label) or "无"
+        if cuts:
+            metrics.count('context_tokens_cut', sum(cut['tokens'] - cut['kept'] for cut in cuts))
+        return fitted, cuts
+
+    def _shrink(self, entry: list, tokens: Dict[str, int], over: int, floor: int, cuts: List[Dict[str, Any]]) -> int:
+        name, key, label, text = entry
+        current = tokens[name]
+        target = max(floor, current - over)
+        if target >= current:
+            return over
+        entry[3] = self.truncate(text, max(target - self.count_tokens(label), 0), SECTION_RULES.get(key, DEFAULT_RULE)[1])
+        tokens[name] = self.count_tokens(label + entry[3])
+        self._record(cuts, name, 'truncated', current, tokens[name])
+        return over - (current - tokens[name])
+
+    @staticmethod
+    def _record(cuts: List[Dict[str, Any]], name: str, action: str, before: int, after: int):
+        """记录裁剪，同一段落多次裁剪时合并为一条"""
+        for cut in cuts:
+            if cut['section'] == name:
+                cut['action'] = action
+                cut['kept'] = after
+                return
+        cuts.append({'section': name, 'action': action, 'tokens': before, 'kept': after})
+
+
+_budgeter = None
+_budgeter_lock = threading.Lock()
+
+def get_context_budgeter() -> Optional[ContextBudgeter]:
+    """获取进程级共享的上下文预算器（未启用时返回None）"""
+    global _budgeter
+    if not config.context_budget.enabled:
+        return None
+    with _budgeter_lock:
+        if _budgeter is None:
+            _budgeter = ContextBudgeter(config.context_budget.encoding,
+                                        config.context_budget.min_section_tokens)
+        return _budgeter
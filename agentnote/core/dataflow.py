@@ -0,0 +1,79 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Optional
+from .content_parser import ContentParser
+
+@dataclass
+class CellNode:
+    """依赖图中的一个代码cell"""
+    index: int
+    defines: Set[str] = field(default_factory=set)
+    uses: Set[str] = field(default_factory=set)
+    opaque: bool = False  # 无法静态分析（语法错误、魔法命令），保守地视为依赖并影响一切
+
+class CellDependencyGraph:
+    """代码cell的数据流依赖图 - 记录每个cell定义和使用的全局名称"""
+
+    def __init__(self):
+        self.nodes: Dict[int, CellNode] = {}
+        self._analysis_cache: Dict[str, tuple] = {}
+
+    def build(self, nb) -> 'CellDependencyGraph':
+        """根据notebook中的代码cell重建依赖图（同源码的分析结果会被缓存）"""
+        self.nodes = {}
+        for i, cell in enumerate(nb.cells):
+            # 被回滚的cell不再属于内核状态的来源
+            if cell.cell_type == 'code' and not cell.metadata.get('agentnote', {}).get('rolled_back'):
+                self.nodes[i] = self._analyze(i, cell.source)
+        return self
+
+    def _analyze(self, index: int, source: str) -> CellNode:
+        """分析单个cell，按源码哈希缓存"""
+        key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        if key not in self._analysis_cache:
+            try:
+                defines, uses = ContentParser.analyze_names(source)
+                self._analysis_cache[key] = (defines, uses, False)
+            except SyntaxError:
+                self._analysis_cache[key] = (set(), set(), True)
+        defines, uses, opaque = self._analysis_cache[key]
+        return CellNode(index, set(defines), set(uses), opaque)
+
+    def downstream(self, index: int, old_defines: Optional[Set[str]] = None) -> List[int]:
+        """
+        获取某个cell变化后需要重新执行的cell（包含自身），按执行顺序返回
+
+        Args:
+            index: 发生变化的cell索引
+            old_defines: 变化前该cell定义的名称，用于覆盖编辑后不再定义的名称
+        """
+        node = self.nodes.get(index)
+        if node is None:
+            return []
+
+        affected = [index]
+        # 当前值受影响的名称；被未受影响的cell重新定义后不再受影响
+        dirty = set(node.defines) | set(old_defines or ())
+        for i in sorted(k for k in self.nodes if k > index):
+            other = self.nodes[i]
+            if other.opaque or node.opaque or other.uses & dirty:
+                affected.append(i)
+                dirty |= other.defines
+            else:
+                dirty -= other.defines
+        return affected
+
+    def upstream(self, index: int) -> List[int]:
+        """获取执行某个cell前需要先执行的cell（不含自身），按执行顺序返回"""
+        node = self.nodes.get(index)
+        if node is None:
+            return []
+
+        needed = set(node.uses)
+        required = []
+        for i in sorted((k for k in self.nodes if k < index), reverse=True):
+            other = self.nodes[i]
+            if other.opaque or node.opaque or other.defines & needed:
+                required.append(i)
+                needed = (needed - other.defines) | other.uses
+        return sorted(required)
@@ -1,93 +1,367 @@
-import time
-import json
-from datetime import datetime
-from openai import OpenAI
-from .config import config
-from ..utils.setup_logger import get_logger
-
-logger = get_logger('DeepseekClient', debug=True)
-
-class DeepSeekClient:
-    """DeepSeek API客户端"""
-    
-    def __init__(self, api_key=None, enable_thinking=False):
-        self.api_key = api_key or config.deepseek.api_key
-        if not self.api_key:
-            raise ValueError("DeepSeek API密钥未提供")
-        
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=config.deepseek.base_url
-        )
-        if enable_thinking:
-            logger.debug('已启用思考模型')
-        self.enable_thinking = enable_thinking
-        # 初始化日志
-        self.log_file = "deepseek_api_log.jsonl"
-
-    def _log_api_call(self, request_data, response_data, error=None):
-        """记录API调用到日志文件"""
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "request": request_data,
-            "response": response_data,
-            "error": error
-        }
-        
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-
-    def generate_content(self, system_prompt, user_prompt, model=None, temperature=None):
-        """生成内容"""
-        model = model or config.deepseek.model
-        temperature = temperature or config.deepseek.temperature
-        
-        # 准备请求数据用于日志记录
-        request_data = {
-            "model": model,
-            "system_prompt": system_prompt,
-            "user_prompt": user_prompt,
-            "temperature": temperature,
-        }
-        
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=temperature,
-            stream=False,
-            extra_body={"thinking": {"type": "enabled"}} if self.enable_thinking else None
-        )
-        
-        response_content = response.choices[0].message.content
-        if self.enable_thinking:
-            reasoning_content = response.choices[0].message.reasoning_content # type: ignore
-        else:
-            reasoning_content = None
-        
-        # 记录成功的API调用
-        response_data = {
-            "content": response_content,
-            'think': reasoning_content,
-            "model": response.model,
-            "usage": {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens
-            } if response.usage else None
-        }
-        
-        self._log_api_call(request_data, response_data)
-        return response_content
-
-    def generate_with_retry(self, system_prompt, user_prompt, max_retries=3):
-        """带重试的内容生成"""
-        for attempt in range(max_retries):
-            content = self.generate_content(system_prompt, user_prompt)
-            if content:
-                return content
-            logger.error(f"生成失败，第 {attempt + 1} 次重试...")
-            time.sleep(2)
+import time
+import asyncio
+import weakref
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from openai import OpenAI, AsyncOpenAI
+from .config import config
+from .llm_cache import LLMCache, get_llm_cache
+from .metrics import metrics
+from .api_log import get_api_log_writer
+from .ledger import current_ledger, record_usage, normalize_usage
+from .context_budget import get_context_budgeter
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('DeepseekClient', debug=True)
+
+class DeepSeekClient:
+    """DeepSeek API客户端"""
+    
+    def __init__(self, api_key=None, enable_thinking=False):
+        self.api_key = api_key or config.deepseek.api_key
+        if not self.api_key:
+            raise ValueError("DeepSeek API密钥未提供")
+        
+        self.client = OpenAI(
+            api_key=self.api_key,
+            base_url=config.deepseek.base_url
+        )
+        self.cache = get_llm_cache()
+        self._init_request_state()
+        if enable_thinking:
+            logger.debug('已启用思考模型')
+        self.enable_thinking = enable_thinking
+        # 初始化日志
+        self.log_file = config.api_log.path
+
+    def _init_request_state(self):
+        """初始化请求合并、预取和异步客户端的状态（子类不调用基类构造时也需要调用）"""
+        # 异步客户端的连接池绑定事件循环，每个事件循环各自创建
+        self._async_clients = weakref.WeakKeyDictionary()
+        # 进行中的可缓存请求，相同的并发请求合并为一次上游调用
+        self._inflight: dict = {}
+        self._inflight_lock = threading.Lock()
+        # 推测执行时提前发起的请求（预取键 -> asyncio任务），只在事件循环线程中访问
+        self._prefetched: dict = {}
+
+    def _log_api_call(self, request_data, response_data, error=None):
+        """记录API调用到日志文件（由后台线程批量写入，不阻塞调用方）"""
+        log_entry = {
+            "timestamp": datetime.now().isoformat(),
+            "request": request_data,
+            "response": response_data,
+            "error": error
+        }
+        get_api_log_writer(self.log_file).write(log_entry)
+
+    def _build_request(self, system_prompt, user_prompt, model, temperature, stream=False):
+        """构建请求参数"""
+        model = model or config.deepseek.model
+        temperature = config.deepseek.temperature if temperature is None else temperature
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": temperature,
+            "stream": stream,
+            "extra_body": {"thinking": {"type": "enabled"}} if self.enable_thinking else None
+        }
+        if stream:
+            # 流式响应的最后一个数据块携带用量统计
+            request["stream_options"] = {"include_usage": True}
+        return request
+
+    def _handle_response(self, request, response, latency):
+        """提取响应内容并记录API调用"""
+        response_content = response.choices[0].message.content
+        if self.enable_thinking:
+            reasoning_content = response.choices[0].message.reasoning_content # type: ignore
+        else:
+            reasoning_content = None
+        
+        record_usage(response.usage)
+        self._log_completion(request, response_content, reasoning_content, response.model, response.usage, latency)
+        return response_content
+
+    def _log_completion(self, request, response_content, reasoning_content, model, usage, latency, first_token_latency=None):
+        """记录一次完整的API调用（延迟用于回放时还原模型耗时）"""
+        # 准备请求数据用于日志记录
+        request_data = {
+            "model": request["model"],
+            "system_prompt": request["messages"][0]["content"],
+            "user_prompt": request["messages"][1]["content"],
+            "temperature": request["temperature"],
+        }
+        
+        # 记录成功的API调用
+        response_data = {
+            "content": response_content,
+            'think': reasoning_content,
+            "model": model,
+            "usage": {
+                **normalize_usage(usage),
+                "total_tokens": usage.total_tokens
+            } if usage else None,
+            "latency": round(latency, 3)
+        }
+        if first_token_latency is not None:
+            response_data["first_token_latency"] = round(first_token_latency, 3)
+        
+        self._log_api_call(request_data, response_data)
+
+    def _check_budget(self, request):
+        """请求上游前检查当前任务的预算，超出时抛出 BudgetExceeded"""
+        ledger = current_ledger()
+        if ledger is None:
+            return
+        ledger.check(self._estimate_prompt_tokens(request))
+
+    @staticmethod
+    def _estimate_prompt_tokens(request) -> int:
+        budgeter = get_context_budgeter()
+        return sum(budgeter.count_tokens(m["content"]) for m in request["messages"]) if budgeter else 0
+
+    def _record_reused(self, request):
+        """缓存命中或复用其他调用方的响应时，按全部命中缓存的提示词记入当前任务的账本"""
+        if current_ledger() is None:
+            return
+        tokens = self._estimate_prompt_tokens(request)
+        record_usage({'prompt_tokens': tokens, 'cached_tokens': tokens, 'completion_tokens': 0})
+
+    def _cache_key(self, request):
+        """可缓存请求的缓存键；温度过高的请求不缓存，返回None"""
+        if self.cache is None or request["temperature"] > config.cache.max_temperature:
+            return None
+        messages = request["messages"]
+        return LLMCache.make_key(request["model"], messages[0]["content"], messages[1]["content"],
+                                 request["temperature"], self.enable_thinking)
+
+    def _join_inflight(self, key):
+        """
+        登记进行中的请求，返回 (future, 是否由调用方负责请求上游)
+
+        进行中的请求可能属于其他任务，future只传递成功的响应：负责请求的调用方失败、
+        被取消或超出自己的预算时结果为None，等待的调用方自行重新请求
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _finish_inflight(self, key, future, content=None):
+        """完成进行中的请求，写入缓存并唤醒等待相同请求的调用方（失败时content为None）"""
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        try:
+            if content:
+                self.cache.put(key, content)
+        finally:
+            future.set_result(content or None)
+
+    def _prefetch_key(self, request):
+        messages = request["messages"]
+        return LLMCache.make_key(request["model"], messages[0]["content"], messages[1]["content"],
+                                 request["temperature"], self.enable_thinking)
+
+    def prefetch(self, system_prompt, user_prompt, model=None, temperature=None, context=None) -> str:
+        """
+        推测执行：在事件循环中提前发起请求，返回预取键
+
+        之后提示词完全相同的 agenerate_content / astream 调用直接使用预取的响应；
+        推测不成立时调用 discard_prefetch 丢弃。context 为运行请求的上下文
+        （决定用量记入账本的哪一级），默认为当前上下文。
+        """
+        request = self._build_request(system_prompt, user_prompt, model, temperature)
+        key = self._prefetch_key(request)
+        if key not in self._prefetched:
+            coro, name = self._arequest_content(request), f"prefetch-{key[:8]}"
+            # create_task复制调用时的上下文，在context中创建即可让任务使用context
+            task = (context.run(asyncio.create_task, coro, name=name) if context is not None
+                    else asyncio.create_task(coro, name=name))
+            # 被丢弃的预取失败时不需要处理，取出异常避免事件循环报告未处理的异常
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._prefetched[key] = task
+        return key
+
+    def discard_prefetch(self, key):
+        """丢弃未被使用的预取请求，仍在进行中的请求被取消"""
+        task = self._prefetched.pop(key, None)
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        metrics.count('prefetch_discarded')
+
+    def _take_prefetched(self, request):
+        """取出与请求的提示词完全相同的预取任务"""
+        if not self._prefetched:
+            return None
+        task = self._prefetched.pop(self._prefetch_key(request), None)
+        if task is not None:
+            metrics.count('prefetch_hits')
+        return task
+
+    def generate_content(self, system_prompt, user_prompt, model=None, temperature=None):
+        """生成内容"""
+        request = self._build_request(system_prompt, user_prompt, model, temperature)
+        key = self._cache_key(request)
+        if key is None:
+            return self._request_content(request)
+        
+        while True:
+            content = self.cache.get(key)
+            if content is not None:
+                self._record_reused(request)
+                return content
+            future, owner = self._join_inflight(key)
+            if owner:
+                break
+            content = future.result()
+            if content is not None:
+                self._record_reused(request)
+                return content
+        try:
+            content = self._request_content(request)
+        except BaseException:
+            self._finish_inflight(key, future)
+            raise
+        self._finish_inflight(key, future, content)
+        return content
+
+    def _request_content(self, request):
+        self._check_budget(request)
+        start = time.perf_counter()
+        with metrics.timer('llm', model=request["model"], temperature=request["temperature"]) as span:
+            response = self.client.chat.completions.create(**request)
+            span.set(**normalize_usage(response.usage))
+        return self._handle_response(request, response, time.perf_counter() - start)
+
+    async def agenerate_content(self, system_prompt, user_prompt, model=None, temperature=None):
+        """异步生成内容"""
+        request = self._build_request(system_prompt, user_prompt, model, temperature)
+        prefetched = self._take_prefetched(request)
+        if prefetched is not None:
+            return await prefetched
+        key = self._cache_key(request)
+        if key is None:
+            return await self._arequest_content(request)
+        
+        while True:
+            content = await asyncio.to_thread(self.cache.get, key)
+            if content is not None:
+                self._record_reused(request)
+                return content
+            future, owner = self._join_inflight(key)
+            if owner:
+                break
+            # 等待方被取消时不能取消共享的future
+            content = await asyncio.shield(asyncio.wrap_future(future))
+            if content is not None:
+                self._record_reused(request)
+                return content
+        try:
+            content = await self._arequest_content(request)
+        except BaseException:
+            # 被取消时也要唤醒等待方，写缓存不需要等待
+            self._finish_inflight(key, future)
+            raise
+        await asyncio.to_thread(self._finish_inflight, key, future, content)
+        return content
+
+    async def _arequest_content(self, request):
+        self._check_budget(request)
+        start = time.perf_counter()
+        with metrics.timer('llm', model=request["model"], temperature=request["temperature"]) as span:
+            response = await self._get_async_client().chat.completions.create(**request)
+            span.set(**normalize_usage(response.usage))
+        return self._handle_response(request, response, time.perf_counter() - start)
+
+    async def astream(self, system_prompt, user_prompt, model=None, temperature=None):
+        """流式生成内容，逐段产出增量文本，响应结束后记录完整的API调用"""
+        request = self._build_request(system_prompt, user_prompt, model, temperature, stream=True)
+        prefetched = self._take_prefetched(request)
+        if prefetched is not None:
+            # 预取的是完整响应，作为一个数据块产出
+            yield await prefetched
+            return
+        key = self._cache_key(request)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                self._record_reused(request)
+                yield cached
+                return
+        
+        content = []
+        async for delta in self._astream_content(request):
+            content.append(delta)
+            yield delta
+        if key is not None and content:
+            await asyncio.to_thread(self.cache.put, key, "".join(content))
+
+    async def _astream_content(self, request):
+        """请求流式响应，逐段产出增量文本，结束后记录API调用"""
+        self._check_budget(request)
+        start = time.perf_counter()
+        first_token_latency = None
+        stream = await self._get_async_client().chat.completions.create(**request)
+        content, reasoning = [], []
+        model, usage = request["model"], None
+        async for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if self.enable_thinking and getattr(delta, 'reasoning_content', None):
+                reasoning.append(delta.reasoning_content)
+            if delta.content:
+                if first_token_latency is None:
+                    first_token_latency = time.perf_counter() - start
+                content.append(delta.content)
+                yield delta.content
+        
+        reasoning_content = "".join(reasoning) if self.enable_thinking else None
+        metrics.add_time('llm', time.perf_counter() - start, model=model, temperature=request["temperature"],
+                         stream=True, first_token_latency=first_token_latency, **normalize_usage(usage))
+        record_usage(usage)
+        self._log_completion(request, "".join(content), reasoning_content, model, usage,
+                             time.perf_counter() - start, first_token_latency)
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """获取绑定当前事件循环的异步客户端"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(api_key=self.api_key, base_url=config.deepseek.base_url)
+            self._async_clients[loop] = client
+        return client
+
+    def generate_with_retry(self, system_prompt, user_prompt, max_retries=3, temperature=None):
+        """带重试的内容生成"""
+        for attempt in range(max_retries):
+            content = self.generate_content(system_prompt, user_prompt, temperature=temperature)
+            if content:
+                return content
+            logger.error(f"生成失败，第 {attempt + 1} 次重试...")
+            with metrics.timer('sleep', reason='llm_retry'):
+                time.sleep(2)
+        return None
+
+    async def agenerate_with_retry(self, system_prompt, user_prompt, max_retries=3, temperature=None):
+        """带重试的异步内容生成"""
+        for attempt in range(max_retries):
+            content = await self.agenerate_content(system_prompt, user_prompt, temperature=temperature)
+            if content:
+                return content
+            logger.error(f"生成失败，第 {attempt + 1} 次重试...")
+            with metrics.timer('sleep', reason='llm_retry'):
+                await asyncio.sleep(2)
         return None
\ No newline at end of file
@@ -1,12 +1,30 @@
-from abc import ABC, abstractmethod
-from typing import Dict, Any
-
-class PhaseEvaluator(ABC):
-    @abstractmethod
-    def evaluate_phase_success(self, phase_type: str, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:  
-        pass
-
-class CircleEvaluator(ABC):
-    @abstractmethod
-    def evaluate_circle_success(self, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:  
-        pass
\ No newline at end of file
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, Any
+
+class PhaseEvaluator(ABC):
+    @abstractmethod
+    def evaluate_phase_success(self, phase_type: str, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:  
+        pass
+    
+    async def aevaluate_phase_success(self, phase_type: str, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:
+        # 默认在线程池中调用同步实现，子类可以提供原生的异步实现
+        return await asyncio.to_thread(self.evaluate_phase_success, phase_type, context, goal, cell_context)
+
+class CircleEvaluator(ABC):
+    @abstractmethod
+    def evaluate_circle_success(self, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:  
+        pass
+    
+    async def aevaluate_circle_success(self, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:
+        return await asyncio.to_thread(self.evaluate_circle_success, context, goal, cell_context)
+    
+    async def aevaluate_final_phase_and_circle(self, phase_type: str, context: Dict[str, Any], phase_goal: str,
+                                               goal: str, cell_context: str) -> tuple[bool, bool, str]:
+        """
+        精简模式下同时评估最后一个阶段和整个循环，返回 (阶段是否成功, 循环是否成功, 评估内容)
+        
+        默认只评估循环，循环成功即视为最后阶段成功；子类可以用一次调用分别给出两个结论
+        """
+        circle_success, response = await self.aevaluate_circle_success(context, goal, cell_context)
+        return circle_success, circle_success, response
\ No newline at end of file
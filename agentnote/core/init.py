@@ -1,20 +1,40 @@
-from .evaluator import PhaseEvaluator, CircleEvaluator  # 新增
-
-__all__ = [
-    'config',
-    'DeepSeekClient',
-    'ContentParser',
-    'NotebookManager',
-    'NotebookExporter',
-    'NotebookExecutor',
-    'Circle',
-    'Phase',
-    'PhaseType',
-    'Task',
-    'TaskType',
-    'Output',
-    'OutputType',
-    'Context',
-    'PhaseEvaluator',
-    'CircleEvaluator'  
+from .evaluator import PhaseEvaluator, CircleEvaluator  # 新增
+
+__all__ = [
+    'config',
+    'DeepSeekClient',
+    'ContentParser',
+    'StreamingContentParser',
+    'NotebookManager',
+    'NotebookExporter',
+    'NotebookExecutor',
+    'KernelExecutor',
+    'CellDependencyGraph',
+    'WorkspaceTracker',
+    'KernelPool',
+    'NotebookJournal',
+    'OutputSpiller',
+    'BlobStore',
+    'Registry',
+    'PromptTemplates',
+    'LLMCache',
+    'ReplayDeepSeekClient',
+    'Metrics',
+    'ApiLogWriter',
+    'ContextBudgeter',
+    'TokenLedger',
+    'BudgetExceeded',
+    'Trace',
+    'JobStore',
+    'Circle',
+    'Phase',
+    'PhaseType',
+    'Task',
+    'TaskType',
+    'Output',
+    'OutputType',
+    'Context',
+    'PhaseEvaluator',
+    'RuleBasedPhaseEvaluator',
+    'CircleEvaluator'  
 ]
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('JobStore')
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+class JobStore:
+    """
+    持久化任务队列 - 任务保存在SQLite中，服务重启后仍在执行的任务重新排队
+
+    按提交顺序取出排队中的任务，取出和状态修改在同一个连接上串行进行，
+    多个工作线程不会取到同一个任务。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                mission TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                notebook TEXT,
+                result TEXT,
+                error TEXT
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created)")
+        requeued = self._db.execute(
+            "UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'").rowcount
+        if requeued:
+            logger.info(f"上次服务退出时仍在执行的 {requeued} 个任务已重新排队")
+
+    def submit(self, mission: str) -> Dict[str, Any]:
+        """提交任务，返回任务记录"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, mission, status, created) VALUES (?, ?, 'queued', ?)",
+                             (job_id, mission, time.time()))
+        return self.get(job_id)
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """取出最早提交的排队任务并标记为执行中，没有任务时返回None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                             (time.time(), row['id']))
+        return self.get(row['id'])
+
+    def update(self, job_id: str, **fields):
+        """修改任务字段，result 以JSON保存"""
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'], ensure_ascii=False, default=str)
+        if fields.get('status') in FINAL_STATUSES:
+            fields.setdefault('finished', time.time())
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def requeue(self, job_id: str) -> bool:
+        """把仍处于执行中的任务放回队列（已结束的任务不受影响）"""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, finished = NULL WHERE id = ? AND status = 'running'",
+                (job_id,)).rowcount > 0
+
+    def cancel_queued(self, job_id: str) -> bool:
+        """取消尚未开始执行的任务"""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)).rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """按提交时间倒序列出任务"""
+        with self._lock:
+            if status:
+                rows = self._db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created DESC LIMIT ?",
+                                        (status, limit)).fetchall()
+            else:
+                rows = self._db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in JOB_STATUSES} | {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        if job.get('result'):
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,348 @@
+import os
+import re
+import asyncio
+import weakref
+import nbformat as nbf
+from typing import Dict, Any, List
+from jupyter_client import KernelManager, AsyncKernelClient
+from .config import config
+from .executor import NotebookExecutor
+from .snapshot import KERNEL_SNAPSHOT_CODE
+from .kernel_pool import get_kernel_pool
+from .content_parser import ContentParser
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('KernelExecutor')
+
+# IPython特有的语法（魔法命令、shell命令、?帮助），无法用Python语法检查
+IPYTHON_SYNTAX = re.compile(r'^\s*(?:[%!]|\w+\s*=\s*[%!])|\?\s*$', re.MULTILINE)
+
+class KernelExecutor(NotebookExecutor):
+    """常驻内核执行器 - 每个NotebookManager持有一个内核，只执行新追加的cell"""
+
+    # 输出直接写入内存中的notebook，无需重新加载
+    in_memory = True
+
+    def __init__(self, notebook_manager):
+        super().__init__(notebook_manager)
+        self.kernel_manager = None
+        self.kernel_client = None
+        self._async_client = None
+        self._async_client_loop = None
+        self._fresh_checkpoints = set()  # 在内核启动前创建的检查点
+        self._finalizer = None  # 执行器被回收或进程退出时释放内核
+        # 尽早创建内核池，使内核在第一次LLM调用期间完成预启动
+        self.pool = get_kernel_pool()
+
+    def start(self):
+        """启动内核（惰性，首次执行时调用）"""
+        if self.kernel_client is not None:
+            return
+
+        # 与nbconvert保持一致：内核工作目录为notebook所在目录
+        cwd = os.path.dirname(os.path.abspath(self.manager.notebook_path))
+        if self.pool is not None:
+            self.kernel_manager, self.kernel_client = self.pool.acquire(cwd)
+        else:
+            self.kernel_manager = KernelManager(kernel_name=config.executor.kernel_name)
+            self.kernel_manager.start_kernel(cwd=cwd)
+            self.kernel_client = self.kernel_manager.client()
+            self.kernel_client.start_channels()
+            self.kernel_client.wait_for_ready(timeout=config.executor.startup_timeout)
+        # 弱引用回调只持有内核，不会让执行器和它的notebook在任务结束后常驻内存
+        self._finalizer = weakref.finalize(self, _release_kernel, self.pool,
+                                           self.kernel_manager, self.kernel_client)
+        if config.executor.enable_snapshots:
+            self._run_internal(KERNEL_SNAPSHOT_CODE)
+        logger.info(f"内核已启动: {config.executor.kernel_name} (cwd={cwd})")
+
+    def shutdown(self):
+        """关闭内核（来自内核池的内核归还给池）"""
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            self._finalizer = None
+        if self._async_client is not None:
+            self._async_client.stop_channels()
+            self._async_client = None
+            self._async_client_loop = None
+        if self.kernel_manager is not None and self.pool is not None:
+            self.pool.release(self.kernel_manager, self.kernel_client)
+            self.kernel_manager = None
+            self.kernel_client = None
+            logger.info("内核已归还内核池")
+            return
+        if self.kernel_client is not None:
+            self.kernel_client.stop_channels()
+            self.kernel_client = None
+        if self.kernel_manager is not None:
+            if self.kernel_manager.has_kernel:
+                self.kernel_manager.shutdown_kernel(now=True)
+            self.kernel_manager = None
+            logger.info("内核已关闭")
+
+    def interrupt(self):
+        """中断内核中正在执行的代码（任务被取消时调用）"""
+        if self.kernel_manager is not None and self.kernel_manager.has_kernel:
+            self.kernel_manager.interrupt_kernel()
+            logger.info("已中断内核中正在执行的代码")
+
+    def execute_single_cell(self, code: str, cell_index: int, timeout: int = None) -> Dict[str, Any]:
+        """执行单个cell - 只把该cell发送到常驻内核，输出写入内存中的notebook"""
+        timeout = timeout or self.timeout
+        nb = self.manager.nb
+
+        if nb is None or not 0 <= cell_index < len(nb.cells) or nb.cells[cell_index].cell_type != 'code':
+            return {
+                'success': False,
+                'error': f'无效的代码cell索引: {cell_index}',
+                'output': '',
+                'stdout': '',
+                'stderr': '',
+                'execution_count': None
+            }
+        cell = nb.cells[cell_index]
+
+        outputs = []
+        try:
+            self._ensure_kernel(cell_index, timeout)
+            failure = self._preflight(code)
+            if failure is not None:
+                return self._finish_cell(cell, [failure], None)
+            reply = self.kernel_client.execute_interactive(
+                code,
+                timeout=timeout,
+                output_hook=lambda msg: self._handle_output(msg, outputs),
+                allow_stdin=False
+            )
+            execution_count = reply['content'].get('execution_count')
+        except Exception as e:
+            execution_count = None
+            outputs.append(self._failure_output(e, timeout))
+
+        return self._finish_cell(cell, outputs, execution_count)
+
+    async def aexecute_single_cell(self, code: str, cell_index: int, timeout: int = None) -> Dict[str, Any]:
+        """异步执行单个cell - 通过异步内核客户端收发消息，等待执行时不阻塞事件循环"""
+        timeout = timeout or self.timeout
+        nb = self.manager.nb
+
+        if nb is None or not 0 <= cell_index < len(nb.cells) or nb.cells[cell_index].cell_type != 'code':
+            return await asyncio.to_thread(self.execute_single_cell, code, cell_index, timeout)
+        cell = nb.cells[cell_index]
+
+        outputs = []
+        try:
+            # 启动内核、重放上游cell和执行前检查是阻塞操作，放到线程池中执行
+            await asyncio.to_thread(self._ensure_kernel, cell_index, timeout)
+            failure = await asyncio.to_thread(self._preflight, code)
+            if failure is not None:
+                return self._finish_cell(cell, [failure], None)
+            reply = await self._get_async_client().execute_interactive(
+                code,
+                timeout=timeout,
+                output_hook=lambda msg: self._handle_output(msg, outputs),
+                allow_stdin=False
+            )
+            execution_count = reply['content'].get('execution_count')
+        except Exception as e:
+            execution_count = None
+            outputs.append(self._failure_output(e, timeout))
+
+        return self._finish_cell(cell, outputs, execution_count)
+
+    def _ensure_kernel(self, cell_index: int, timeout: int):
+        """确保内核可用；新启动的内核只重放该cell依赖的上游cell"""
+        # 内核意外退出时重新启动（之前的状态已丢失）
+        if self.kernel_manager is not None and not self.kernel_manager.is_alive():
+            logger.warning("内核已退出，重新启动")
+            self.shutdown()
+
+        if self.kernel_client is None:
+            self.start()
+            # 新内核没有之前cell的状态：只重放该cell依赖的上游cell，并复用它们已有的输出
+            self._replay(self.manager.dependency_graph.build(self.manager.nb).upstream(cell_index), timeout)
+
+    def _preflight(self, code: str):
+        """
+        执行前的静态检查 - 语法、导入的模块在内核环境中能否找到、读取的名称是否已在内核中定义
+
+        检查不通过时返回error输出，代码不会被发送到内核执行；通过或无法检查时返回None。
+        """
+        if not config.executor.preflight:
+            return None
+        try:
+            modules, names = ContentParser.preflight_targets(code)
+        except SyntaxError as e:
+            if IPYTHON_SYNTAX.search(code):
+                return None
+            return self._preflight_failure([f"SyntaxError: 第 {e.lineno} 行: {e.msg}"
+                                            + (f"\n    {e.text.strip()}" if e.text else '')])
+        if not modules and not names:
+            return None
+
+        expressions = {}
+        if modules:
+            expressions['modules'] = (
+                f"[m for m in {modules!r} if m not in __import__('sys').modules "
+                f"and __import__('importlib.util').util.find_spec(m) is None]")
+        if names:
+            expressions['names'] = (
+                f"[n for n in {names!r} if n not in get_ipython().user_ns "
+                f"and not hasattr(__import__('builtins'), n)]")
+        try:
+            reply = self._run_internal('', user_expressions=expressions)
+        except Exception as e:
+            logger.warning(f"执行前检查失败，直接执行代码: {e}")
+            return None
+
+        problems = []
+        for key, label in (('modules', 'ModuleNotFoundError: 内核环境中找不到模块'),
+                           ('names', 'NameError: 内核中尚未定义的名称')):
+            result = reply['user_expressions'].get(key)
+            if result is None:
+                continue
+            if result.get('status') != 'ok':
+                logger.warning(f"执行前检查表达式出错: {result.get('ename')}: {result.get('evalue')}")
+                continue
+            missing = result['data']['text/plain']
+            if missing != '[]':
+                problems.append(f"{label} {missing}")
+        return self._preflight_failure(problems) if problems else None
+
+    @staticmethod
+    def _preflight_failure(problems: List[str]):
+        metrics.count('preflight_failures')
+        logger.info(f"执行前检查未通过，代码未执行: {'; '.join(problems)}")
+        return nbf.v4.new_output('error', ename='PreflightError',
+                                 evalue='代码未执行，执行前检查发现以下问题:\n' + '\n'.join(problems),
+                                 traceback=[])
+
+    def _get_async_client(self) -> AsyncKernelClient:
+        """获取连接当前内核、绑定当前事件循环的异步客户端"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            client = AsyncKernelClient()
+            client.load_connection_info(self.kernel_manager.get_connection_info())
+            client.start_channels()
+            self._async_client, self._async_client_loop = client, loop
+        return self._async_client
+
+    def _failure_output(self, error: Exception, timeout: int):
+        """把执行异常转换为error输出，使任务能够按代码错误处理"""
+        if isinstance(error, TimeoutError):
+            self.kernel_manager.interrupt_kernel()
+            return nbf.v4.new_output('error', ename='TimeoutError',
+                                     evalue=f'cell执行超过 {timeout} 秒', traceback=[])
+        return nbf.v4.new_output('error', ename=type(error).__name__,
+                                 evalue=f'内核执行异常: {str(error)}', traceback=[])
+
+    def _finish_cell(self, cell, outputs: List, execution_count) -> Dict[str, Any]:
+        """把输出写入cell并构建执行结果"""
+        cell.outputs = outputs
+        cell.execution_count = execution_count
+
+        error_details = ""
+        for output in outputs:
+            if output.output_type == 'error':
+                error_details = f"{output.ename}: {output.evalue}"
+                if output.get('traceback'):
+                    error_details += f"\n追踪: {' | '.join(output.traceback)}"
+                break
+
+        return {
+            'success': not error_details,
+            'error': error_details or None,
+            'output': self._extract_cell_output(cell),
+            'stdout': self._collect_stream(outputs, 'stdout'),
+            'stderr': self._collect_stream(outputs, 'stderr'),
+            'execution_count': execution_count
+        }
+
+    def checkpoint(self, key: str):
+        """在内核中保存用户命名空间的快照"""
+        if self.kernel_client is None or not self.kernel_manager.is_alive():
+            # 内核尚未启动：回滚时直接关闭内核即可回到初始状态
+            self._fresh_checkpoints.add(key)
+            return
+        reply = self._run_internal('', user_expressions={'shared': f'_agentnote_checkpoint({key!r})'})
+        shared = reply['user_expressions']['shared']
+        if shared.get('status') == 'ok' and shared['data']['text/plain'] != '[]':
+            logger.warning(f"以下变量无法复制，回滚时按引用恢复: {shared['data']['text/plain']}")
+
+    def rollback(self, key: str):
+        """把内核命名空间恢复到检查点时的状态"""
+        if key in self._fresh_checkpoints or self.kernel_client is None or not self.kernel_manager.is_alive():
+            # 下次执行时会启动新内核并按依赖图重放未被回滚的上游cell
+            self.shutdown()
+            return
+        self._run_internal(f'_agentnote_rollback({key!r})')
+
+    def discard(self, key: str):
+        """丢弃检查点，释放内核中的快照"""
+        if key in self._fresh_checkpoints:
+            self._fresh_checkpoints.discard(key)
+        elif self.kernel_client is not None and self.kernel_manager.is_alive():
+            self._run_internal(f'_agentnote_discard({key!r})')
+
+    def _run_internal(self, code: str, user_expressions: Dict[str, str] = None, timeout: int = None) -> Dict[str, Any]:
+        """在内核中静默执行内部代码，不记录历史也不产生输出"""
+        reply = self.kernel_client.execute_interactive(
+            code,
+            silent=True,
+            store_history=False,
+            user_expressions=user_expressions or {},
+            timeout=timeout or self.timeout,
+            output_hook=lambda msg: None,
+            allow_stdin=False
+        )
+        if reply['content']['status'] != 'ok':
+            raise RuntimeError(f"内核内部代码执行失败: {reply['content'].get('ename')}: {reply['content'].get('evalue')}")
+        return reply['content']
+
+    def _replay(self, cell_indices: List[int], timeout: int):
+        """静默重放指定cell以恢复内核状态，不修改它们的输出"""
+        if not cell_indices:
+            return
+        logger.info(f"重放上游cell以恢复内核状态: {cell_indices}")
+        for i in cell_indices:
+            self.kernel_client.execute_interactive(
+                self.manager.nb.cells[i].source,
+                silent=True,
+                store_history=False,
+                timeout=timeout,
+                output_hook=lambda msg: None,
+                allow_stdin=False
+            )
+
+    @staticmethod
+    def _handle_output(msg: Dict[str, Any], outputs: List):
+        """把IOPub消息转换为nbformat输出"""
+        msg_type = msg['header']['msg_type']
+        content = msg['content']
+
+        if msg_type == 'clear_output':
+            outputs.clear()
+        elif msg_type == 'stream':
+            # 合并连续的同名stream输出，与nbclient行为一致
+            if outputs and outputs[-1].output_type == 'stream' and outputs[-1].name == content['name']:
+                outputs[-1].text += content['text']
+            else:
+                outputs.append(nbf.v4.output_from_msg(msg))
+        elif msg_type in ('display_data', 'execute_result', 'error'):
+            outputs.append(nbf.v4.output_from_msg(msg))
+
+    @staticmethod
+    def _collect_stream(outputs: List, name: str) -> str:
+        """收集指定stream的全部文本"""
+        return "".join(o.text for o in outputs if o.output_type == 'stream' and o.name == name)
+
+
+def _release_kernel(pool, kernel_manager, kernel_client):
+    """执行器未调用shutdown就被回收（或进程退出）时释放它的内核"""
+    if pool is not None:
+        pool.release(kernel_manager, kernel_client)
+        return
+    kernel_client.stop_channels()
+    if kernel_manager.has_kernel:
+        kernel_manager.shutdown_kernel(now=True)
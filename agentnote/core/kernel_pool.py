@@ -0,0 +1,209 @@
+import os
+import atexit
+import queue
+import threading
+from typing import Tuple
+from jupyter_client import KernelManager
+from .config import config
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('KernelPool')
+
+# 预导入完成后记录的进程级状态，归还内核时据此还原
+KERNEL_BASELINE_CODE = '''
+import os as _agentnote_os, sys as _agentnote_sys
+_agentnote_sys._agentnote_baseline = {
+    'cwd': _agentnote_os.getcwd(),
+    'environ': dict(_agentnote_os.environ),
+    'path': list(_agentnote_sys.path),
+    'rc': dict(_agentnote_sys.modules['matplotlib'].rcParams) if 'matplotlib' in _agentnote_sys.modules else None,
+}
+del _agentnote_os, _agentnote_sys
+'''
+
+# 归还内核时还原工作目录、环境变量、sys.path、matplotlib和pandas的设置，再清空用户命名空间
+KERNEL_RECYCLE_CODE = '''
+def _agentnote_recycle():
+    import os, sys, warnings
+    baseline = sys._agentnote_baseline
+    os.chdir(baseline['cwd'])
+    os.environ.clear()
+    os.environ.update(baseline['environ'])
+    sys.path[:] = baseline['path']
+    if 'matplotlib.pyplot' in sys.modules:
+        sys.modules['matplotlib.pyplot'].close('all')
+    if 'matplotlib' in sys.modules:
+        matplotlib = sys.modules['matplotlib']
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if baseline['rc'] is None:
+                matplotlib.rcdefaults()
+            else:
+                matplotlib.rcParams.update(baseline['rc'])
+    if 'pandas' in sys.modules:
+        pandas = sys.modules['pandas']
+        options = getattr(getattr(getattr(pandas, '_config', None), 'config', None), '_registered_options', {})
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            # 逐项还原：个别选项（如绘图后端）的校验可能因可选依赖缺失而失败
+            for key in list(options):
+                try:
+                    pandas.reset_option(key)
+                except Exception:
+                    pass
+_agentnote_recycle()
+get_ipython().run_line_magic('reset', '-f')
+'''
+
+class KernelPool:
+    """
+    预启动内核池 - 内核启动后预先导入常用科学计算库，按需分配给执行器
+
+    归还的内核还原工作目录、环境变量、sys.path、matplotlib和pandas的设置并清空命名空间后复用；
+    已导入模块内部的其他状态（模块级变量、随机数种子、被修改的函数等）无法还原，
+    会带入下一个任务，影响范围由 kernel_pool_max_uses 限制。任务之间需要完全隔离时设为1。
+    """
+
+    def __init__(self, size: int, preload_modules=(), kernel_name: str = "python3"):
+        self.size = size
+        self.preload_modules = list(preload_modules)
+        self.kernel_name = kernel_name
+        self._idle = queue.Queue()
+        self._uses = {}  # 内核被使用的次数
+        self._lock = threading.Lock()
+        self._closed = False
+        self._pending = 0
+        for _ in range(size):
+            self._spawn_async()
+        atexit.register(self.shutdown)
+
+    def _spawn_async(self):
+        """在后台线程中启动一个内核并放入空闲队列"""
+        with self._lock:
+            self._pending += 1
+        threading.Thread(target=self._spawn_into_pool, name='KernelPoolSpawn', daemon=True).start()
+
+    def _spawn_into_pool(self):
+        try:
+            kernel = self._spawn()
+        except Exception as e:
+            logger.error(f"预启动内核失败: {e}")
+            return
+        finally:
+            with self._lock:
+                self._pending -= 1
+        if self._closed:
+            self._shutdown_kernel(kernel)
+        else:
+            self._idle.put(kernel)
+
+    def _spawn(self) -> Tuple[KernelManager, object]:
+        """启动内核并预导入配置的模块"""
+        km = KernelManager(kernel_name=self.kernel_name)
+        km.start_kernel(cwd=os.getcwd())
+        kc = km.client()
+        kc.start_channels()
+        kc.wait_for_ready(timeout=config.executor.startup_timeout)
+        self._uses[id(km)] = 0
+        self._preload(kc)
+        self._run(kc, KERNEL_BASELINE_CODE, timeout=config.executor.startup_timeout)
+        logger.info(f"预启动内核就绪，已导入: {self.preload_modules}")
+        return km, kc
+
+    @staticmethod
+    def _run(kc, code: str, timeout: float = None) -> bool:
+        """在内核中静默执行代码，返回是否执行成功"""
+        reply = kc.execute_interactive(code, silent=True, store_history=False, timeout=timeout,
+                                       output_hook=lambda msg: None, allow_stdin=False)
+        return reply['content']['status'] == 'ok'
+
+    def _preload(self, kc):
+        """导入模块到内核的 sys.modules，但不向用户命名空间绑定名称"""
+        if not self.preload_modules:
+            return
+        code = "\n".join([
+            "from importlib import import_module as _agentnote_import, util as _agentnote_util",
+            f"for _agentnote_module in {self.preload_modules!r}:",
+            "    if _agentnote_util.find_spec(_agentnote_module.split('.')[0]) is not None:",
+            "        _agentnote_import(_agentnote_module)",
+            "del _agentnote_import, _agentnote_util, _agentnote_module",
+        ])
+        self._run(kc, code, timeout=config.executor.startup_timeout)
+
+    def acquire(self, cwd: str) -> Tuple[KernelManager, object]:
+        """取出一个就绪的内核并切换到指定工作目录；池为空时同步启动"""
+        while True:
+            with self._lock:
+                pending = self._pending
+            try:
+                # 有内核正在启动时等待它就绪，否则立即同步启动
+                km, kc = self._idle.get(timeout=config.executor.startup_timeout if pending else 0)
+            except queue.Empty:
+                logger.warning("内核池为空，同步启动内核")
+                km, kc = self._spawn()
+            if km.is_alive():
+                break
+            self._shutdown_kernel((km, kc))
+
+        self._uses[id(km)] += 1
+        kc.execute_interactive(f"import os as _agentnote_os; _agentnote_os.chdir({cwd!r}); del _agentnote_os",
+                               silent=True, store_history=False, output_hook=lambda msg: None,
+                               allow_stdin=False)
+        # 补充一个新内核，保持池的容量
+        if self._idle.qsize() + self._pending < self.size:
+            self._spawn_async()
+        return km, kc
+
+    def release(self, km: KernelManager, kc):
+        """归还内核：未超过复用次数时还原进程状态、清空命名空间后放回池中，否则替换为新内核"""
+        max_uses = config.executor.kernel_pool_max_uses
+        reusable = not self._closed and km.is_alive() and self._uses.get(id(km), 0) < max_uses \
+            and self._idle.qsize() < self.size
+        # 已导入的模块仍保留在 sys.modules 中；还原失败（如状态被破坏）时不再复用
+        if reusable and self._recycle(kc):
+            self._idle.put((km, kc))
+            return
+        threading.Thread(target=self._shutdown_kernel, args=((km, kc),), daemon=True).start()
+        if not self._closed and self._idle.qsize() + self._pending < self.size:
+            self._spawn_async()
+
+    def _recycle(self, kc) -> bool:
+        try:
+            if self._run(kc, KERNEL_RECYCLE_CODE, timeout=config.executor.startup_timeout):
+                return True
+            logger.warning("还原内核状态失败，替换为新内核")
+        except Exception as e:
+            logger.warning(f"还原内核状态失败，替换为新内核: {e}")
+        return False
+
+    def _shutdown_kernel(self, kernel):
+        km, kc = kernel
+        self._uses.pop(id(km), None)
+        kc.stop_channels()
+        if km.has_kernel:
+            km.shutdown_kernel(now=True)
+
+    def shutdown(self):
+        """关闭池中所有空闲内核"""
+        self._closed = True
+        while True:
+            try:
+                self._shutdown_kernel(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_kernel_pool():
+    """获取进程级共享内核池（pool_size为0时不启用，返回None）"""
+    global _pool
+    if config.executor.pool_size <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = KernelPool(config.executor.pool_size,
+                               config.executor.preload_modules,
+                               config.executor.kernel_name)
+        return _pool
@@ -0,0 +1,223 @@
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+from .config import config
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('Ledger')
+
+USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'reasoning_tokens')
+
+# 当前的账本和所处的 (循环, 阶段, 任务) 路径；asyncio任务和to_thread会继承调用方的值
+_current: contextvars.ContextVar[Optional[Tuple['TokenLedger', Tuple[str, ...]]]] = \
+    contextvars.ContextVar('agentnote_ledger', default=None)
+_save_lock = threading.Lock()
+
+
+class BudgetExceeded(RuntimeError):
+    """任务的token或费用超出预算上限"""
+
+    def __init__(self, message: str, totals: Dict[str, Any]):
+        super().__init__(message)
+        self.totals = totals
+
+
+def normalize_usage(usage) -> Dict[str, int]:
+    """
+    把API返回的用量统计（对象或日志中的字典）转换为统一的字段
+
+    缓存命中的提示词token取DeepSeek的 prompt_cache_hit_tokens，
+    或OpenAI格式的 prompt_tokens_details.cached_tokens。
+    """
+    if usage is None:
+        return dict.fromkeys(USAGE_FIELDS, 0)
+
+    def get(obj, name):
+        if obj is None:
+            return None
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+    cached = get(usage, 'prompt_cache_hit_tokens')
+    if cached is None:
+        cached = get(get(usage, 'prompt_tokens_details'), 'cached_tokens')
+    if cached is None:
+        cached = get(usage, 'cached_tokens')
+    reasoning = get(get(usage, 'completion_tokens_details'), 'reasoning_tokens')
+    if reasoning is None:
+        reasoning = get(usage, 'reasoning_tokens')
+    return {
+        'prompt_tokens': get(usage, 'prompt_tokens') or 0,
+        'completion_tokens': get(usage, 'completion_tokens') or 0,
+        'cached_tokens': cached or 0,
+        'reasoning_tokens': reasoning or 0,
+    }
+
+
+def estimate_cost(usage: Dict[str, int]) -> float:
+    """按配置的单价（每百万token）估算费用"""
+    budget = config.budget
+    uncached = usage['prompt_tokens'] - usage['cached_tokens']
+    return (uncached * budget.price_input
+            + usage['cached_tokens'] * budget.price_input_cached
+            + usage['completion_tokens'] * budget.price_output) / 1_000_000
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {'calls': 0, **dict.fromkeys(USAGE_FIELDS, 0), 'cost': 0.0}
+
+
+class TokenLedger:
+    """
+    任务账本 - 按任务、阶段、循环和整个任务汇总模型调用的token用量和估算费用
+
+    超过 degrade_ratio 比例的预算后进入降级状态（不再重试，不再开始新的循环），
+    达到上限时在下一次模型调用前抛出 BudgetExceeded。上限为0表示不限制。
+    """
+
+    def __init__(self, mission: str, max_tokens: int = 0, max_cost: float = 0.0,
+                 on_exceed: str = "stop", degrade_ratio: float = 0.8):
+        self.mission = mission
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.on_exceed = on_exceed
+        self.degrade_ratio = degrade_ratio
+        self.totals = _empty_totals()
+        self.breakdown: Dict[str, Dict[str, Dict[str, Any]]] = {'circles': {}, 'phases': {}, 'tasks': {}}
+        self.degraded = False
+        self.exceeded = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, mission: str) -> 'TokenLedger':
+        budget = config.budget
+        return cls(mission, budget.max_tokens, budget.max_cost, budget.on_exceed, budget.degrade_ratio)
+
+    @contextmanager
+    def activate(self):
+        """在代码块内把模型调用记入本账本"""
+        token = _current.set((self, ()))
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def record(self, usage, path: Tuple[str, ...] = ()):
+        """记录一次模型调用的用量，同时计入路径上的每一级"""
+        usage = normalize_usage(usage)
+        cost = estimate_cost(usage)
+        with self._lock:
+            targets = [self.totals]
+            for level, depth in (('circles', 1), ('phases', 2), ('tasks', 3)):
+                if len(path) >= depth:
+                    targets.append(self.breakdown[level].setdefault('/'.join(path[:depth]), _empty_totals()))
+            for totals in targets:
+                totals['calls'] += 1
+                for field in USAGE_FIELDS:
+                    totals[field] += usage[field]
+                totals['cost'] += cost
+            self._update_state()
+
+    def _usage_ratio(self, extra_tokens: int = 0) -> float:
+        """已用预算的比例（token和费用中较高的一个）"""
+        ratios = [0.0]
+        if self.max_tokens > 0:
+            used = self.totals['prompt_tokens'] + self.totals['completion_tokens'] + extra_tokens
+            ratios.append(used / self.max_tokens)
+        if self.max_cost > 0:
+            ratios.append(self.totals['cost'] / self.max_cost)
+        return max(ratios)
+
+    def _update_state(self):
+        ratio = self._usage_ratio()
+        if ratio >= 1:
+            self.exceeded = True
+        if self.on_exceed == "degrade" and ratio >= self.degrade_ratio and not self.degraded:
+            self.degraded = True
+            logger.warning(f"已使用 {ratio:.0%} 的预算，任务进入降级模式")
+
+    def check(self, estimated_prompt_tokens: int = 0):
+        """模型调用前检查预算，加上本次请求的提示词后超出上限时抛出 BudgetExceeded"""
+        with self._lock:
+            if self.exceeded or self._usage_ratio(estimated_prompt_tokens) >= 1:
+                self.exceeded = True
+                raise BudgetExceeded(
+                    f"任务预算已用尽: {self.totals['prompt_tokens'] + self.totals['completion_tokens']} tokens "
+                    f"(上限 {self.max_tokens or '无'}), 费用 {self.totals['cost']:.4f} (上限 {self.max_cost or '无'})",
+                    dict(self.totals))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """账本内容的副本"""
+        with self._lock:
+            return {
+                'mission': self.mission,
+                'totals': {**self.totals, 'cost': round(self.totals['cost'], 6)},
+                'limits': {'max_tokens': self.max_tokens, 'max_cost': self.max_cost, 'on_exceed': self.on_exceed},
+                'degraded': self.degraded,
+                'exceeded': self.exceeded,
+                **{level: {k: {**v, 'cost': round(v['cost'], 6)} for k, v in entries.items()}
+                   for level, entries in self.breakdown.items()},
+            }
+
+    def save(self, path: Optional[str] = None, **extra):
+        """把账本追加写入JSONL文件"""
+        path = path or config.budget.ledger_path
+        if not path:
+            return
+        entry = {'timestamp': datetime.now().isoformat(), **extra, **self.snapshot()}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with _save_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+@contextmanager
+def ledger_scope(name: str):
+    """进入循环、阶段或任务的下一级统计路径"""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    ledger, path = current
+    token = _current.set((ledger, path + (name,)))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def scope_context(*names: str, up: int = 0) -> contextvars.Context:
+    """
+    返回当前上下文的副本，其中的统计路径先回退up级再进入names
+
+    提前为之后的某一级（如下一个阶段）发起异步任务时，在该副本中创建任务，
+    任务中的模型调用记入之后那一级，而不是发起时所在的一级
+    """
+    ctx = contextvars.copy_context()
+    current = _current.get()
+    if current is not None:
+        ledger, path = current
+        ctx.run(_current.set, (ledger, path[:len(path) - up] + names))
+    return ctx
+
+
+def current_ledger() -> Optional[TokenLedger]:
+    """当前代码所属任务的账本，不在任务中时返回None"""
+    current = _current.get()
+    return current[0] if current else None
+
+
+def record_usage(usage):
+    """把一次模型调用的用量记入当前账本"""
+    current = _current.get()
+    if current is not None:
+        current[0].record(usage, current[1])
+
+
+def is_degraded() -> bool:
+    """当前任务是否因预算不足进入降级模式"""
+    ledger = current_ledger()
+    return ledger is not None and ledger.degraded
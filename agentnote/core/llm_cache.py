@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from .config import config
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('LLMCache')
+
+class LLMCache:
+    """
+    模型响应缓存 - 内存LRU + SQLite磁盘两级，磁盘层按TTL和总大小淘汰
+
+    磁盘层可能被多个进程同时使用：写入前最多等待 busy_timeout 秒，
+    仍无法读写时按未命中处理（写入只保留在内存层），不影响模型调用本身。
+    """
+
+    def __init__(self, path: str, memory_entries: int = 256, max_disk_mb: float = 200, ttl_hours: float = 168,
+                 busy_timeout: float = 5.0):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self.ttl = ttl_hours * 3600
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        with self._lock:
+            self._try_evict()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, temperature: float, thinking: bool) -> str:
+        """根据影响响应的请求参数计算缓存键"""
+        payload = json.dumps([model, system_prompt, user_prompt, temperature, thinking], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，先查内存再查磁盘，磁盘命中后提升到内存"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            now = time.time()
+            try:
+                row = self._db.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"读取缓存失败，按未命中处理: {e}")
+                row = None
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            try:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                # 访问时间只影响淘汰顺序
+                logger.debug(f"更新缓存访问时间失败: {e}")
+            self._remember(key, row[0])
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, content: str):
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, content)
+            try:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                 (key, content, now, now, len(content.encode('utf-8'))))
+            except sqlite3.Error as e:
+                logger.warning(f"写入缓存失败，响应只保留在内存中: {e}")
+                return
+            self._try_evict()
+
+    def _remember(self, key: str, content: str):
+        self._memory[key] = content
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _try_evict(self):
+        try:
+            self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"淘汰缓存条目失败: {e}")
+
+    def _evict(self):
+        """删除过期条目，总大小超限时按最近访问时间淘汰"""
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        freed = 0
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total - freed <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        logger.info(f"缓存超过大小限制，已淘汰 {len(evicted)} 条响应")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses,
+                'memory_entries': len(self._memory), 'disk_entries': entries}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """获取进程级共享的响应缓存（未启用时返回None）"""
+    global _cache
+    if not config.cache.enabled:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(config.cache.path,
+                              config.cache.memory_entries,
+                              config.cache.max_disk_mb,
+                              config.cache.ttl_hours,
+                              config.cache.busy_timeout)
+        return _cache
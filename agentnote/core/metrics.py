@@ -0,0 +1,86 @@
+import sys
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+from .tracing import span, record_span
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class Metrics:
+    """
+    运行指标 - 按类别累计耗时和次数（模型调用、代码执行、notebook读写等），用于基准测试
+
+    计时的同时在当前追踪中记录同名的span。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空已记录的指标"""
+        with self._lock:
+            self.timings: Dict[str, float] = defaultdict(float)
+            self.calls: Dict[str, int] = defaultdict(int)
+            self.counters: Dict[str, int] = defaultdict(int)
+            self.phases = []
+
+    @contextmanager
+    def timer(self, category: str, **attrs):
+        """统计代码块的耗时，返回的span可以补充属性"""
+        start = time.perf_counter()
+        try:
+            with span(category, category, **attrs) as current:
+                yield current
+        finally:
+            self._add_time(category, time.perf_counter() - start)
+
+    def add_time(self, category: str, seconds: float, **attrs):
+        """记录一段刚刚结束的过程的耗时"""
+        record_span(category, category, seconds, **attrs)
+        self._add_time(category, seconds)
+
+    def _add_time(self, category: str, seconds: float):
+        with self._lock:
+            self.timings[category] += seconds
+            self.calls[category] += 1
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def record_phase(self, phase_type: str, seconds: float, success: bool):
+        """记录一个阶段的耗时"""
+        with self._lock:
+            self.phases.append({'phase': phase_type, 'wall_time': round(seconds, 4), 'success': success})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前指标的副本"""
+        with self._lock:
+            return {
+                'timings': {k: round(v, 4) for k, v in self.timings.items()},
+                'calls': dict(self.calls),
+                'counters': dict(self.counters),
+                'phases': list(self.phases),
+            }
+
+    @staticmethod
+    def peak_rss_mb() -> Optional[Dict[str, float]]:
+        """本进程和已结束子进程（内核）的峰值常驻内存，平台不支持时返回None"""
+        if resource is None:
+            return None
+        # Linux上ru_maxrss单位为KB，macOS上为字节
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return {
+            'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+        }
+
+
+# 全局指标实例
+metrics = Metrics()
@@ -1,101 +1,132 @@
-import json
-import os
-from datetime import datetime
-import nbformat as nbf
-from .config import config
-from ..utils.setup_logger import get_logger
-
-logger = get_logger('NotebookExporter')
-
-class NotebookExporter:
-    """Notebook导出器"""
-    
-    @staticmethod
-    def extract_cell_data(cell, cell_index: int):
-        """提取cell的数据"""
-        cell_data = {
-            "index": cell_index,
-            "cell_type": cell.cell_type,
-            "source": cell.source,
-            "execution_count": cell.get('execution_count', None),
-            "metadata": dict(cell.metadata) if hasattr(cell, 'metadata') else {}
-        }
-        
-        # 添加输出信息
-        if hasattr(cell, 'outputs') and cell.outputs:
-            cell_data["outputs"] = []
-            for output in cell.outputs:
-                output_data = {
-                    "output_type": output.output_type
-                }
-                
-                if output.output_type == "execute_result":
-                    output_data["data"] = {
-                        k: str(v)[:500] + "..." if len(str(v)) > 500 else str(v) 
-                        for k, v in output.data.items()
-                    } if hasattr(output, 'data') else {}
-                    output_data["execution_count"] = output.get('execution_count', None)
-                
-                elif output.output_type == "stream":
-                    output_data["text"] = output.text[:1000] + "..." if len(output.text) > 1000 else output.text
-                
-                elif output.output_type == "error":
-                    output_data["ename"] = output.ename
-                    output_data["evalue"] = output.evalue
-                    output_data["traceback"] = output.traceback
-                
-                elif output.output_type == "display_data":
-                    output_data["data"] = {
-                        k: "[binary data]" if k.startswith('image/') else str(v)[:500] + "..." if len(str(v)) > 500 else str(v)
-                        for k, v in output.data.items()
-                    } if hasattr(output, 'data') else {}
-                
-                cell_data["outputs"].append(output_data)
-        
-        return cell_data
-    
-    @staticmethod
-    def export_notebook_to_json(notebook_path: str, output_file: str = None):
-        """导出notebook的所有cell输入输出到JSON"""
-        if not os.path.exists(notebook_path):
-            logger.warning(f"Notebook文件不存在: {notebook_path}")
-            return None
-        
-        with open(notebook_path, 'r', encoding='utf-8') as f:
-            nb = nbf.read(f, as_version=4)
-        
-        notebook_data = {
-            "export_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "notebook_path": notebook_path,
-            "cells": []
-        }
-        
-        for i, cell in enumerate(nb.cells):
-            cell_data = NotebookExporter.extract_cell_data(cell, i)
-            notebook_data["cells"].append(cell_data)
-        
-        # 如果指定了输出文件，则保存到文件
-        output_file = output_file or config.notebook.json_output_file
-        if output_file:
-            with open(f"environment/{output_file}", 'w', encoding='utf-8') as f:
-                json.dump(notebook_data, f, indent=2, ensure_ascii=False)
-            logger.info(f"Notebook cell数据已导出到: environment/{output_file}")
-        
-        return notebook_data
-        
-    @staticmethod
-    def save_notebook(nb, notebook_path: str = None):
-        """保存notebook到文件"""
-        notebook_path = notebook_path or config.notebook.notebook_name
-        full_path = f"environment/{notebook_path}"
-        
-        try:
-            with open(full_path, 'w', encoding='utf-8') as f:
-                nbf.write(nb, f)
-                f.flush()
-                os.fsync(f.fileno())  # 强制刷新到磁盘
-            logger.info(f"Notebook已保存: {full_path}")
-            return True
-        except Exception as e:
-            logger.warning(f"保存notebook失败: {e}")
+import json
+import os
+from datetime import datetime
+import nbformat as nbf
+from .config import config
+from .output_spill import OutputSpiller, spilled_refs
+from .blob_store import BlobStore, blob_refs
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('NotebookExporter')
+
+class NotebookExporter:
+    """Notebook导出器"""
+    
+    @staticmethod
+    def extract_cell_data(cell, cell_index: int):
+        """提取cell的数据"""
+        cell_data = {
+            "index": cell_index,
+            "cell_type": cell.cell_type,
+            "source": cell.source,
+            "execution_count": cell.get('execution_count', None),
+            "metadata": dict(cell.metadata) if hasattr(cell, 'metadata') else {}
+        }
+        
+        # 添加输出信息
+        if hasattr(cell, 'outputs') and cell.outputs:
+            cell_data["outputs"] = []
+            refs = spilled_refs(cell)
+            blobs = blob_refs(cell)
+            for i, output in enumerate(cell.outputs):
+                output_data = {
+                    "output_type": output.output_type
+                }
+                
+                if output.output_type == "execute_result":
+                    output_data["data"] = {
+                        k: str(v)[:500] + "..." if len(str(v)) > 500 else str(v) 
+                        for k, v in output.data.items()
+                    } if hasattr(output, 'data') else {}
+                    output_data["execution_count"] = output.get('execution_count', None)
+                
+                elif output.output_type == "stream":
+                    output_data["text"] = output.text[:1000] + "..." if len(output.text) > 1000 else output.text
+                
+                elif output.output_type == "error":
+                    output_data["ename"] = output.ename
+                    output_data["evalue"] = output.evalue
+                    output_data["traceback"] = output.traceback
+                
+                elif output.output_type == "display_data":
+                    output_data["data"] = {
+                        k: "[binary data]" if k.startswith('image/') else str(v)[:500] + "..." if len(str(v)) > 500 else str(v)
+                        for k, v in output.data.items()
+                    } if hasattr(output, 'data') else {}
+                
+                # 转存到文件的输出只记录引用，需要时再读取完整内容
+                spilled = [{"key": ref["key"], "path": ref["path"], "bytes": ref["bytes"]}
+                           for ref in refs if ref["output"] == i]
+                if spilled:
+                    output_data["spilled"] = spilled
+                stored = [{"mime": ref["key"], "path": ref["path"], "sha256": ref["sha256"]}
+                          for ref in blobs if ref["output"] == i]
+                if stored:
+                    output_data["blobs"] = stored
+                
+                cell_data["outputs"].append(output_data)
+        
+        return cell_data
+    
+    @staticmethod
+    def export_notebook_to_json(notebook_path: str, output_file: str = None):
+        """导出notebook的所有cell输入输出到JSON"""
+        if not os.path.exists(notebook_path):
+            logger.warning(f"Notebook文件不存在: {notebook_path}")
+            return None
+        
+        with open(notebook_path, 'r', encoding='utf-8') as f:
+            nb = nbf.read(f, as_version=4)
+        
+        notebook_data = {
+            "export_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "notebook_path": notebook_path,
+            "cells": []
+        }
+        
+        for i, cell in enumerate(nb.cells):
+            cell_data = NotebookExporter.extract_cell_data(cell, i)
+            notebook_data["cells"].append(cell_data)
+        
+        # 如果指定了输出文件，则保存到文件
+        output_file = output_file or config.notebook.json_output_file
+        if output_file:
+            output_path = os.path.join(config.notebook.directory, output_file)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(notebook_data, f, indent=2, ensure_ascii=False)
+            logger.info(f"Notebook cell数据已导出到: {output_path}")
+        
+        return notebook_data
+        
+    @staticmethod
+    def export_full_notebook(notebook_path: str, output_path: str):
+        """导出输出完整的notebook副本 - 把转存到文件的文本输出和移入存储的二进制输出还原到cell中"""
+        if not os.path.exists(notebook_path):
+            logger.warning(f"Notebook文件不存在: {notebook_path}")
+            return None
+        
+        with open(notebook_path, 'r', encoding='utf-8') as f:
+            nb = nbf.read(f, as_version=4)
+        nb = OutputSpiller.from_config(notebook_path).restore_notebook(nb)
+        nb = BlobStore.from_config(notebook_path).inline_notebook(nb)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            nbf.write(nb, f)
+        logger.info(f"完整输出的Notebook已导出到: {output_path}")
+        return output_path
+        
+    @staticmethod
+    def save_notebook(nb, notebook_path: str = None):
+        """保存notebook到文件"""
+        notebook_path = notebook_path or config.notebook.notebook_name
+        full_path = os.path.join(config.notebook.directory, notebook_path)
+        
+        try:
+            with open(full_path, 'w', encoding='utf-8') as f:
+                nbf.write(nb, f)
+                f.flush()
+                os.fsync(f.fileno())  # 强制刷新到磁盘
+            logger.info(f"Notebook已保存: {full_path}")
+            return True
+        except Exception as e:
+            logger.warning(f"保存notebook失败: {e}")
             return False
\ No newline at end of file
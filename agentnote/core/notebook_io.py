@@ -0,0 +1,33 @@
+import json
+import nbformat as nbf
+from nbformat.v4.rwbase import rejoin_lines
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(nb, validate: bool = False) -> bytes:
+    """
+    把notebook序列化为UTF-8字节
+
+    validate为False时直接序列化内存中的notebook（安装了orjson时使用orjson），
+    跳过nbformat的深拷贝、按行拆分和schema校验，只用于本进程生成的可信notebook；
+    为True时通过nbformat按规范格式化并校验（最终写出和导出时使用）。
+    """
+    if validate:
+        return nbf.writes(nb).encode('utf-8')
+    if orjson is not None:
+        return orjson.dumps(nb)
+    return json.dumps(nb, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: bytes, validate: bool = False):
+    """从字节解析notebook，非v4格式的文件总是交给nbformat转换"""
+    if not validate:
+        d = orjson.loads(data) if orjson is not None else json.loads(data)
+        if d.get('nbformat') == 4:
+            # nbformat写出的多行文本是按行拆分的列表，与nbf.read一样合并为字符串
+            return rejoin_lines(nbf.from_dict(d))
+    return nbf.reads(data.decode('utf-8'), as_version=4)
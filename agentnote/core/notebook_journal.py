@@ -0,0 +1,113 @@
+import os
+import json
+import nbformat as nbf
+from typing import Dict, Any
+from .config import config
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('NotebookJournal')
+
+class NotebookJournal:
+    """
+    Notebook操作日志 - 追加记录cell级操作，定期压缩为完整的.ipynb文件
+
+    每条操作带有递增的序号，压缩时把最后一个序号写入notebook元数据 agentnote.journal_seq；
+    写出notebook后、清空日志前崩溃时，重放会跳过已包含在notebook中的操作。
+    """
+
+    def __init__(self, notebook_path: str):
+        self.path = notebook_path + ".journal"
+        self.op_count = 0  # 上次压缩后追加的操作数
+        self.seq = 0  # 最后一条操作的序号，压缩后继续递增
+        self._file = None
+
+    def exists(self) -> bool:
+        """是否存在未压缩的日志（上次压缩被中断）"""
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def append(self, op: Dict[str, Any]):
+        """追加一条操作记录，写入开销只与该操作的大小有关"""
+        with metrics.timer('notebook_io', op='journal_append'):
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self.seq += 1
+            self._file.write(json.dumps({**op, 'seq': self.seq}, ensure_ascii=False) + '\n')
+            self._file.flush()
+            if config.notebook.durability == "every-cell":
+                os.fsync(self._file.fileno())
+        self.op_count += 1
+
+    def sync(self):
+        """把已追加的记录fsync到磁盘"""
+        if self._file is not None and config.notebook.durability != "none":
+            os.fsync(self._file.fileno())
+
+    def replay(self, nb):
+        """把日志中尚未压缩进notebook的操作重放到notebook上"""
+        compacted = self.resume(nb)
+        applied = skipped = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一条记录可能只写了一半，之后的内容都不可信
+                    logger.warning("日志末尾存在不完整的记录，已忽略")
+                    break
+                seq = op.get('seq')
+                if seq is not None and seq <= compacted:
+                    # 压缩写出notebook后、清空日志前被中断，这些操作已在notebook中
+                    skipped += 1
+                    continue
+                self._apply(nb, op)
+                self.seq = max(self.seq, seq or 0)
+                applied += 1
+        logger.info(f"已从日志恢复 {applied} 条操作（跳过已压缩的 {skipped} 条）: {self.path}")
+        return nb
+
+    def resume(self, nb) -> int:
+        """从notebook元数据中记录的序号继续编号，返回该序号"""
+        compacted = nb.metadata.get('agentnote', {}).get('journal_seq', 0)
+        self.seq = max(self.seq, compacted)
+        return compacted
+
+    def stamp(self, nb):
+        """压缩前把最后一条操作的序号写入notebook元数据"""
+        if self.seq:
+            nb.metadata.setdefault('agentnote', {})['journal_seq'] = self.seq
+
+    @staticmethod
+    def _apply(nb, op: Dict[str, Any]):
+        """应用单条操作"""
+        kind = op['op']
+        if kind == 'add_cell':
+            nb.cells.append(nbf.from_dict(op['cell']))
+        elif kind == 'set_source':
+            nb.cells[op['index']].source = op['source']
+        elif kind == 'set_outputs':
+            cell = nb.cells[op['index']]
+            cell.outputs = [nbf.from_dict(o) for o in op['outputs']]
+            cell.execution_count = op.get('execution_count')
+            if 'metadata' in op:
+                cell.metadata = nbf.from_dict(op['metadata'])
+        elif kind == 'set_metadata':
+            nb.cells[op['index']].metadata = nbf.from_dict(op['metadata'])
+        elif kind == 'keep_last':
+            nb.cells = nb.cells[-op['count']:]
+        else:
+            raise ValueError(f"未知的日志操作: {kind}")
+
+    def reset(self):
+        """压缩完成后清空日志"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.op_count = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,156 +1,562 @@
-import os
-import time
-import nbformat as nbf
-from typing import Dict, Any
-from .config import config
-from .notebook_exporter import NotebookExporter
-from .executor import NotebookExecutor
-from ..utils.setup_logger import get_logger
-
-logger = get_logger('NotebookManager')
-
-class NotebookManager:
-    """Notebook管理器"""
-
-    def __init__(self, notebook_path: str = None):
-        if notebook_path:
-            self.notebook_path = notebook_path
-        else:
-            # 根据配置决定是否添加时间戳
-            if config.notebook.add_timestamp:
-                base_name = config.notebook.notebook_name
-                name, ext = os.path.splitext(base_name)
-                timestamp = time.strftime("%Y%m%d_%H%M%S")
-                self.notebook_path = f"environment/{name}_{timestamp}{ext}"
-            else:
-                self.notebook_path = f"environment/{config.notebook.notebook_name}"
-                
-        self._notebook_initialized = False
-        self.executor = NotebookExecutor(self)
-    
-    def initialize_notebook(self):
-        """初始化notebook"""
-        if self._notebook_initialized:
-            return self.load_notebook()
-            
-        # 确保environment目录存在
-        os.makedirs("environment", exist_ok=True)
-        
-        # 如果文件不存在，创建新的notebook
-        if not os.path.exists(self.notebook_path):
-            nb = nbf.v4.new_notebook()
-            # 添加初始标记
-            initial_markdown = f"# OODA循环生成的 Notebook\n\n创建时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n---\n"
-            self.add_markdown_cell(nb, initial_markdown)
-            logger.info(f"创建新的Notebook: {self.notebook_path}")
-        else:
-            # 加载现有notebook
-            nb = self.load_notebook()
-            logger.info(f"加载现有Notebook: {self.notebook_path}")
-        
-        self._notebook_initialized = True
-        return nb
-    
-    def load_notebook(self):
-        """加载现有的notebook"""
-        if not os.path.exists(self.notebook_path):
-            # 如果文件不存在，创建一个新的
-            nb = nbf.v4.new_notebook()
-            self.save_notebook(nb)
-            return nb
-        
-        with open(self.notebook_path, 'r', encoding='utf-8') as f:
-            return nbf.read(f, as_version=4)
-    
-    def save_notebook(self, nb):
-        """保存notebook"""
-        with open(self.notebook_path, 'w', encoding='utf-8') as f:
-            nbf.write(nb, f)
-            f.flush()
-            os.fsync(f.fileno())
-    
-
-    def add_markdown_cell(self, nb, markdown_text: str):
-        """添加markdown cell"""
-        cell = nbf.v4.new_markdown_cell(source=markdown_text)
-        if hasattr(config.notebook, 'markdown_cell_tag'):
-            cell.metadata["tags"] = [config.notebook.markdown_cell_tag]
-        nb.cells.append(cell)
-        # 关键修复：确保添加cell后立即保存，并返回正确的notebook对象
-        self.save_notebook(nb)
-        return nb  # 返回notebook，而不是cell
-
-    def add_code_cell(self, nb, code_text: str):
-        """添加代码cell"""
-        cell = nbf.v4.new_code_cell(source=code_text)
-        if hasattr(config.notebook, 'code_cell_tag'):
-            cell.metadata["tags"] = [config.notebook.code_cell_tag]
-        nb.cells.append(cell)
-        # 关键修复：确保添加cell后立即保存，并返回正确的notebook对象
-        self.save_notebook(nb)
-        return nb  # 返回notebook，而不是cell
-    
-    def get_cell_count(self, nb):
-        """获取cell数量"""
-        return len(nb.cells)
-    
-    def cleanup_old_cells(self, nb):
-        """清理旧的cell以保持数量限制"""
-        if len(nb.cells) <= config.notebook.max_cells:
-            return nb
-        
-        # 只保留最近的cell
-        nb.cells = nb.cells[-config.notebook.max_cells:]
-        self.save_notebook(nb)
-        logger.info(f"已清理cell，当前数量: {len(nb.cells)}")
-        return nb
-    
-    def execute_cell_safely(self, executor, code: str, cell_index: int) -> Dict[str, Any]:
-        """安全执行单个cell代码"""
-        result = executor.execute_single_cell(code, cell_index)
-        
-        # 关键修复：执行后强制重新加载notebook以获取最新输出，然后保存
-        time.sleep(0.5)  # 添加短暂延迟确保文件写入完成
-        nb = self.load_notebook()
-        self.save_notebook(nb)
-        
-        return result
-    
-    def get_notebook_context(self, nb) -> str:
-        """获取notebook的上下文内容"""
-        if not nb.cells:
-            return "Notebook目前为空"
-        
-        # 从配置中获取参数
-        max_cells = config.notebook.context_max_cells
-        include_code = config.notebook.include_code_in_context
-        include_markdown = config.notebook.include_markdown_in_context
-        include_outputs = config.notebook.include_outputs_in_context
-        
-        context = "## 已生成的Notebook内容:\n\n"
-        
-        # 获取最近的cell，基于配置的数量限制
-        recent_cells = nb.cells[-max_cells:] if len(nb.cells) > max_cells else nb.cells
-        
-        for i, cell in enumerate(recent_cells, start=len(nb.cells)-len(recent_cells)+1):
-            if cell.cell_type == 'markdown' and include_markdown:
-                context += f"### Markdown Cell {i}:\n{cell.source}\n\n"
-            elif cell.cell_type == 'code' and include_code:
-                context += f"### Code Cell {i}:\n```python\n{cell.source}\n```\n"
-                
-                # 如果有执行结果且配置为包含输出，也包含进来
-                if include_outputs and hasattr(cell, 'outputs') and cell.outputs:
-                    context += "#### 执行结果:\n"
-                    for output in cell.outputs:
-                        if output.output_type == 'stream':
-                            context += f"输出: {output.text}\n"
-                        elif output.output_type == 'execute_result' and 'text/plain' in output.data:
-                            context += f"结果: {output.data['text/plain']}\n"
-                        elif output.output_type == 'error':
-                            # 特别包含错误信息
-                            context += f"❌ 执行错误: {output.ename}: {output.evalue}\n"
-                            if hasattr(output, 'traceback') and output.traceback:
-                                context += f"错误追踪: {' | '.join(output.traceback)}\n"
-                    context += "\n"
-        
-        return context
\ No newline at end of file
+import os
+import time
+import uuid
+import atexit
+import asyncio
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
+import nbformat as nbf
+from typing import Dict, Any, Optional
+from .config import config
+from .notebook_exporter import NotebookExporter
+from .executor import NotebookExecutor
+from .kernel_executor import KernelExecutor
+from .dataflow import CellDependencyGraph
+from .snapshot import WorkspaceTracker
+from .notebook_journal import NotebookJournal
+from .output_spill import OutputSpiller
+from .blob_store import BlobStore
+from . import notebook_io
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('NotebookManager')
+
+# 当前任务的延迟检查点；流式生成时并行执行的cell通过asyncio任务继承
+_active_checkpoint: contextvars.ContextVar[Optional['LazyCheckpoint']] = \
+    contextvars.ContextVar('agentnote_checkpoint', default=None)
+
+# 启用了后台写盘的manager，进程退出时统一写盘；弱引用不会让结束的任务常驻内存
+_flushing_managers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for manager in list(_flushing_managers):
+        manager.flush()
+
+class NotebookManager:
+    """Notebook管理器"""
+    
+    # 本进程中已分配的notebook路径，避免并发任务在同一秒内生成同名文件
+    _claimed_paths = set()
+    _claim_lock = threading.Lock()
+
+    def __init__(self, notebook_path: str = None, directory: str = None):
+        if notebook_path:
+            self.notebook_path = notebook_path
+        else:
+            # 未指定目录时使用配置的目录（同一进程中并发的任务应各自指定目录）
+            directory = directory or config.notebook.directory
+            # 根据配置决定是否添加时间戳
+            if config.notebook.add_timestamp:
+                base_name = config.notebook.notebook_name
+                name, ext = os.path.splitext(base_name)
+                timestamp = time.strftime("%Y%m%d_%H%M%S")
+                self.notebook_path = self._claim_path(os.path.join(directory, f"{name}_{timestamp}"), ext)
+            else:
+                self.notebook_path = os.path.join(directory, config.notebook.notebook_name)
+                
+        self._notebook_initialized = False
+        self.nb = None  # 当前内存中的notebook
+        self._dirty = False  # 内存中的notebook是否有尚未写盘的修改
+        self._lock = threading.RLock()  # 保护内存中notebook的序列化
+        self._write_lock = threading.RLock()  # 保证写盘按序列化顺序进行
+        self.journal = NotebookJournal(self.notebook_path) if config.notebook.journal else None
+        self.spiller = OutputSpiller.from_config(self.notebook_path)
+        self.blobs = BlobStore.from_config(self.notebook_path)
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+        self.dependency_graph = CellDependencyGraph()
+        self.executor = self._create_executor()
+        self.workspace = WorkspaceTracker(os.path.dirname(self.notebook_path) or '.',
+                                          exclude=(self.notebook_path,))
+    
+    @classmethod
+    def _claim_path(cls, stem: str, ext: str) -> str:
+        """分配一个未被占用的notebook路径，冲突时追加序号"""
+        with cls._claim_lock:
+            path, n = f"{stem}{ext}", 1
+            while path in cls._claimed_paths or os.path.exists(path):
+                path, n = f"{stem}_{n}{ext}", n + 1
+            cls._claimed_paths.add(path)
+            return path
+    
+    def _create_executor(self):
+        """根据配置创建执行器"""
+        if config.executor.backend == "kernel":
+            return KernelExecutor(self)
+        return NotebookExecutor(self)
+    
+    def close(self):
+        """写出完整的notebook并释放执行器资源"""
+        self._stop_flusher.set()
+        _flushing_managers.discard(self)
+        # 最终的notebook通过nbformat校验并按规范格式写出
+        self.compact(validate=True)
+        if self.nb is not None:
+            removed = self.blobs.collect_garbage(self.nb)
+            if removed:
+                logger.info(f"已删除 {removed} 个不再被引用的输出文件")
+        if self.journal is not None:
+            self.journal.close()
+        self.workspace.close()
+        self.executor.shutdown()
+    
+    def checkpoint(self) -> str:
+        """记录内核状态和工作目录文件，返回检查点标识"""
+        if not config.executor.enable_snapshots:
+            return None
+        key = uuid.uuid4().hex[:12]
+        self.executor.checkpoint(key)
+        os.makedirs(self.workspace.root, exist_ok=True)
+        skipped = self.workspace.checkpoint(key)
+        if skipped:
+            logger.warning(f"以下文件过大未备份，回滚时无法恢复: {skipped}")
+        return key
+    
+    def lazy_checkpoint(self) -> 'LazyCheckpoint':
+        """创建在第一次执行代码前才真正记录状态的检查点"""
+        return LazyCheckpoint(self)
+    
+    def rollback(self, key: str, nb, start_cell_index: int):
+        """
+        回滚到检查点，并把检查点之后的代码cell标记为已回滚
+
+        未启用快照时key为None，内核和文件无法恢复，但失败尝试留下的cell仍要标记，
+        否则规则评估和依赖图会把它们当作有效的cell
+        """
+        if key is not None:
+            self.executor.rollback(key)
+            unrestorable = self.workspace.rollback(key)
+            if unrestorable:
+                logger.warning(f"以下文件无法恢复: {unrestorable}")
+            logger.info(f"已回滚到检查点 {key}")
+        self.mark_rolled_back(nb, start_cell_index)
+    
+    def mark_rolled_back(self, nb, start_cell_index: int):
+        """把指定位置之后的代码cell标记为已回滚"""
+        ops = []
+        for i in range(start_cell_index, len(nb.cells)):
+            cell = nb.cells[i]
+            if cell.cell_type == 'code':
+                cell.metadata.setdefault('agentnote', {})['rolled_back'] = True
+                ops.append({'op': 'set_metadata', 'index': i, 'metadata': cell.metadata})
+        if ops:
+            self.save_notebook(nb, *ops)
+    
+    def release(self, key: str):
+        """释放检查点"""
+        if key is None:
+            return
+        self.executor.discard(key)
+        self.workspace.discard(key)
+    
+    def initialize_notebook(self):
+        """初始化notebook"""
+        if self._notebook_initialized:
+            return self.load_notebook()
+            
+        # 确保notebook所在目录存在
+        os.makedirs(os.path.dirname(self.notebook_path) or '.', exist_ok=True)
+        
+        if self.journal is not None and self.journal.exists():
+            # 上次压缩被中断：以磁盘上的notebook为基础重放操作日志
+            nb = self._read_notebook() if os.path.exists(self.notebook_path) else nbf.v4.new_notebook()
+            self.journal.replay(nb)
+            with self._lock:
+                self.nb = nb
+                self._dirty = True
+            self.compact()
+            logger.info(f"从操作日志恢复Notebook: {self.notebook_path}")
+        # 如果文件不存在，创建新的notebook
+        elif not os.path.exists(self.notebook_path):
+            nb = nbf.v4.new_notebook()
+            # 添加初始标记
+            initial_markdown = f"# OODA循环生成的 Notebook\n\n创建时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n---\n"
+            self.add_markdown_cell(nb, initial_markdown)
+            logger.info(f"创建新的Notebook: {self.notebook_path}")
+        else:
+            # 加载现有notebook
+            nb = self.load_notebook()
+            logger.info(f"加载现有Notebook: {self.notebook_path}")
+        
+        if self.journal is not None:
+            # 之后追加的操作序号需要大于notebook中已压缩的序号
+            self.journal.resume(nb)
+        self._notebook_initialized = True
+        self.nb = nb
+        return nb
+    
+    def load_notebook(self, from_disk: bool = False):
+        """加载notebook - 默认返回内存中的notebook，from_disk为True时重新从磁盘读取"""
+        if self.nb is not None and not from_disk:
+            return self.nb
+        
+        if not os.path.exists(self.notebook_path):
+            # 如果文件不存在，创建一个新的
+            nb = nbf.v4.new_notebook()
+            self.save_notebook(nb)
+            self.nb = nb
+            return nb
+        
+        self.nb = self._read_notebook()
+        return self.nb
+    
+    def _read_notebook(self):
+        """从磁盘读取notebook"""
+        with metrics.timer('notebook_io', op='read', path=self.notebook_path), open(self.notebook_path, 'rb') as f:
+            return notebook_io.loads(f.read(), validate=not config.notebook.fast_io)
+    
+    def save_notebook(self, nb, *ops):
+        """
+        保存notebook
+        
+        启用操作日志时只追加ops描述的cell级修改，定期压缩为完整文件；
+        否则按配置的持久化级别立即写盘，或标记为待写入由后台定时写出
+        """
+        with self._lock:
+            self.nb = nb
+            self._dirty = True
+        
+        if self.journal is not None:
+            if not ops:
+                # 无法用cell级操作描述的修改，直接压缩为完整文件
+                self.compact()
+                return
+            with self._lock:
+                for op in ops:
+                    self.journal.append(op)
+            if self.journal.op_count >= config.notebook.journal_compact_every:
+                self.compact()
+            return
+        
+        durability = config.notebook.durability
+        if durability == "every-cell":
+            self.flush()
+        elif durability == "batch":
+            self._ensure_flusher()
+    
+    def flush(self):
+        """持久化内存中的修改（阶段结束、检查点和关闭时调用）"""
+        if self.journal is not None:
+            # 修改已记录在日志中，只需确保日志落盘
+            self.journal.sync()
+            return
+        self._write_notebook()
+    
+    def compact(self, validate: bool = False):
+        """把完整的notebook写入磁盘，并清空操作日志；validate为True时即使没有修改也重新校验写出"""
+        with self._write_lock, self._lock:
+            if self.journal is not None and self.nb is not None:
+                self.journal.stamp(self.nb)
+            self._write_notebook(validate)
+            if self.journal is not None:
+                self.journal.reset()
+    
+    def _write_notebook(self, validate: bool = False):
+        """
+        序列化内存中的notebook，通过临时文件原子替换，避免写入中途崩溃损坏文件
+        
+        频繁的中间写入默认走快速路径（不经过nbformat校验），validate为True或关闭fast_io时完整校验
+        """
+        with self._write_lock:
+            with self._lock:
+                if self.nb is None or not (self._dirty or validate):
+                    return
+                start = time.perf_counter()
+                data = notebook_io.dumps(self.nb, validate=validate or not config.notebook.fast_io)
+                self._dirty = False
+            
+            tmp_path = self.notebook_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if config.notebook.durability != "none":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.notebook_path)
+            metrics.add_time('notebook_io', time.perf_counter() - start, op='write', bytes=len(data))
+    
+    def _ensure_flusher(self):
+        """启动后台定时写盘线程"""
+        if self._flusher is not None:
+            return
+        # 线程只持有弱引用，manager被回收后线程随之退出
+        self._flusher = threading.Thread(target=_flush_loop, args=(weakref.ref(self), self._stop_flusher),
+                                         name='NotebookFlusher', daemon=True)
+        self._flusher.start()
+        _flushing_managers.add(self)
+
+    def add_markdown_cell(self, nb, markdown_text: str):
+        """添加markdown cell"""
+        cell = nbf.v4.new_markdown_cell(source=markdown_text)
+        if hasattr(config.notebook, 'markdown_cell_tag'):
+            cell.metadata["tags"] = [config.notebook.markdown_cell_tag]
+        with self._lock:
+            nb.cells.append(cell)
+        metrics.count('cells')
+        # 关键修复：确保添加cell后立即保存，并返回正确的notebook对象
+        self.save_notebook(nb, {'op': 'add_cell', 'index': len(nb.cells) - 1, 'cell': cell})
+        return nb  # 返回notebook，而不是cell
+
+    def add_code_cell(self, nb, code_text: str):
+        """添加代码cell"""
+        cell = nbf.v4.new_code_cell(source=code_text)
+        if hasattr(config.notebook, 'code_cell_tag'):
+            cell.metadata["tags"] = [config.notebook.code_cell_tag]
+        with self._lock:
+            nb.cells.append(cell)
+        metrics.count('cells')
+        # 关键修复：确保添加cell后立即保存，并返回正确的notebook对象
+        self.save_notebook(nb, {'op': 'add_cell', 'index': len(nb.cells) - 1, 'cell': cell})
+        return nb  # 返回notebook，而不是cell
+    
+    def update_markdown_cell(self, nb, cell_index: int, markdown_text: str):
+        """修改已有markdown cell的内容（流式生成时逐段更新）"""
+        with self._lock:
+            nb.cells[cell_index].source = markdown_text
+        self.save_notebook(nb, {'op': 'set_source', 'index': cell_index, 'source': markdown_text})
+        return nb
+    
+    def _outputs_op(self, cell_index: int) -> Dict[str, Any]:
+        """描述某个cell执行结果的日志操作（元数据中记录了转存输出的引用）"""
+        cell = self.nb.cells[cell_index]
+        return {'op': 'set_outputs', 'index': cell_index, 'outputs': cell.outputs,
+                'execution_count': cell.execution_count, 'metadata': cell.metadata}
+    
+    def _externalize_outputs(self, cell) -> bool:
+        """把新执行结果中的二进制输出移入存储、过大的文本输出转存到文件，返回cell是否被修改"""
+        moved = self.blobs.externalize(cell)
+        spilled = self.spiller.spill(cell)
+        return moved or spilled
+    
+    def _store_outputs(self, *cell_indices: int):
+        """移出常驻内核写入的二进制和过大输出，再保存这些cell的执行结果"""
+        for i in cell_indices:
+            self._externalize_outputs(self.nb.cells[i])
+        self.save_notebook(self.nb, *[self._outputs_op(i) for i in cell_indices])
+    
+    def _reload_outputs(self):
+        """nbconvert把输出写回了磁盘，重新加载并移出其中的二进制和过大输出"""
+        nb = self.load_notebook(from_disk=True)
+        if any([self._externalize_outputs(cell) for cell in nb.cells]):
+            self.save_notebook(nb)
+    
+    def update_code_cell(self, nb, cell_index: int, code_text: str) -> Dict[int, Dict[str, Any]]:
+        """修改已有代码cell，只重新执行受其影响的下游cell，其余cell复用已有输出"""
+        old_node = self.dependency_graph.build(nb).nodes.get(cell_index)
+        if old_node is None:
+            raise ValueError(f"cell {cell_index} 不是代码cell")
+        
+        nb.cells[cell_index].source = code_text
+        self.save_notebook(nb, {'op': 'set_source', 'index': cell_index, 'source': code_text})
+        affected = self.dependency_graph.build(nb).downstream(cell_index, old_node.defines)
+        logger.info(f"cell {cell_index} 已修改，需重新执行: {affected}")
+        return self.rerun_cells(nb, affected)
+    
+    def rerun_cells(self, nb, cell_indices) -> Dict[int, Dict[str, Any]]:
+        """按顺序重新执行指定的代码cell"""
+        self.nb = nb
+        results = {}
+        if not self.executor.in_memory:
+            # nbconvert后端只能整体执行，一次执行即可覆盖所有cell
+            if cell_indices:
+                last = cell_indices[-1]
+                results[last] = self.execute_cell_safely(self.executor, nb.cells[last].source, last)
+            return results
+        
+        _ensure_checkpoint()
+        for i in cell_indices:
+            with metrics.timer('execution', cell_index=i, rerun=True):
+                results[i] = self.executor.execute_single_cell(nb.cells[i].source, i)
+        self._store_outputs(*cell_indices)
+        return results
+    
+    def get_cell_count(self, nb):
+        """获取cell数量"""
+        return len(nb.cells)
+    
+    def cleanup_old_cells(self, nb):
+        """清理旧的cell以保持数量限制"""
+        if len(nb.cells) <= config.notebook.max_cells:
+            return nb
+        
+        # 只保留最近的cell
+        nb.cells = nb.cells[-config.notebook.max_cells:]
+        self.save_notebook(nb, {'op': 'keep_last', 'count': config.notebook.max_cells})
+        logger.info(f"已清理cell，当前数量: {len(nb.cells)}")
+        return nb
+    
+    def execute_cell_safely(self, executor, code: str, cell_index: int) -> Dict[str, Any]:
+        """安全执行单个cell代码"""
+        _ensure_checkpoint()
+        with metrics.timer('execution', cell_index=cell_index) as span:
+            result = executor.execute_single_cell(code, cell_index)
+            span.set(success=result.get('success'))
+        
+        if executor.in_memory:
+            # 常驻内核已把输出写入内存中的notebook，直接保存
+            self._store_outputs(cell_index)
+        else:
+            # nbconvert把输出写回了磁盘，重新加载获取最新输出
+            self._reload_outputs()
+        
+        return result
+    
+    async def aexecute_cell_safely(self, executor, code: str, cell_index: int) -> Dict[str, Any]:
+        """异步执行单个cell代码，保存和重新加载notebook在线程池中进行"""
+        checkpoint = _active_checkpoint.get()
+        if checkpoint is not None and not checkpoint.taken:
+            await asyncio.to_thread(checkpoint.ensure)
+        with metrics.timer('execution', cell_index=cell_index) as span:
+            result = await executor.aexecute_single_cell(code, cell_index)
+            span.set(success=result.get('success'))
+        
+        if executor.in_memory:
+            await asyncio.to_thread(self._store_outputs, cell_index)
+        else:
+            await asyncio.to_thread(self._reload_outputs)
+        
+        return result
+    
+    # 以下异步接口把可能阻塞的文件I/O和内核操作放到线程池中执行
+    
+    async def aadd_markdown_cell(self, nb, markdown_text: str):
+        """异步添加markdown cell"""
+        return await asyncio.to_thread(self.add_markdown_cell, nb, markdown_text)
+    
+    async def aadd_code_cell(self, nb, code_text: str):
+        """异步添加代码cell"""
+        return await asyncio.to_thread(self.add_code_cell, nb, code_text)
+    
+    async def aupdate_markdown_cell(self, nb, cell_index: int, markdown_text: str):
+        """异步修改markdown cell"""
+        return await asyncio.to_thread(self.update_markdown_cell, nb, cell_index, markdown_text)
+    
+    async def aflush(self):
+        """异步持久化内存中的修改"""
+        await asyncio.to_thread(self.flush)
+    
+    async def aclose(self):
+        """异步写出notebook并释放执行器资源"""
+        await asyncio.to_thread(self.close)
+    
+    async def acheckpoint(self) -> str:
+        """异步创建检查点"""
+        return await asyncio.to_thread(self.checkpoint)
+    
+    async def arollback(self, key: str, nb, start_cell_index: int):
+        """异步回滚到检查点"""
+        await asyncio.to_thread(self.rollback, key, nb, start_cell_index)
+    
+    async def arelease(self, key: str):
+        """异步释放检查点"""
+        await asyncio.to_thread(self.release, key)
+    
+    def get_notebook_context(self, nb) -> str:
+        """获取notebook的上下文内容"""
+        if not nb.cells:
+            return "Notebook目前为空"
+        
+        # 从配置中获取参数
+        max_cells = config.notebook.context_max_cells
+        include_code = config.notebook.include_code_in_context
+        include_markdown = config.notebook.include_markdown_in_context
+        include_outputs = config.notebook.include_outputs_in_context
+        
+        context = "## 已生成的Notebook内容:\n\n"
+        
+        # 获取最近的cell，基于配置的数量限制
+        recent_cells = nb.cells[-max_cells:] if len(nb.cells) > max_cells else nb.cells
+        
+        for i, cell in enumerate(recent_cells, start=len(nb.cells)-len(recent_cells)+1):
+            if cell.cell_type == 'markdown' and include_markdown:
+                context += f"### Markdown Cell {i}:\n{cell.source}\n\n"
+            elif cell.cell_type == 'code' and include_code:
+                context += f"### Code Cell {i}:\n```python\n{cell.source}\n```\n"
+                
+                # 如果有执行结果且配置为包含输出，也包含进来
+                if include_outputs and hasattr(cell, 'outputs') and cell.outputs:
+                    context += "#### 执行结果:\n"
+                    for output in cell.outputs:
+                        if output.output_type == 'stream':
+                            context += f"输出: {output.text}\n"
+                        elif output.output_type == 'execute_result' and 'text/plain' in output.data:
+                            context += f"结果: {output.data['text/plain']}\n"
+                        elif output.output_type == 'error':
+                            # 特别包含错误信息
+                            context += f"❌ 执行错误: {output.ename}: {output.evalue}\n"
+                            if hasattr(output, 'traceback') and output.traceback:
+                                context += f"错误追踪: {' | '.join(output.traceback)}\n"
+                    context += "\n"
+        
+        return context
+
+
+def _flush_loop(manager_ref, stop: threading.Event):
+    while not stop.wait(config.notebook.flush_interval):
+        manager = manager_ref()
+        if manager is None:
+            return
+        try:
+            manager.flush()
+        except Exception as e:
+            logger.warning(f"后台保存notebook失败: {e}")
+        del manager
+
+
+class LazyCheckpoint:
+    """
+    延迟创建的检查点 - 任务第一次执行代码前才记录内核状态和工作目录文件
+
+    检查点需要复制整个内核命名空间并扫描工作目录，不执行代码的任务（指挥官、反思等）
+    不会触发它；尚未创建时回滚只需把失败尝试留下的cell标记为已回滚。
+    """
+
+    def __init__(self, manager: NotebookManager):
+        self.manager = manager
+        self.key = None
+        self.taken = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """在代码块内执行代码前先创建本检查点"""
+        token = _active_checkpoint.set(self)
+        try:
+            yield self
+        finally:
+            _active_checkpoint.reset(token)
+
+    def ensure(self):
+        with self._lock:
+            if not self.taken:
+                self.key = self.manager.checkpoint()
+                self.taken = True
+
+    def rollback(self, nb, start_cell_index: int):
+        if self.taken:
+            self.manager.rollback(self.key, nb, start_cell_index)
+        else:
+            # 还没有执行过代码，内核和文件都未改变
+            self.manager.mark_rolled_back(nb, start_cell_index)
+
+    def release(self):
+        with self._lock:
+            if self.taken:
+                self.manager.release(self.key)
+            self.key, self.taken = None, False
+
+    async def arollback(self, nb, start_cell_index: int):
+        await asyncio.to_thread(self.rollback, nb, start_cell_index)
+
+    async def arelease(self):
+        await asyncio.to_thread(self.release)
+
+
+def _ensure_checkpoint():
+    checkpoint = _active_checkpoint.get()
+    if checkpoint is not None:
+        checkpoint.ensure()
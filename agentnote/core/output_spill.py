@@ -0,0 +1,149 @@
+import os
+import copy
+import mmap
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from .config import config
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('OutputSpill')
+
+
+class OutputSpiller:
+    """
+    大输出转存 - 超过阈值的文本输出写入notebook旁的转存文件，cell中只保留首尾预览和引用
+
+    转存文件放在notebook所在目录下的隐藏目录中（工作目录跟踪和产物检查都会跳过隐藏目录）。
+    引用记录在cell元数据 agentnote.spilled 中（stream输出不允许附加字段），
+    读取时通过mmap按字节范围取出，只读取部分内容时不需要把整个文件载入内存。
+    """
+
+    def __init__(self, notebook_path: str, threshold: int, preview_lines: int, preview_chars: int):
+        self.root = os.path.dirname(os.path.abspath(notebook_path))
+        self.directory = os.path.join(self.root, f".{os.path.basename(notebook_path)}.outputs")
+        self.threshold = threshold
+        self.preview_lines = preview_lines
+        self.preview_chars = preview_chars
+
+    @classmethod
+    def from_config(cls, notebook_path: str) -> 'OutputSpiller':
+        notebook = config.notebook
+        return cls(notebook_path, notebook.spill_threshold, notebook.spill_preview_lines,
+                   notebook.spill_preview_chars)
+
+    def spill(self, cell) -> bool:
+        """转存cell中过大的输出，返回cell是否被修改"""
+        if self.threshold <= 0 or cell.cell_type != 'code':
+            return False
+        previous = {(ref['output'], ref['key']): ref for ref in spilled_refs(cell)}
+        refs = []
+        for i, output in enumerate(cell.get('outputs', [])):
+            for key, text in _text_fields(output):
+                ref = previous.get((i, key))
+                if ref is not None and _marker(ref) in text:
+                    # 已经是预览（如nbconvert重新加载后未变化的cell）
+                    refs.append(ref)
+                    continue
+                data = text.encode('utf-8')
+                if len(data) <= self.threshold:
+                    continue
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{uuid.uuid4().hex[:12]}.txt")
+                with metrics.timer('notebook_io', op='spill', bytes=len(data)), open(path, 'wb') as f:
+                    f.write(data)
+                ref = {'output': i, 'key': key, 'path': os.path.relpath(path, self.root), 'bytes': len(data)}
+                _set_text(output, key, self._preview(text, ref))
+                refs.append(ref)
+                metrics.count('outputs_spilled')
+
+        # 重新执行后不再被引用的转存文件
+        kept = {ref['path'] for ref in refs}
+        for ref in previous.values():
+            if ref['path'] not in kept:
+                self._remove(ref)
+
+        metadata = cell.metadata.get('agentnote', {})
+        if refs:
+            cell.metadata.setdefault('agentnote', {})['spilled'] = refs
+        elif 'spilled' in metadata:
+            del metadata['spilled']
+        else:
+            return False
+        return True
+
+    def _preview(self, text: str, ref: Dict[str, Any]) -> str:
+        """保留前后各 preview_lines 行（每段不超过 preview_chars 个字符）"""
+        lines = text.splitlines(keepends=True)
+        head = ''.join(lines[:self.preview_lines])[:self.preview_chars]
+        tail = ''.join(lines[-self.preview_lines:])[-self.preview_chars:]
+        if not head.endswith('\n'):
+            head += '\n'
+        return f"{head}...\n{_marker(ref)}\n...\n{tail}"
+
+    def read(self, ref: Dict[str, Any], start: int = 0, end: Optional[int] = None) -> Optional[str]:
+        """读取转存的输出（按字节范围），文件不存在时返回None"""
+        path = os.path.join(self.root, ref['path'])
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ''
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    # 截断处可能落在多字节字符中间
+                    return m[start:end].decode('utf-8', errors='ignore')
+        except FileNotFoundError:
+            logger.warning(f"转存的输出文件不存在: {path}")
+            return None
+
+    def restore(self, cell):
+        """返回输出还原为完整内容的cell副本，未转存的cell原样返回"""
+        refs = spilled_refs(cell)
+        if not refs:
+            return cell
+        cell = copy.deepcopy(cell)
+        for ref in refs:
+            text = self.read(ref)
+            if text is not None and ref['output'] < len(cell.outputs):
+                _set_text(cell.outputs[ref['output']], ref['key'], text)
+        del cell.metadata['agentnote']['spilled']
+        if not cell.metadata['agentnote']:
+            del cell.metadata['agentnote']
+        return cell
+
+    def restore_notebook(self, nb):
+        """返回所有转存输出都还原后的notebook副本（导出完整notebook时使用）"""
+        restored = copy.copy(nb)
+        restored.cells = [self.restore(cell) for cell in nb.cells]
+        return restored
+
+    def _remove(self, ref: Dict[str, Any]):
+        try:
+            os.remove(os.path.join(self.root, ref['path']))
+        except FileNotFoundError:
+            pass
+
+
+def spilled_refs(cell) -> List[Dict[str, Any]]:
+    """cell中已转存输出的引用"""
+    return list(cell.get('metadata', {}).get('agentnote', {}).get('spilled', []))
+
+
+def _marker(ref: Dict[str, Any]) -> str:
+    return f"[输出过长，完整内容 ({ref['bytes']} 字节) 已转存到 {ref['path']}]"
+
+
+def _text_fields(output) -> List[Tuple[str, str]]:
+    """输出中可以转存的文本字段: stream的text，以及执行结果和显示数据中的文本类型"""
+    if output.output_type == 'stream':
+        return [('text', output.text)]
+    if output.output_type in ('execute_result', 'display_data'):
+        return [(key, value) for key, value in output.get('data', {}).items()
+                if key.startswith('text/') and isinstance(value, str)]
+    return []
+
+
+def _set_text(output, key: str, text: str):
+    if key == 'text':
+        output.text = text
+    else:
+        output.data[key] = text
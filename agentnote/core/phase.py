@@ -1,207 +1,317 @@
-import time
-from enum import Enum
-from typing import Dict, Any, List
-from .task import Task, TaskType
-from .context import Context
-from .output import OutputType
-from .evaluator import PhaseEvaluator
-from ..agents.observe_agent import ObserveAgent
-from ..agents.orient_agent import OrientAgent
-from ..agents.decision_agent import DecisionAgent
-from ..agents.action_agent import ActionAgent
-from ..utils.setup_logger import get_logger
-
-logger = get_logger('Phase')
-
-class PhaseType(Enum):
-    OBSERVE = "observe"
-    ORIENT = "orient"
-    DECISION = "decision"
-    ACTION = "action"
-
-class Phase:
-    """OODA阶段"""
-    
-    def __init__(self, 
-                 phase_type: PhaseType, 
-                 context: Context, 
-                 deepseek_client, 
-                 phase_evaluator: PhaseEvaluator, 
-                 notebook_manager):
-        self.phase_type = phase_type
-        self.context = context
-        self.client = deepseek_client
-        self.phase_evaluator = phase_evaluator
-        
-        self.goal = self._get_phase_goal(phase_type)
-        self.cell_context = ""  # 存储该阶段的所有cell内容
-        
-        # 关键修复：使用共享的NotebookManager创建智能体
-        if phase_type == PhaseType.OBSERVE:
-            self.agent = ObserveAgent(deepseek_client.api_key, notebook_manager)
-        elif phase_type == PhaseType.ORIENT:
-            self.agent = OrientAgent(deepseek_client.api_key, notebook_manager)
-        elif phase_type == PhaseType.DECISION:
-            self.agent = DecisionAgent(deepseek_client.api_key, notebook_manager)
-        elif phase_type == PhaseType.ACTION:
-            self.agent = ActionAgent(deepseek_client.api_key, notebook_manager)
-        else:
-            raise TypeError('不存在此类型的agent')
-        
-        self.tasks = []
-        self.completed = False
-        self.success = False
-    
-    def _get_phase_goal(self, phase_type: PhaseType) -> str:
-        """获取阶段目标"""
-        phase_goals = {
-            PhaseType.OBSERVE: "收集环境信息和数据，了解当前状况",
-            PhaseType.ORIENT: "分析理解收集到的信息，形成对情况的认知",
-            PhaseType.DECISION: "基于理解做出决策，制定行动计划",
-            PhaseType.ACTION: "执行具体的行动，实现目标"
-        }
-        return phase_goals.get(phase_type, "完成阶段任务")
-    
-    def execute(self, notebook):
-        """执行阶段 - 修复返回逻辑"""
-        logger.info(f"执行 {self.phase_type.value} 阶段")
-        
-        # 添加阶段标题
-        phase_titles = {
-            PhaseType.OBSERVE: "🔍 观察阶段",
-            PhaseType.ORIENT: "🧠 理解阶段", 
-            PhaseType.DECISION: "🎯 决策阶段",
-            PhaseType.ACTION: "⚡ 行动阶段"
-        }
-        
-        notebook_manager = self.agent.manager
-        # 关键修复：获取添加标题后的更新notebook
-        notebook = notebook_manager.add_markdown_cell(notebook, f"## {phase_titles[self.phase_type]}")
-        
-        # 记录阶段开始的cell索引
-        start_cell_index = len(notebook.cells)
-        
-        # 新增：更新阶段上下文
-        phase_context = {
-            'phase_type': self.phase_type.value,
-            'goal': self.goal,
-            'start_cell_index': start_cell_index
-        }
-        self.context.set_phase_context(self.phase_type.value, phase_context)
-        
-        max_retries = 3
-        for attempt in range(max_retries):
-            # 1. 指挥官生成任务
-            task_description = self._generate_task_description()
-            task = Task(TaskType.COMMANDER_TASK, task_description, self.context, self.agent, self.goal)
-            task_success, notebook = task.execute(notebook)  # 接收更新后的notebook
-            
-            if not task_success:
-                logger.warning(f"指挥官任务失败，重试 {attempt + 1}/{max_retries}")
-                continue
-            
-            # 关键修改：获取指挥官生成的任务描述，用于后续的智能体任务
-            commander_generated_description = self._extract_commander_task_description(task)
-            
-            # 2. 阶段智能体执行任务
-            agent_task = Task(TaskType.AGENT_TASK, commander_generated_description, self.context, self.agent, self.goal)
-            agent_success, notebook = agent_task.execute(notebook)  # 接收更新后的notebook
-            
-            if not agent_success:
-                logger.warning(f"智能体任务失败，重试 {attempt + 1}/{max_retries}")
-                continue
-            
-            # 3. 指挥官反思任务
-            reflection_task = Task(TaskType.REFLECTION_TASK, commander_generated_description, self.context, self.agent, self.goal)
-            reflection_success, notebook = reflection_task.execute(notebook)  # 接收更新后的notebook
-            
-            if not reflection_success:
-                logger.warning(f"反思任务失败，重试 {attempt + 1}/{max_retries}")
-                continue
-            
-            # 收集该阶段的所有cell内容作为上下文
-            end_cell_index = len(notebook.cells)
-            self.cell_context = self._collect_cell_context(notebook, start_cell_index, end_cell_index)
-            
-            # 新增：更新阶段完成状态到上下文
-            phase_context.update({
-                'completed': True,
-                'success': True,
-                'end_cell_index': end_cell_index,
-                'cell_context': self.cell_context
-            })
-            self.context.set_phase_context(self.phase_type.value, phase_context)
-            
-            # 评估阶段是否成功 - 使用注入的评估器，并传入goal和context
-            phase_success, evaluate_response = self.phase_evaluator.evaluate_phase_success(
-                self.phase_type.value, 
-                self.context.get_all(),  # 现在包含完整的上下文信息
-                self.goal,
-                self.cell_context
-            )
-            
-            if phase_success:
-                logger.info(f"✅ {self.phase_type.value} 阶段执行成功")
-                self.success = True
-                self.completed = True
-                return True, notebook
-            else:
-                logger.warning(f"🔄 {self.phase_type.value} 阶段未完成，重试 {attempt + 1}/{max_retries}")
-                
-            notebook_manager.add_markdown_cell(notebook, evaluate_response + "\n---\n## 阶段评估结果: " + '成功' if phase_success else '失败')
-        
-        logger.warning(f"❌ {self.phase_type.value} 阶段执行失败")
-        return False, notebook
-
-    def _extract_commander_task_description(self, commander_task):
-        """从指挥官任务输出中提取生成的任务描述"""
-        # 优先从markdown输出中提取任务描述
-        for output in commander_task.outputs:
-            if output.output_type == OutputType.MARKDOWN:
-                # 提取任务描述的关键部分
-                content = output.content
-                # 可以添加更复杂的解析逻辑，这里简单返回整个内容
-                return content
-        
-        # 如果没有markdown输出，检查是否有其他输出
-        if commander_task.outputs:
-            # 如果有其他类型的输出，使用第一个输出的内容
-            return commander_task.outputs[0].content
-        
-        # 如果没有任何输出，回退到原始描述
-        return commander_task.description
-    
-    def _collect_cell_context(self, notebook, start_index: int, end_index: int) -> str:
-        """收集指定范围内的cell内容作为上下文"""
-        context_parts = [f"阶段目标: {self.goal}"]
-        for i in range(start_index, min(end_index, len(notebook.cells))):
-            cell = notebook.cells[i]
-            if cell.cell_type == 'markdown':
-                context_parts.append(f"Markdown Cell {i}: {cell.source}")
-            elif cell.cell_type == 'code':
-                context_parts.append(f"Code Cell {i}: {cell.source}")
-        
-        return "\n".join(context_parts)
-    
-    def _generate_task_description(self) -> str:
-        """生成任务描述"""
-        phase_descriptions = {
-            PhaseType.OBSERVE: "观察环境，收集相关信息",
-            PhaseType.ORIENT: "分析理解收集到的信息", 
-            PhaseType.DECISION: "基于理解做出决策",
-            PhaseType.ACTION: "执行具体的行动"
-        }
-        
-        mission = self.context.get('mission', '未知任务')
-        return f"任务: {mission}\n阶段: {self.phase_type.value}\n要求: {phase_descriptions[self.phase_type]}\n目标: {self.goal}"
-    
-    def get_status(self) -> Dict[str, Any]:
-        """获取阶段状态"""
-        return {
-            'phase_type': self.phase_type.value,
-            'goal': self.goal,
-            'completed': self.completed,
-            'success': self.success,
-            'tasks_completed': len([t for t in self.tasks if t.completed]),
-            'cell_context_length': len(self.cell_context) if self.cell_context else 0
+import time
+from enum import Enum
+from typing import Dict, Any, List
+from .task import Task, TaskType
+from .context import Context
+from .output import OutputType
+from .evaluator import PhaseEvaluator
+from .async_utils import run_sync
+from .registry import get_registry
+from .metrics import metrics
+from .config import config
+from .ledger import ledger_scope, scope_context, is_degraded
+from .tracing import span
+from ..agents.observe_agent import ObserveAgent
+from ..agents.orient_agent import OrientAgent
+from ..agents.decision_agent import DecisionAgent
+from ..agents.action_agent import ActionAgent
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('Phase')
+
+class PhaseType(Enum):
+    OBSERVE = "observe"
+    ORIENT = "orient"
+    DECISION = "decision"
+    ACTION = "action"
+
+class Phase:
+    """OODA阶段"""
+    
+    def __init__(self, 
+                 phase_type: PhaseType, 
+                 context: Context, 
+                 deepseek_client, 
+                 phase_evaluator: PhaseEvaluator, 
+                 notebook_manager):
+        self.phase_type = phase_type
+        self.context = context
+        self.client = deepseek_client
+        self.phase_evaluator = phase_evaluator
+        
+        self.goal = self._get_phase_goal(phase_type)
+        self.cell_context = ""  # 存储该阶段的所有cell内容
+        
+        # 关键修复：使用共享的NotebookManager创建智能体
+        # 同一任务的各个循环复用注册表中的智能体
+        agent_classes = {
+            PhaseType.OBSERVE: ObserveAgent,
+            PhaseType.ORIENT: OrientAgent,
+            PhaseType.DECISION: DecisionAgent,
+            PhaseType.ACTION: ActionAgent
+        }
+        if phase_type not in agent_classes:
+            raise TypeError('不存在此类型的agent')
+        self.agent = get_registry().get_agent(agent_classes[phase_type], deepseek_client.api_key, notebook_manager)
+        
+        self.tasks = []
+        self.next_phase = None  # 同一循环中的下一个阶段，由循环设置
+        self.speculation = None  # 上一阶段评估时为本阶段指挥官任务预取的响应
+        self.completed = False
+        self.success = False
+    
+    def _get_phase_goal(self, phase_type: PhaseType) -> str:
+        """获取阶段目标"""
+        phase_goals = {
+            PhaseType.OBSERVE: "收集环境信息和数据，了解当前状况",
+            PhaseType.ORIENT: "分析理解收集到的信息，形成对情况的认知",
+            PhaseType.DECISION: "基于理解做出决策，制定行动计划",
+            PhaseType.ACTION: "执行具体的行动，实现目标"
+        }
+        return phase_goals.get(phase_type, "完成阶段任务")
+    
+    def execute(self, notebook):
+        """执行阶段 - 修复返回逻辑"""
+        return run_sync(self.aexecute(notebook))
+    
+    async def aexecute(self, notebook):
+        """异步执行阶段，并记录阶段耗时"""
+        start = time.perf_counter()
+        with ledger_scope(self.phase_type.value), span(f"phase {self.phase_type.value}", 'phase') as phase_span:
+            success, notebook = await self._aexecute(notebook)
+            phase_span.set(success=success)
+        metrics.record_phase(self.phase_type.value, time.perf_counter() - start, success)
+        return success, notebook
+    
+    async def _aexecute(self, notebook):
+        logger.info(f"执行 {self.phase_type.value} 阶段")
+        
+        # 添加阶段标题
+        phase_titles = {
+            PhaseType.OBSERVE: "🔍 观察阶段",
+            PhaseType.ORIENT: "🧠 理解阶段", 
+            PhaseType.DECISION: "🎯 决策阶段",
+            PhaseType.ACTION: "⚡ 行动阶段"
+        }
+        
+        notebook_manager = self.agent.manager
+        # 关键修复：获取添加标题后的更新notebook
+        notebook = await notebook_manager.aadd_markdown_cell(notebook, f"## {phase_titles[self.phase_type]}")
+        
+        # 记录阶段开始的cell索引
+        start_cell_index = len(notebook.cells)
+        
+        # 新增：更新阶段上下文
+        phase_context = {
+            'phase_type': self.phase_type.value,
+            'goal': self.goal,
+            'start_cell_index': start_cell_index,
+            'start_time': time.time()  # 用于判断哪些文件是本阶段生成的
+        }
+        self.context.set_phase_context(self.phase_type.value, phase_context)
+        
+        # 预算不足时不再重试
+        max_retries = 1 if is_degraded() else 3
+        if config.ooda.lean_mode:
+            return await self._aexecute_lean(notebook, start_cell_index, phase_context, max_retries)
+        for attempt in range(max_retries):
+            # 本次尝试的起点：规则评估只判定本次尝试执行的cell，之前失败尝试的出错cell不计入
+            phase_context['attempt_start_cell_index'] = len(notebook.cells)
+            phase_context['attempt_start_time'] = time.time()
+            # 1. 指挥官生成任务
+            task_description = self._generate_task_description()
+            task = Task(TaskType.COMMANDER_TASK, task_description, self.context, self.agent, self.goal)
+            self.tasks.append(task)
+            task_success, notebook = await task.aexecute(notebook)  # 接收更新后的notebook
+            # 推测的提示词与实际不一致时预取的响应没有被使用
+            self._discard_speculation()
+            
+            if not task_success:
+                logger.warning(f"指挥官任务失败，重试 {attempt + 1}/{max_retries}")
+                continue
+            
+            # 关键修改：获取指挥官生成的任务描述，用于后续的智能体任务
+            commander_generated_description = self._extract_commander_task_description(task)
+            
+            # 2. 阶段智能体执行任务
+            agent_task = Task(TaskType.AGENT_TASK, commander_generated_description, self.context, self.agent, self.goal)
+            self.tasks.append(agent_task)
+            agent_success, notebook = await agent_task.aexecute(notebook)  # 接收更新后的notebook
+            
+            if not agent_success:
+                logger.warning(f"智能体任务失败，重试 {attempt + 1}/{max_retries}")
+                continue
+            
+            # 3. 指挥官反思任务
+            reflection_task = Task(TaskType.REFLECTION_TASK, commander_generated_description, self.context, self.agent, self.goal)
+            self.tasks.append(reflection_task)
+            reflection_success, notebook = await reflection_task.aexecute(notebook)  # 接收更新后的notebook
+            
+            if not reflection_success:
+                logger.warning(f"反思任务失败，重试 {attempt + 1}/{max_retries}")
+                continue
+            
+            # 收集该阶段的所有cell内容作为上下文
+            end_cell_index = len(notebook.cells)
+            self.cell_context = self._collect_cell_context(notebook, start_cell_index, end_cell_index)
+            
+            # 新增：更新阶段完成状态到上下文
+            phase_context.update({
+                'completed': True,
+                'success': True,
+                'end_cell_index': end_cell_index,
+                'cell_context': self.cell_context
+            })
+            self.context.set_phase_context(self.phase_type.value, phase_context)
+            
+            # 评估阶段是否成功 - 使用注入的评估器，并传入goal和context
+            self._speculate_next_phase()
+            try:
+                phase_success, evaluate_response = await self.phase_evaluator.aevaluate_phase_success(
+                    self.phase_type.value, 
+                    self.context.get_all(),  # 现在包含完整的上下文信息
+                    self.goal,
+                    self.cell_context
+                )
+            except BaseException:
+                if self.next_phase is not None:
+                    self.next_phase._discard_speculation()
+                raise
+            
+            if phase_success:
+                logger.info(f"✅ {self.phase_type.value} 阶段执行成功")
+                self.success = True
+                self.completed = True
+                # 阶段边界：把内存中的notebook写入磁盘
+                await notebook_manager.aflush()
+                return True, notebook
+            else:
+                logger.warning(f"🔄 {self.phase_type.value} 阶段未完成，重试 {attempt + 1}/{max_retries}")
+                if self.next_phase is not None:
+                    self.next_phase._discard_speculation()
+                
+            await notebook_manager.aadd_markdown_cell(notebook, evaluate_response + "\n---\n## 阶段评估结果: " + '成功' if phase_success else '失败')
+        
+        logger.warning(f"❌ {self.phase_type.value} 阶段执行失败")
+        await notebook_manager.aflush()
+        return False, notebook
+
+    async def _aexecute_lean(self, notebook, start_cell_index: int, phase_context: Dict[str, Any], max_retries: int):
+        """
+        精简模式：每次尝试只调用一次模型，同时得到任务指令、说明、代码和自我评估
+        
+        代码执行成功且自我评估为完成即判定阶段成功，不再单独调用阶段评估器；
+        最后一个阶段的评估与循环评估合并为一次调用（见 Circle）
+        """
+        notebook_manager = self.agent.manager
+        for attempt in range(max_retries):
+            task = Task(TaskType.LEAN_TASK, self._generate_task_description(), self.context, self.agent, self.goal)
+            self.tasks.append(task)
+            task_success, notebook = await task.aexecute(notebook)
+            
+            if not task_success:
+                logger.warning(f"精简任务失败，重试 {attempt + 1}/{max_retries}")
+                continue
+            
+            end_cell_index = len(notebook.cells)
+            self.cell_context = self._collect_cell_context(notebook, start_cell_index, end_cell_index)
+            assessment = task.assessment
+            if assessment['complete']:
+                phase_context.update({
+                    'completed': True,
+                    'success': True,
+                    'end_cell_index': end_cell_index,
+                    'cell_context': self.cell_context
+                })
+                self.context.set_phase_context(self.phase_type.value, phase_context)
+                logger.info(f"✅ {self.phase_type.value} 阶段执行成功（自我评估）")
+                self.success = True
+                self.completed = True
+                await notebook_manager.aflush()
+                return True, notebook
+            
+            logger.warning(f"🔄 {self.phase_type.value} 阶段自我评估未完成，重试 {attempt + 1}/{max_retries}: {assessment['reason']}")
+            # 自我评估的理由作为错误记入上下文，下一次尝试的提示词中可以看到
+            self.context.add_error('phase_self_assessment', assessment['reason'],
+                                   {'phase_type': self.phase_type.value, 'attempt': attempt + 1})
+        
+        logger.warning(f"❌ {self.phase_type.value} 阶段执行失败")
+        await notebook_manager.aflush()
+        return False, notebook
+    
+    def _speculate_next_phase(self):
+        """
+        评估本阶段的同时预取下一阶段指挥官任务的模型响应
+
+        指挥官任务的提示词只取决于任务描述和上下文，评估不修改上下文，
+        因此评估通过后下一阶段发出的请求与预取的请求相同，可以直接使用预取的响应
+        """
+        next_phase = self.next_phase
+        if next_phase is None or not config.ooda.speculative_phases or is_degraded():
+            return
+        next_phase._discard_speculation()
+        system_prompt, user_prompt = next_phase.agent.build_task_prompts(
+            next_phase._generate_task_description(), self.context.get_all())
+        # 预取的用量记入下一阶段的指挥官任务（当前位于本阶段这一级）
+        context = scope_context(next_phase.phase_type.value, TaskType.COMMANDER_TASK.value, up=1)
+        next_phase.speculation = next_phase.agent.client.prefetch(system_prompt, user_prompt, context=context)
+    
+    def _discard_speculation(self):
+        """丢弃未被使用的预取响应"""
+        if self.speculation is not None:
+            self.agent.client.discard_prefetch(self.speculation)
+            self.speculation = None
+    
+    def _extract_commander_task_description(self, commander_task):
+        """从指挥官任务输出中提取生成的任务描述"""
+        # 优先从markdown输出中提取任务描述
+        for output in commander_task.outputs:
+            if output.output_type == OutputType.MARKDOWN:
+                # 提取任务描述的关键部分
+                content = output.content
+                # 可以添加更复杂的解析逻辑，这里简单返回整个内容
+                return content
+        
+        # 如果没有markdown输出，检查是否有其他输出
+        if commander_task.outputs:
+            # 如果有其他类型的输出，使用第一个输出的内容
+            return commander_task.outputs[0].content
+        
+        # 如果没有任何输出，回退到原始描述
+        return commander_task.description
+    
+    def _collect_cell_context(self, notebook, start_index: int, end_index: int) -> str:
+        """收集指定范围内的cell内容作为上下文"""
+        context_parts = [f"阶段目标: {self.goal}"]
+        for i in range(start_index, min(end_index, len(notebook.cells))):
+            cell = notebook.cells[i]
+            if cell.cell_type == 'markdown':
+                context_parts.append(f"Markdown Cell {i}: {cell.source}")
+            elif cell.cell_type == 'code':
+                context_parts.append(f"Code Cell {i}: {cell.source}")
+        
+        return "\n".join(context_parts)
+    
+    def _generate_task_description(self) -> str:
+        """生成任务描述"""
+        phase_descriptions = {
+            PhaseType.OBSERVE: "观察环境，收集相关信息",
+            PhaseType.ORIENT: "分析理解收集到的信息", 
+            PhaseType.DECISION: "基于理解做出决策",
+            PhaseType.ACTION: "执行具体的行动"
+        }
+        
+        mission = self.context.get('mission', '未知任务')
+        return f"任务: {mission}\n阶段: {self.phase_type.value}\n要求: {phase_descriptions[self.phase_type]}\n目标: {self.goal}"
+    
+    def get_status(self) -> Dict[str, Any]:
+        """获取阶段状态"""
+        return {
+            'phase_type': self.phase_type.value,
+            'goal': self.goal,
+            'completed': self.completed,
+            'success': self.success,
+            'tasks_completed': len([t for t in self.tasks if t.completed]),
+            'current_task': self.tasks[-1].get_status() if self.tasks else None,
+            'cell_context_length': len(self.cell_context) if self.cell_context else 0
         }
\ No newline at end of file
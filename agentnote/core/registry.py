@@ -0,0 +1,157 @@
+import os
+import threading
+from string import Formatter
+from typing import Dict, Any, Optional
+import yaml
+from .config import config
+from .deepseek_client import DeepSeekClient
+from .replay_client import create_client
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('Registry')
+
+DEFAULT_PROMPTS_PATH = os.path.join(os.path.dirname(__file__), '../prompts/prompts.yaml')
+
+_CONVERSIONS = {'s': str, 'r': repr, 'a': ascii}
+
+class PromptTemplate:
+    """预编译的提示词模板 - 模板只解析一次，渲染时直接拼接片段"""
+
+    def __init__(self, template: str):
+        self.template = template
+        self._parts = self._compile(template)
+        self.fields = {field for _, field, _, _ in Formatter().parse(template) if field} if self._parts is not None else None
+
+    @staticmethod
+    def _compile(template: str):
+        """把模板拆分为 (文本, 字段名, 格式, 转换) 片段；含复杂字段的模板交给str.format处理"""
+        try:
+            parts = list(Formatter().parse(template))
+        except ValueError:
+            return None
+        for _, field, spec, _ in parts:
+            if field is not None and (not field.isidentifier() or '{' in (spec or '')):
+                return None
+        return parts
+
+    def render(self, **kwargs) -> str:
+        """渲染模板，行为与 str.format(**kwargs) 一致"""
+        if self._parts is None:
+            return self.template.format(**kwargs)
+        pieces = []
+        for literal, field, spec, conversion in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                value = kwargs[field]
+                if conversion:
+                    value = _CONVERSIONS[conversion](value)
+                pieces.append(format(value, spec) if spec else str(value))
+        return ''.join(pieces)
+
+
+class PromptTemplates:
+    """提示词模板集合 - 预编译YAML中的所有模板，仅在文件修改时间变化时重新加载"""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.data: Dict[str, Any] = {}
+        self._templates: Dict[tuple, PromptTemplate] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+            templates = {}
+            for category, entries in data.items():
+                if isinstance(entries, dict):
+                    for key, template in entries.items():
+                        if isinstance(template, str):
+                            templates[(category, key)] = PromptTemplate(template)
+            self.data, self._templates, self._mtime = data, templates, mtime
+            logger.info(f"已加载提示词模板: {self.path}")
+
+    def get(self, category: str, key: str, **kwargs) -> str:
+        """获取格式化后的提示词，不存在时返回空字符串"""
+        self._reload_if_changed()
+        template = self._templates.get((category, key))
+        return template.render(**kwargs) if template else ""
+
+    def fields(self, category: str, key: str) -> Optional[set]:
+        """模板中引用的字段名，无法解析时返回None"""
+        self._reload_if_changed()
+        template = self._templates.get((category, key))
+        return template.fields if template else set()
+
+
+class Registry:
+    """进程级共享对象注册表 - API客户端、提示词模板和智能体只创建一次，在阶段、循环和任务之间复用"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: Dict[tuple, DeepSeekClient] = {}
+        self._prompts: Dict[str, PromptTemplates] = {}
+        # 阶段智能体绑定各自任务的NotebookManager，任务结束时通过release_agents释放
+        self._agents: Dict[Any, Dict[tuple, Any]] = {}
+
+    def get_client(self, api_key: Optional[str] = None, enable_thinking: bool = False) -> DeepSeekClient:
+        """获取共享的API客户端（同一密钥复用同一个连接池）"""
+        key = (config.deepseek.backend, api_key or config.deepseek.api_key, config.deepseek.base_url, enable_thinking)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = create_client(api_key, enable_thinking=enable_thinking)
+                self._clients[key] = client
+            return client
+
+    def get_prompts(self, path: str = DEFAULT_PROMPTS_PATH) -> PromptTemplates:
+        """获取共享的提示词模板"""
+        path = os.path.abspath(path)
+        with self._lock:
+            prompts = self._prompts.get(path)
+            if prompts is None:
+                prompts = PromptTemplates(path)
+                self._prompts[path] = prompts
+            return prompts
+
+    def get_agent(self, agent_cls, api_key: str, notebook_manager):
+        """获取绑定到指定NotebookManager的智能体，不存在时创建"""
+        with self._lock:
+            agents = self._agents.setdefault(notebook_manager, {})
+            key = (agent_cls, api_key)
+            agent = agents.get(key)
+            if agent is None:
+                agent = agent_cls(api_key, notebook_manager)
+                agents[key] = agent
+            return agent
+
+    def release_agents(self, notebook_manager):
+        """释放绑定到某个NotebookManager的智能体（任务结束时调用）"""
+        with self._lock:
+            self._agents.pop(notebook_manager, None)
+
+    def clear(self):
+        """清空注册表（修改配置后重新创建共享对象）"""
+        with self._lock:
+            self._clients.clear()
+            self._prompts.clear()
+            self._agents.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> Registry:
+    """获取进程级共享注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = Registry()
+        return _registry
@@ -0,0 +1,128 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Dict, List, Any
+from .config import config
+from .deepseek_client import DeepSeekClient
+from .metrics import metrics
+from .ledger import record_usage, normalize_usage
+from .api_log import iter_api_log, log_segments
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('ReplayClient')
+
+# 提示词中的时间戳（如错误上下文的记录时间）每次运行都不同，匹配时忽略
+TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:\.\d+)?')
+
+class ReplayMiss(LookupError):
+    """回放日志中没有与请求匹配的记录"""
+
+
+class ReplayDeepSeekClient(DeepSeekClient):
+    """
+    回放客户端 - 用 deepseek_api_log.jsonl 中记录的响应代替真实的API调用
+
+    按系统提示词和用户提示词（忽略其中的时间戳）匹配记录；同一请求被记录多次时按记录顺序依次返回，
+    用完后重复最后一条。响应前按记录的延迟乘以 replay_latency_scale 等待，
+    为0时立即返回，只测量编排和执行本身的开销。
+    """
+
+    def __init__(self, api_key=None, enable_thinking=False, log_file=None):
+        # 不创建HTTP客户端，也不需要API密钥
+        self.api_key = api_key or "replay"
+        self.enable_thinking = enable_thinking
+        self.cache = None  # 回放本身就是确定的，不经过响应缓存
+        self._init_request_state()
+        self.log_file = None  # 回放的调用不再写回日志
+        self.replay_file = log_file or config.deepseek.replay_log
+        self.latency_scale = config.deepseek.replay_latency_scale
+        self._records: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._served: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._load(self.replay_file)
+
+    @staticmethod
+    def _match_key(system_prompt: str, user_prompt: str) -> str:
+        payload = json.dumps([TIMESTAMP.sub('', system_prompt), TIMESTAMP.sub('', user_prompt)],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _load(self, path: str):
+        """读取日志中成功的调用记录"""
+        if not log_segments(path):
+            raise FileNotFoundError(f"回放日志不存在: {path}")
+        count = 0
+        # 包括轮转后压缩的分段和以哈希引用的提示词
+        for entry in iter_api_log(path):
+            request, response = entry.get('request'), entry.get('response')
+            if entry.get('error') or not request or not response or not response.get('content'):
+                continue
+            key = self._match_key(request['system_prompt'], request['user_prompt'])
+            self._records[key].append(response)
+            count += 1
+        logger.info(f"已加载 {count} 条回放记录: {path}")
+
+    def _next_response(self, request) -> Dict[str, Any]:
+        """取出与请求匹配的下一条记录"""
+        messages = request["messages"]
+        key = self._match_key(messages[0]["content"], messages[1]["content"])
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                raise ReplayMiss(f"回放日志中没有匹配的请求: {messages[1]['content'][:80]!r}")
+            index = min(self._served[key], len(records) - 1)
+            self._served[key] += 1
+            return records[index]
+
+    def _delay(self, response, field: str = 'latency') -> float:
+        return (response.get(field) or 0) * self.latency_scale
+
+    def _log_api_call(self, request_data, response_data, error=None):
+        pass
+
+    def _request_content(self, request):
+        self._check_budget(request)
+        response = self._next_response(request)
+        with metrics.timer('llm', model=response.get('model'), replay=True, **normalize_usage(response.get('usage'))):
+            time.sleep(self._delay(response))
+        record_usage(response.get('usage'))
+        return response['content']
+
+    async def _arequest_content(self, request):
+        self._check_budget(request)
+        response = self._next_response(request)
+        with metrics.timer('llm', model=response.get('model'), replay=True, **normalize_usage(response.get('usage'))):
+            await asyncio.sleep(self._delay(response))
+        record_usage(response.get('usage'))
+        return response['content']
+
+    async def _astream_content(self, request):
+        """按记录的首字延迟和总延迟逐行产出响应"""
+        self._check_budget(request)
+        response = self._next_response(request)
+        start = time.perf_counter()
+        total = self._delay(response)
+        first = min(self._delay(response, 'first_token_latency') or 0, total)
+        lines = response['content'].splitlines(keepends=True)
+        await asyncio.sleep(first)
+        step = (total - first) / len(lines)
+        for line in lines:
+            yield line
+            await asyncio.sleep(step)
+        metrics.add_time('llm', time.perf_counter() - start, model=response.get('model'), replay=True,
+                         stream=True, **normalize_usage(response.get('usage')))
+        record_usage(response.get('usage'))
+
+
+def create_client(api_key=None, enable_thinking=False) -> DeepSeekClient:
+    """按配置的后端创建客户端（api: 真实API; replay: 回放日志）"""
+    backend = config.deepseek.backend
+    if backend == "replay":
+        return ReplayDeepSeekClient(api_key, enable_thinking=enable_thinking)
+    if backend != "api":
+        raise ValueError(f"未知的模型后端: {backend}")
+    return DeepSeekClient(api_key, enable_thinking=enable_thinking)
@@ -0,0 +1,164 @@
+import os
+import re
+import ast
+from typing import Dict, Any, List, Optional, Tuple
+from .config import config
+from .context import Context
+from .evaluator import PhaseEvaluator
+from .metrics import metrics
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('RuleEvaluator')
+
+# 任务说明中提到的文件名，用于判断要求的产物是否已经生成
+ARTIFACT_PATTERN = re.compile(
+    r'[\w\-./\\]+\.(?:csv|tsv|json|jsonl|txt|md|html|pdf|png|jpe?g|svg|gif|xlsx?|parquet|pkl|npy|npz|dot|gml|graphml)\b',
+    re.IGNORECASE)
+
+
+class RuleBasedPhaseEvaluator(PhaseEvaluator):
+    """
+    基于规则的阶段评估器 - 先根据阶段内cell的执行结果在本地判定，无法确定时交给模型评估器
+
+    判定依据（按顺序）：
+    1. 有效的代码cell（未被回滚）执行出错 -> 失败
+    2. 含 assert 的代码cell全部执行通过 -> 成功
+    3. 说明中要求的文件全部已生成且非空 -> 成功
+    4. 代码执行后既没有任何输出也没有生成文件 -> 失败
+    5. 开启 trust_clean_execution 时，代码全部执行成功且都有输出 -> 成功
+    其余情况（如不生成代码的决策阶段）调用 fallback 评估。
+    """
+
+    def __init__(self, fallback: PhaseEvaluator, notebook_manager, context: Context,
+                 trust_clean_execution: bool = False):
+        self.fallback = fallback
+        self.manager = notebook_manager
+        self.context = context
+        self.trust_clean_execution = trust_clean_execution
+
+    def evaluate_phase_success(self, phase_type: str, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:
+        verdict = self._evaluate_locally(phase_type, context, goal)
+        if verdict is not None:
+            return verdict
+        return self.fallback.evaluate_phase_success(phase_type, context, goal, cell_context)
+
+    async def aevaluate_phase_success(self, phase_type: str, context: Dict[str, Any], goal: str, cell_context: str) -> tuple[bool, str]:
+        verdict = self._evaluate_locally(phase_type, context, goal)
+        if verdict is not None:
+            return verdict
+        return await self.fallback.aevaluate_phase_success(phase_type, context, goal, cell_context)
+
+    def _evaluate_locally(self, phase_type: str, context: Dict[str, Any], goal: str) -> Optional[Tuple[bool, str]]:
+        """规则能给出确定结论时返回 (是否成功, 评估说明)，否则返回None"""
+        success, reasons = self.judge(phase_type, context, goal)
+        if success is None:
+            metrics.count('phase_eval_fallback')
+            logger.debug(f"{phase_type} 阶段规则评估无法确定，交给模型评估: {'; '.join(reasons) or '无执行信号'}")
+            return None
+        metrics.count('phase_eval_local')
+        logger.info(f"{phase_type} 阶段规则评估: {'成功' if success else '失败'} ({'; '.join(reasons)})")
+        report = "\n".join(f"{i}. {reason}" for i, reason in enumerate(reasons, 1))
+        return success, f"规则评估:\n{report}\n\n{'是' if success else '否'}"
+
+    def judge(self, phase_type: str, context: Dict[str, Any], goal: str) -> Tuple[Optional[bool], List[str]]:
+        """根据阶段内cell的执行结果判定，返回 (结论或None, 判定理由)"""
+        nb = self.manager.nb
+        phase_context = self.context.get_phase_context(phase_type)
+        if nb is None or 'start_cell_index' not in phase_context:
+            return None, []
+        start = phase_context['start_cell_index']
+        end = phase_context.get('end_cell_index', len(nb.cells))
+        cells = [(i, nb.cells[i]) for i in range(start, min(end, len(nb.cells)))]
+        # 只判定本次尝试的代码cell（阶段重试时之前尝试的cell仍留在notebook中）
+        attempt_start = phase_context.get('attempt_start_cell_index', start)
+
+        code_cells = [(i, cell) for i, cell in cells if i >= attempt_start and cell.cell_type == 'code'
+                      and not cell.metadata.get('agentnote', {}).get('rolled_back')]
+        executed = [(i, cell) for i, cell in code_cells if cell.get('execution_count') is not None or cell.outputs]
+
+        # 1. 执行出错
+        errors = [f"cell {i} 执行出错: {output.get('ename', 'Error')}: {output.get('evalue', '')}"
+                  for i, cell in executed for output in cell.outputs if output.output_type == 'error']
+        if errors:
+            return False, errors
+
+        # 2. 断言cell
+        assertion_cells = [i for i, cell in executed if _has_assert(cell.source)]
+        if assertion_cells:
+            return True, [f"{len(assertion_cells)} 个包含断言的cell执行通过: {assertion_cells}"]
+
+        # 3. 要求的产物（阶段开始前就存在且未被修改的文件是输入，不计入）
+        start_time = phase_context.get('start_time')
+        instructions = [goal, context.get('mission', '')]
+        instructions += [cell.source for _, cell in cells if cell.cell_type == 'markdown']
+        mentioned = {name for text in instructions for name in ARTIFACT_PATTERN.findall(text or '')}
+        expected = sorted(name for name in mentioned if not self._is_input(name, start_time))
+        if expected and start_time is not None and all(self._is_produced(name, start_time) for name in expected):
+            return True, [f"要求的文件均已生成: {expected}"]
+
+        if not executed:
+            return None, []
+
+        # 4. 没有任何输出或文件（只看本次尝试开始后生成的文件）
+        with_output = [i for i, cell in executed if cell.outputs]
+        attempt_start_time = phase_context.get('attempt_start_time', start_time)
+        if not with_output and attempt_start_time is not None and not self._files_since(attempt_start_time):
+            return False, [f"{len(executed)} 个代码cell执行后没有任何输出，也没有生成文件"]
+
+        # 5. 代码全部执行成功且都有输出
+        if self.trust_clean_execution and len(with_output) == len(executed):
+            return True, [f"{len(executed)} 个代码cell全部执行成功并有输出"]
+        return None, [f"{len(executed)} 个代码cell执行成功，其中 {len(with_output)} 个有输出"]
+
+    def _workspace_root(self) -> str:
+        return os.path.dirname(os.path.abspath(self.manager.notebook_path))
+
+    def _resolve(self, name: str) -> str:
+        return name if os.path.isabs(name) else os.path.join(self._workspace_root(), name)
+
+    def _is_input(self, name: str, start_time: Optional[float]) -> bool:
+        """阶段开始前就已存在的文件"""
+        path = self._resolve(name)
+        return start_time is not None and os.path.isfile(path) and os.stat(path).st_mtime < start_time
+
+    def _is_produced(self, name: str, start_time: float) -> bool:
+        """阶段开始后生成或修改过的非空文件"""
+        path = self._resolve(name)
+        if not os.path.isfile(path):
+            return False
+        stat = os.stat(path)
+        return stat.st_size > 0 and stat.st_mtime >= start_time
+
+    def _files_since(self, start_time: float) -> List[str]:
+        """工作目录中在阶段开始后被创建或修改的文件"""
+        root = self._workspace_root()
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if filename.endswith(('.ipynb', '.ipynb.journal', '.ipynb.tmp')):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.stat(path).st_mtime >= start_time:
+                        files.append(os.path.relpath(path, root))
+                except OSError:
+                    continue
+        return files
+
+
+def _has_assert(source: str) -> bool:
+    """代码中是否包含 assert 语句"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return False
+    return any(isinstance(node, ast.Assert) for node in ast.walk(tree))
+
+
+def with_rules(phase_evaluator: PhaseEvaluator, notebook_manager, context: Context) -> PhaseEvaluator:
+    """按配置在评估器外包装规则评估"""
+    if not config.evaluation.rule_based:
+        return phase_evaluator
+    return RuleBasedPhaseEvaluator(phase_evaluator, notebook_manager, context,
+                                   config.evaluation.trust_clean_execution)
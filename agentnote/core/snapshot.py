@@ -0,0 +1,190 @@
+import os
+import shutil
+import weakref
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple, List
+from .config import config
+from ..utils.setup_logger import get_logger
+
+logger = get_logger('Snapshot')
+
+# 在内核中执行的快照辅助代码：复制用户命名空间，回滚时删除新增名称并还原旧值
+# 无法深拷贝的对象（模块、函数、文件句柄、连接等）按引用保存
+KERNEL_SNAPSHOT_CODE = '''
+def _agentnote_install_snapshots():
+    import copy, types
+    ip = get_ipython()
+    snapshots = {}
+    shared_types = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)
+
+    def user_names():
+        hidden = ip.user_ns_hidden
+        return [n for n in ip.user_ns if not n.startswith('_') and n not in hidden]
+
+    def checkpoint(key):
+        saved, shared = {}, []
+        for name in user_names():
+            value = ip.user_ns[name]
+            if isinstance(value, shared_types):
+                saved[name] = value
+                continue
+            try:
+                saved[name] = copy.deepcopy(value)
+            except Exception:
+                saved[name] = value
+                shared.append(name)
+        snapshots[key] = saved
+        return shared
+
+    def rollback(key):
+        saved = snapshots[key]
+        for name in user_names():
+            if name not in saved:
+                del ip.user_ns[name]
+        for name, value in saved.items():
+            if isinstance(value, shared_types):
+                ip.user_ns[name] = value
+                continue
+            try:
+                ip.user_ns[name] = copy.deepcopy(value)
+            except Exception:
+                ip.user_ns[name] = value
+
+    def discard(key):
+        snapshots.pop(key, None)
+
+    return checkpoint, rollback, discard
+
+_agentnote_checkpoint, _agentnote_rollback, _agentnote_discard = _agentnote_install_snapshots()
+del _agentnote_install_snapshots
+'''
+
+# 各工作目录上使用中的跟踪器（创建过检查点且尚未关闭），以及累计登记的次数
+_trackers_lock = threading.Lock()
+_active_trackers: Dict[str, 'weakref.WeakSet[WorkspaceTracker]'] = defaultdict(weakref.WeakSet)
+_registrations: Dict[str, int] = defaultdict(int)
+
+
+class WorkspaceTracker:
+    """
+    工作目录文件跟踪器 - 记录检查点时的文件状态，回滚时删除新文件并还原被修改的文件
+
+    同一进程中的多个任务可能共用一个工作目录（如默认的 environment/），此时无法区分
+    新文件属于哪个任务：检查点之后该目录上出现过其他跟踪器时，回滚不删除也不覆盖文件，
+    只报告无法恢复的文件。需要完整回滚的并发任务应使用各自的目录（见服务模式）。
+    """
+
+    def __init__(self, root: str, exclude: Tuple[str, ...] = ()):
+        self.root = os.path.abspath(root)
+        self.exclude = {os.path.abspath(p) for p in exclude}
+        self.backup_dir = None
+        self._checkpoints: Dict[str, Dict[str, Tuple[int, int, str]]] = {}
+        self._backups: Dict[Tuple[str, int, int], str] = {}
+        # 检查点 -> (当时是否有其他跟踪器, 当时的累计登记次数)
+        self._sharing: Dict[str, Tuple[bool, int]] = {}
+        self._registered = False
+
+    def _register(self) -> Tuple[bool, int]:
+        """登记为该目录上使用中的跟踪器，返回 (是否有其他跟踪器, 累计登记次数)"""
+        with _trackers_lock:
+            trackers = _active_trackers[self.root]
+            if not self._registered:
+                trackers.add(self)
+                _registrations[self.root] += 1
+                self._registered = True
+            return len(trackers) > 1, _registrations[self.root]
+
+    def is_shared(self, key: str) -> bool:
+        """检查点之后是否有其他跟踪器使用过同一目录"""
+        shared, registrations = self._sharing[key]
+        with _trackers_lock:
+            return shared or len(_active_trackers[self.root]) > 1 or _registrations[self.root] != registrations
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """扫描工作目录，返回 {路径: (mtime_ns, size)}"""
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            # 跳过隐藏目录（快照备份、缓存等）
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                # notebook文件及其操作日志由NotebookManager管理
+                if path in self.exclude or filename.endswith(('.ipynb', '.ipynb.journal', '.ipynb.tmp')):
+                    continue
+                stat = os.stat(path)
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def checkpoint(self, key: str) -> List[str]:
+        """记录当前文件状态，返回因过大而未备份的文件"""
+        self._sharing[key] = self._register()
+        if self.backup_dir is None:
+            self.backup_dir = tempfile.mkdtemp(prefix='.agentnote_snapshot_', dir=self.root)
+
+        max_size = config.executor.snapshot_max_file_mb * 1024 * 1024
+        state, skipped = {}, []
+        for path, (mtime, size) in self._scan().items():
+            backup_key = (path, mtime, size)
+            # 文件未变化时复用已有备份，检查点开销只与变化的文件相关
+            if backup_key not in self._backups:
+                if size > max_size:
+                    skipped.append(path)
+                    state[path] = (mtime, size, None)
+                    continue
+                backup_path = os.path.join(self.backup_dir, f"{len(self._backups)}_{os.path.basename(path)}")
+                shutil.copy2(path, backup_path)
+                self._backups[backup_key] = backup_path
+            state[path] = (mtime, size, self._backups[backup_key])
+        self._checkpoints[key] = state
+        return skipped
+
+    def rollback(self, key: str) -> List[str]:
+        """恢复到检查点时的文件状态，返回无法恢复的文件"""
+        state = self._checkpoints[key]
+        current = self._scan()
+        unrestorable = []
+
+        if self.is_shared(key):
+            # 变化的文件可能是其他任务写入的，不能删除或覆盖
+            changed = sorted(path for path in set(current) | set(state)
+                             if path not in state or current.get(path) != state[path][:2])
+            if changed:
+                logger.warning(f"工作目录 {self.root} 被其他任务共用，回滚不修改文件")
+            return changed
+
+        for path in current:
+            if path not in state:
+                os.remove(path)
+        for path, (mtime, size, backup_path) in state.items():
+            if current.get(path) == (mtime, size):
+                continue
+            if backup_path is None:
+                unrestorable.append(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy2(backup_path, path)
+        return unrestorable
+
+    def discard(self, key: str):
+        """丢弃检查点，并清理不再被任何检查点引用的备份"""
+        self._checkpoints.pop(key, None)
+        self._sharing.pop(key, None)
+        referenced = {entry[2] for state in self._checkpoints.values() for entry in state.values()}
+        for backup_key, backup_path in list(self._backups.items()):
+            if backup_path not in referenced:
+                os.remove(backup_path)
+                del self._backups[backup_key]
+        if not self._checkpoints and self.backup_dir:
+            shutil.rmtree(self.backup_dir, ignore_errors=True)
+            self.backup_dir = None
+            self._backups.clear()
+
+    def close(self):
+        """丢弃所有检查点，不再登记为该目录上使用中的跟踪器"""
+        for key in list(self._checkpoints):
+            self.discard(key)
+        with _trackers_lock:
+            _active_trackers[self.root].discard(self)
+            self._registered = False
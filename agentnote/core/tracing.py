@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# 汇总耗时时统计的类别，其余时间计为空闲/编排开销
+SUMMARY_CATEGORIES = ('llm', 'execution', 'notebook_io', 'sleep')
+
+_current_trace: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('agentnote_trace', default=None)
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('agentnote_span', default=None)
+
+
+class Span:
+    """一段被追踪的执行过程"""
+
+    def __init__(self, name: str, category: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attrs):
+        """添加或修改属性（如调用结束后才知道的token数）"""
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    """未开启追踪时使用的空span"""
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    一次任务的追踪记录 - 收集循环、阶段、任务、模型调用、代码执行和notebook读写的span
+
+    导出为Chrome trace-event格式（chrome://tracing 或 Perfetto 可直接打开）。
+    同一asyncio任务中的span严格嵌套，并发的asyncio任务和线程各占一条轨道。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.start_time = time.time()
+        self.end = None
+        self.spans: List[Span] = []
+        self._tracks: Dict[Any, Tuple[int, str]] = {}
+        self._events_tracks: List[int] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """在代码块内把span记入本追踪"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            self.end = time.perf_counter()
+            _current_trace.reset(token)
+
+    def _track(self) -> int:
+        """当前span所在的轨道：asyncio任务或线程"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = task if task is not None else threading.get_ident()
+        label = task.get_name() if task is not None else threading.current_thread().name
+        with self._lock:
+            if key not in self._tracks:
+                self._tracks[key] = (len(self._tracks) + 1, label)
+            return self._tracks[key][0]
+
+    def add(self, span: Span):
+        track = self._track()
+        with self._lock:
+            self.spans.append(span)
+            self._events_tracks.append(track)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """转换为Chrome trace-event格式"""
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': self.name}}]
+        with self._lock:
+            for tid, label in self._tracks.values():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': label}})
+            for span, tid in zip(self.spans, self._events_tracks):
+                events.append({
+                    'name': span.name,
+                    'cat': span.category,
+                    'ph': 'X',
+                    'ts': round((span.start - self.start) * 1e6, 1),
+                    'dur': round((span.end - span.start) * 1e6, 1),
+                    'pid': pid,
+                    'tid': tid,
+                    'args': {k: v for k, v in span.attrs.items() if v is not None},
+                })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'mission': self.name, 'start_time': self.start_time, 'summary': self.summary()}}
+
+    def export(self, path: str) -> str:
+        """写入JSON文件，返回文件路径"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)
+        return path
+
+    def summary(self) -> Dict[str, float]:
+        """
+        总耗时在模型调用、代码执行、notebook读写和等待之间的分布（秒）
+
+        并发的span按时间区间合并后计算，各类别之间有重叠时（如流式生成时边生成边执行）
+        各自都计入；idle为不属于任何类别的时间。
+        """
+        end = self.end or time.perf_counter()
+        with self._lock:
+            intervals = {category: [(s.start, s.end) for s in self.spans if s.category == category]
+                         for category in SUMMARY_CATEGORIES}
+        result = {'wall': round(end - self.start, 4)}
+        for category, spans in intervals.items():
+            result[category] = round(_union_length(spans), 4)
+        busy = _union_length([interval for spans in intervals.values() for interval in spans])
+        result['idle'] = round(max(end - self.start - busy, 0.0), 4)
+        return result
+
+
+def _union_length(intervals: List[Tuple[float, float]]) -> float:
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+@contextmanager
+def span(name: str, category: str = '', **attrs):
+    """追踪一段代码；不在追踪中时几乎没有开销"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield NOOP_SPAN
+        return
+    current = Span(name, category or name, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def record_span(name: str, category: str, seconds: float, **attrs):
+    """记录一段刚刚结束、耗时为seconds的过程"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    current = Span(name, category, attrs)
+    current.end = time.perf_counter()
+    current.start = current.end - seconds
+    trace.add(current)
+
+
+def current_span():
+    """当前所在的span，不在追踪中时返回空span"""
+    return _current_span.get() or NOOP_SPAN
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+AgentNote 服务入口 - 通过HTTP提交任务，由常驻的工作线程从持久化队列中取出执行
+
+接口:
+    POST   /jobs                  提交任务 {"mission": "..."}，返回任务记录
+    GET    /jobs?status=&limit=   列出任务
+    GET    /jobs/<id>             任务状态，执行中的任务附带当前循环、阶段和子任务的状态
+    POST   /jobs/<id>/cancel      取消任务（DELETE /jobs/<id> 等价）
+    GET    /jobs/<id>/notebook    下载任务的notebook（已还原转存的输出和图片；?raw=1 下载磁盘上的原文件）
+    GET    /health                服务状态和各状态的任务数
+
+用法:
+    python -m agentnote.service --port 8765 --workers 4
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+import concurrent.futures
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional, Tuple
+
+from agentnote.core.config import config
+from agentnote.core.job_store import JobStore, JOB_STATUSES
+from agentnote.core.async_utils import submit
+from agentnote.utils.config_loader import load_config_from_yaml
+from agentnote.utils.setup_logger import get_logger
+
+logger = get_logger('Service')
+
+
+class AgentNoteService:
+    """
+    任务服务 - 工作线程从队列中取出任务，在共享的后台事件循环中执行
+
+    每个任务使用独立的指挥官智能体（独立的notebook和内核），同时执行的任务数等于工作线程数。
+    服务停止时执行中的任务被取消并重新排队，下次启动后重新执行。
+    """
+
+    def __init__(self, api_key: str, store: JobStore, workers: int = None, poll_interval: float = 0.5):
+        self.api_key = api_key
+        self.store = store
+        self.workers = workers or config.service.workers
+        self.poll_interval = poll_interval
+        self._running: Dict[str, Tuple[Any, Any]] = {}  # 任务id -> (指挥官, Future)
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._wakeup = threading.Condition()
+        self._threads = []
+
+    def start(self) -> 'AgentNoteService':
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ServiceWorker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"已启动 {self.workers} 个工作线程")
+        return self
+
+    def stop(self, timeout: float = 30.0):
+        """停止取新任务，取消执行中的任务并把它们放回队列"""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        with self._lock:
+            running = list(self._running.items())
+        for job_id, (_, future) in running:
+            if future is not None:
+                future.cancel()
+        for thread in self._threads:
+            thread.join(timeout)
+        # 等待期间已经结束（成功、失败或被用户取消）的任务保留最终状态
+        requeued = [job_id for job_id, _ in running if self.store.requeue(job_id)]
+        if requeued:
+            logger.info(f"服务停止，{len(requeued)} 个执行中的任务已重新排队")
+
+    # ---- 任务操作 ----
+
+    def submit_job(self, mission: str) -> Dict[str, Any]:
+        job = self.store.submit(mission)
+        logger.info(f"任务 {job['id']} 已提交")
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """取消任务，任务不存在时返回None"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if self.store.cancel_queued(job_id):
+            logger.info(f"任务 {job_id} 已在开始前取消")
+        else:
+            with self._lock:
+                running = self._running.get(job_id)
+                if running is not None:
+                    # 刚取出还未提交到事件循环的任务，由工作线程在提交前检查
+                    self._cancel_requested.add(job_id)
+            if running is not None and running[1] is not None:
+                running[1].cancel()
+                logger.info(f"正在取消执行中的任务 {job_id}")
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务记录，执行中的任务附带指挥官的实时状态"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            running = self._running.get(job_id)
+        if running is not None and running[0] is not None:
+            commander = running[0]
+            job['progress'] = commander.get_status()
+            if commander.current_circle is not None:
+                job['notebook'] = commander.current_circle.manager.notebook_path
+        return job
+
+    def notebook_path(self, job_id: str) -> Optional[str]:
+        """任务notebook的路径，执行中的任务先把内存中的修改写入磁盘"""
+        with self._lock:
+            running = self._running.get(job_id)
+        if running is not None and running[0] is not None and running[0].current_circle is not None:
+            manager = running[0].current_circle.manager
+            manager.compact()
+            return manager.notebook_path
+        job = self.store.get(job_id)
+        return job['notebook'] if job else None
+
+    @staticmethod
+    def job_dir(job_id: str) -> str:
+        """任务的notebook和内核工作目录"""
+        return os.path.join(config.notebook.directory, 'jobs', job_id)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            running = len(self._running)
+        return {'status': 'stopping' if self._stopping.is_set() else 'ok',
+                'workers': self.workers, 'running': running, 'jobs': self.store.counts()}
+
+    # ---- 工作线程 ----
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self.store.claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: Dict[str, Any]):
+        from agentnote.agents.commander_agent import CommanderAgent
+
+        job_id = job['id']
+        with self._lock:
+            self._running[job_id] = (None, None)
+        logger.info(f"开始执行任务 {job_id}")
+        commander = None
+        try:
+            # 同时执行的任务各用一个目录：内核工作目录、文件回滚和产物检查互不干扰
+            commander = CommanderAgent(self.api_key, notebook_dir=self.job_dir(job_id))
+            with self._lock:
+                if job_id in self._cancel_requested or self._stopping.is_set():
+                    raise asyncio.CancelledError()
+                future = submit(commander.aexecute_mission(job['mission']))
+                self._running[job_id] = (commander, future)
+            success = future.result()
+            history = commander.mission_history[-1]
+            status, error = ('succeeded' if success else 'failed'), None
+            result = {'success': success, **history}
+        except (asyncio.CancelledError, concurrent.futures.CancelledError):
+            status, error, result = 'cancelled', None, None
+        except Exception as e:
+            logger.exception(f"任务 {job_id} 执行异常", exc_info=e)
+            status, error, result = 'failed', f"{type(e).__name__}: {e}", None
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+                user_cancelled = job_id in self._cancel_requested
+                self._cancel_requested.discard(job_id)
+
+        if self._stopping.is_set() and status == 'cancelled' and not user_cancelled:
+            # 服务停止导致的取消，由stop()重新排队
+            return
+        notebook = None
+        if commander is not None and commander.current_circle is not None:
+            notebook = commander.current_circle.manager.notebook_path
+        self.store.update(job_id, status=status, notebook=notebook, result=result, error=error)
+        logger.info(f"任务 {job_id} 结束: {status}")
+
+
+def _make_handler(service: AgentNoteService):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+        def _send_json(self, status: int, payload: Any):
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status: int, message: str):
+            self._send_json(status, {'error': message})
+
+        def _route(self) -> Tuple[list, Dict[str, list]]:
+            url = urlparse(self.path)
+            return [part for part in url.path.split('/') if part], parse_qs(url.query)
+
+        def do_GET(self):
+            parts, query = self._route()
+            if parts == ['health']:
+                self._send_json(200, service.health())
+            elif parts == ['jobs']:
+                status = query.get('status', [None])[0]
+                if status is not None and status not in JOB_STATUSES:
+                    self._send_error(400, f"未知的任务状态: {status}")
+                    return
+                try:
+                    limit = int(query.get('limit', ['100'])[0])
+                except ValueError:
+                    self._send_error(400, "limit 必须是整数")
+                    return
+                self._send_json(200, {'jobs': service.store.list(status, limit)})
+            elif len(parts) == 2 and parts[0] == 'jobs':
+                job = service.status(parts[1])
+                if job is None:
+                    self._send_error(404, f"任务不存在: {parts[1]}")
+                else:
+                    self._send_json(200, job)
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'notebook':
+                self._send_notebook(parts[1], raw=query.get('raw', ['0'])[0] not in ('0', 'false', ''))
+            else:
+                self._send_error(404, f"未知的路径: {self.path}")
+
+        def do_POST(self):
+            parts, _ = self._route()
+            if parts == ['jobs']:
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                except json.JSONDecodeError as e:
+                    self._send_error(400, f"请求体不是合法的JSON: {e}")
+                    return
+                mission = body.get('mission') if isinstance(body, dict) else None
+                if not isinstance(mission, str) or not mission.strip():
+                    self._send_error(400, "缺少任务描述 mission")
+                    return
+                self._send_json(201, service.submit_job(mission.strip()))
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+                self._cancel(parts[1])
+            else:
+                self._send_error(404, f"未知的路径: {self.path}")
+
+        def do_DELETE(self):
+            parts, _ = self._route()
+            if len(parts) == 2 and parts[0] == 'jobs':
+                self._cancel(parts[1])
+            else:
+                self._send_error(404, f"未知的路径: {self.path}")
+
+        def _cancel(self, job_id: str):
+            job = service.cancel(job_id)
+            if job is None:
+                self._send_error(404, f"任务不存在: {job_id}")
+            else:
+                self._send_json(202 if job['status'] == 'running' else 200, job)
+
+        def _send_notebook(self, job_id: str, raw: bool = False):
+            path = service.notebook_path(job_id)
+            if not path or not os.path.exists(path):
+                self._send_error(404, f"任务 {job_id} 没有notebook")
+                return
+            if raw:
+                with open(path, 'rb') as f:
+                    body = f.read()
+            else:
+                # 磁盘上的notebook只有转存输出的预览和二进制输出的引用，下载时还原为完整的notebook
+                from agentnote.core.notebook_exporter import NotebookExporter
+                with tempfile.TemporaryDirectory(prefix='agentnote_export_') as tmp:
+                    exported = NotebookExporter.export_full_notebook(path, os.path.join(tmp, os.path.basename(path)))
+                    with open(exported, 'rb') as f:
+                        body = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ipynb+json')
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def create_server(service: AgentNoteService, host: str = None, port: int = None) -> ThreadingHTTPServer:
+    """创建HTTP服务器，port为0时随机选择端口"""
+    host = host if host is not None else config.service.host
+    port = port if port is not None else config.service.port
+    httpd = ThreadingHTTPServer((host, port), _make_handler(service))
+    httpd.daemon_threads = True
+    return httpd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AgentNote 任务服务')
+    parser.add_argument('--host', default=None, help='监听地址，默认取配置 service.host')
+    parser.add_argument('--port', type=int, default=None, help='监听端口，默认取配置 service.port')
+    parser.add_argument('--workers', type=int, default=None, help='同时执行的任务数，默认取配置 service.workers')
+    parser.add_argument('--db', default=None, help='任务队列数据库，默认取配置 service.db_path')
+    parser.add_argument('--config', default='config.yaml', help='配置文件')
+    args = parser.parse_args(argv)
+
+    load_config_from_yaml(args.config)
+    if config.deepseek.backend == "replay":
+        api_key = "replay"
+    else:
+        api_key = os.getenv('DEEPSEEK_API_KEY') or config.deepseek.api_key
+    if not api_key:
+        logger.error("需要通过 DEEPSEEK_API_KEY 环境变量或配置文件提供DeepSeek API密钥")
+        return 1
+
+    store = JobStore(args.db or config.service.db_path)
+    service = AgentNoteService(api_key, store, args.workers).start()
+    httpd = create_server(service, args.host, args.port)
+    host, port = httpd.server_address[:2]
+    logger.info(f"服务已启动: http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("收到中断信号，正在停止服务")
+    finally:
+        httpd.server_close()
+        service.stop()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
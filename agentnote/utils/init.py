@@ -1,3 +1,3 @@
-from .config_loader import load_config_from_yaml, save_config_to_yaml
-
+from .config_loader import load_config_from_yaml, save_config_to_yaml
+
 __all__ = ['load_config_from_yaml', 'save_config_to_yaml']
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+基准测试使用的脚本化任务
+
+每个任务的描述中带有 [bench:<名称>] 标记，模拟服务器据此找到任务脚本，
+按请求所属的智能体返回对应的Markdown说明和代码块。
+"""
+
+MISSIONS = {
+    'dataframe_stats': {
+        'description': '生成一份模拟销售数据，统计各地区的销售额并找出表现最好的地区',
+        'code': {
+            'observe': (
+                "import sys, platform\n"
+                "import numpy as np\n"
+                "import pandas as pd\n"
+                "print(platform.python_version(), np.__version__, pd.__version__)"
+            ),
+            'orient': (
+                "rng = np.random.default_rng(0)\n"
+                "sales = pd.DataFrame({\n"
+                "    'region': rng.choice(['north', 'south', 'east', 'west'], 5000),\n"
+                "    'amount': rng.gamma(2.0, 150.0, 5000),\n"
+                "})\n"
+                "summary = sales.groupby('region')['amount'].agg(['count', 'sum', 'mean'])\n"
+                "print(summary)"
+            ),
+            'action': (
+                "best = summary['sum'].idxmax()\n"
+                "print(f'best region: {best}, total: {summary.loc[best, \"sum\"]:.2f}')"
+            ),
+        },
+    },
+    'numeric_loop': {
+        'description': '用蒙特卡洛方法估计圆周率，并分析估计误差随样本量的变化',
+        'code': {
+            'observe': "import math, random\nprint(math.pi)",
+            'orient': (
+                "def estimate_pi(n, seed=0):\n"
+                "    rnd = random.Random(seed)\n"
+                "    inside = sum(1 for _ in range(n) if rnd.random() ** 2 + rnd.random() ** 2 <= 1)\n"
+                "    return 4 * inside / n\n"
+                "errors = {n: abs(estimate_pi(n) - math.pi) for n in (1000, 10000, 100000)}\n"
+                "print(errors)"
+            ),
+            'action': "print(min(errors, key=errors.get))",
+        },
+    },
+    'retry_recovery': {
+        'description': '读取配置并计算结果，第一次生成的代码会出错，用于测试重试和状态回滚',
+        'code': {
+            'observe': "values = list(range(10))\nprint(len(values))",
+            'orient': "total = sum(values)\nprint(total)",
+            # 首次尝试引用未定义的名称，重试提示词下返回修复后的代码
+            'action': "result = total / missing_factor\nprint(result)",
+        },
+        'fixed_code': {
+            'action': "missing_factor = 2\nresult = total / missing_factor\nprint(result)",
+        },
+    },
+}
+
+DEFAULT_MISSION = 'dataframe_stats'
+
+
+def mission_prompt(name: str) -> str:
+    """带基准测试标记的任务描述"""
+    return f"[bench:{name}] {MISSIONS[name]['description']}"
@@ -0,0 +1,167 @@
+"""
+本地OpenAI兼容的模拟服务器
+
+实现 /chat/completions（含流式SSE），按配置的首字延迟和生成速度返回预设响应，
+用于在没有网络和API密钥的情况下测量整个流程的吞吐和延迟。
+"""
+import re
+import json
+import time
+import uuid
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Tuple
+
+from .missions import MISSIONS, DEFAULT_MISSION
+
+CHARS_PER_TOKEN = 4  # 估算token数时每个token对应的字符数
+
+AGENT_ROLES = {
+    '你是观察智能体': 'observe',
+    '你是理解智能体': 'orient',
+    '你是决策智能体': 'decision',
+    '你是行动智能体': 'action',
+    '你是指挥官智能体': 'commander',
+}
+
+
+def canned_response(system_prompt: str, user_prompt: str) -> str:
+    """根据提示词选择预设响应：评估器返回成功结论，智能体返回说明和任务脚本中的代码"""
+    if system_prompt.startswith(('你是阶段评估器', '你是循环评估器')):
+        if user_prompt.startswith('请同时评估'):
+            return "1. 已生成并执行了与目标相关的代码\n2. 代码运行没有报错\n\n阶段: 是\n循环: 是"
+        return "1. 已生成并执行了与目标相关的代码\n2. 代码运行没有报错\n\n成功"
+
+    match = re.search(r'\[bench:(\w+)\]', user_prompt)
+    mission = MISSIONS.get(match.group(1) if match else DEFAULT_MISSION, MISSIONS[DEFAULT_MISSION])
+    role = next((r for prefix, r in AGENT_ROLES.items() if system_prompt.startswith(prefix)), 'commander')
+
+    text = f"1. 当前任务: {mission['description']}\n2. 本步骤由{role}完成\n\n下面的代码完成本步骤的工作。\n"
+    code = mission['code'].get(role)
+    lean = '当前为精简模式' in system_prompt
+    if user_prompt.startswith('任务执行出现错误') or (lean and 'previous_errors' in user_prompt):
+        code = mission.get('fixed_code', {}).get(role, code)
+    if lean:
+        # 精简模式：一次返回任务指令、说明、代码和自我评估
+        return json.dumps({
+            'task': f"{role}: {mission['description']}",
+            'markdown': text,
+            'code': code or "",
+            'assessment': {'complete': True, 'reason': '代码完成了本阶段的工作'},
+        }, ensure_ascii=False)
+    if code:
+        text += f"\n```python\n{code}\n```\n\n执行后检查输出是否符合预期。"
+    return text
+
+
+class MockOpenAIServer:
+    """在后台线程中运行的模拟服务器"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.2, tokens_per_second: float = 200.0):
+        self.latency = latency  # 首字延迟（秒）
+        self.tokens_per_second = tokens_per_second  # 生成速度，0表示不限速
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockOpenAIServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='MockOpenAIServer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                server.requests += 1
+                system_prompt, user_prompt = self._prompts(body['messages'])
+                content = canned_response(system_prompt, user_prompt)
+                usage = {
+                    'prompt_tokens': (len(system_prompt) + len(user_prompt)) // CHARS_PER_TOKEN,
+                    'completion_tokens': len(content) // CHARS_PER_TOKEN,
+                }
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+                time.sleep(server.latency)
+                if body.get('stream'):
+                    self._stream(body['model'], content, usage)
+                else:
+                    self._complete(body['model'], content, usage)
+
+            @staticmethod
+            def _prompts(messages) -> Tuple[str, str]:
+                system_prompt = next((m['content'] for m in messages if m['role'] == 'system'), '')
+                user_prompt = next((m['content'] for m in messages if m['role'] == 'user'), '')
+                return system_prompt, user_prompt
+
+            def _complete(self, model, content, usage):
+                time.sleep(server._token_delay() * usage['completion_tokens'])
+                payload = json.dumps({
+                    'id': f"chatcmpl-{uuid.uuid4().hex}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': content}}],
+                    'usage': usage,
+                }, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, model, content, usage):
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+
+                def send(choices, **extra):
+                    chunk = {'id': completion_id, 'object': 'chat.completion.chunk',
+                             'created': int(time.time()), 'model': model, 'choices': choices, **extra}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+
+                delay = server._token_delay()
+                for i in range(0, len(content), CHARS_PER_TOKEN):
+                    send([{'index': 0, 'delta': {'content': content[i:i + CHARS_PER_TOKEN]}, 'finish_reason': None}])
+                    if delay:
+                        time.sleep(delay)
+                send([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+                send([], usage=usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,117 @@
+"""
+notebook读写基准测试
+
+按cell数从少到多（直到 notebook.max_cells）构造带有典型输出的notebook，
+分别测量经过nbformat校验的读写和快速路径的读写耗时，结果写入JSON文件。
+
+用法（在仓库根目录下）:
+    python -m benchmarks.notebook_io_benchmark --output notebook_io.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from datetime import datetime
+
+import nbformat as nbf
+
+from agentnote.core import notebook_io
+from agentnote.core.config import config
+
+from .run_benchmark import git_commit
+
+
+def build_notebook(cells: int):
+    """构造与任务生成的notebook相似的内容：markdown说明和带输出的代码cell交替出现"""
+    nb = nbf.v4.new_notebook()
+    for i in range(cells):
+        if i % 2 == 0:
+            nb.cells.append(nbf.v4.new_markdown_cell(
+                f"## 步骤 {i // 2}\n\n根据上一步的结果计算各分组的统计量，并检查异常值。\n"))
+            continue
+        cell = nbf.v4.new_code_cell(
+            "summary = sales.groupby('region')['amount'].agg(['count', 'sum', 'mean'])\n"
+            f"print(summary.head({i}))\n"
+            "summary.describe()")
+        cell.execution_count = i
+        cell.outputs = [
+            nbf.v4.new_output('stream', name='stdout',
+                              text=''.join(f"region_{j}  {j * 31 % 997}  {j * 7.25:.2f}\n" for j in range(40))),
+            nbf.v4.new_output('execute_result', execution_count=i,
+                              data={'text/plain': '\n'.join(f"row {j}: {j / 3:.6f}" for j in range(20))}),
+        ]
+        nb.cells.append(cell)
+    return nb
+
+
+def measure(fn, repeat: int) -> float:
+    """重复执行，返回耗时的中位数（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def run_size(cells: int, repeat: int) -> dict:
+    nb = build_notebook(cells)
+    validated = notebook_io.dumps(nb, validate=True)
+    fast = notebook_io.dumps(nb)
+    assert notebook_io.loads(fast) == notebook_io.loads(validated, validate=True)
+    result = {
+        'cells': cells,
+        'bytes_validated': len(validated),
+        'bytes_fast': len(fast),
+        'save_validated_ms': measure(lambda: notebook_io.dumps(nb, validate=True), repeat),
+        'save_fast_ms': measure(lambda: notebook_io.dumps(nb), repeat),
+        'load_validated_ms': measure(lambda: notebook_io.loads(validated, validate=True), repeat),
+        'load_fast_ms': measure(lambda: notebook_io.loads(fast), repeat),
+    }
+    result['save_speedup'] = round(result['save_validated_ms'] / max(result['save_fast_ms'], 1e-6), 1)
+    result['load_speedup'] = round(result['load_validated_ms'] / max(result['load_fast_ms'], 1e-6), 1)
+    return result
+
+
+def main(argv=None):
+    max_cells = config.notebook.max_cells
+    parser = argparse.ArgumentParser(description='AgentNote notebook读写基准测试')
+    parser.add_argument('--cells', nargs='+', type=int,
+                        default=sorted({10, 50, 100, 200, max_cells}),
+                        help=f'测试的cell数，默认到 notebook.max_cells ({max_cells}) 为止')
+    parser.add_argument('--repeat', type=int, default=20, help='每项测量重复的次数（取中位数）')
+    parser.add_argument('--output', default='notebook_io_results.json', help='结果文件')
+    args = parser.parse_args(argv)
+
+    results = []
+    for cells in args.cells:
+        result = run_size(cells, args.repeat)
+        results.append(result)
+        print(f"{cells:>5} cells ({result['bytes_fast'] / 1024:.0f} KiB): "
+              f"save {result['save_validated_ms']:.2f} -> {result['save_fast_ms']:.2f} ms "
+              f"(x{result['save_speedup']}), "
+              f"load {result['load_validated_ms']:.2f} -> {result['load_fast_ms']:.2f} ms "
+              f"(x{result['load_speedup']})", file=sys.stderr)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'nbformat': nbf.__version__,
+        'orjson': notebook_io.orjson is not None,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    output = os.path.abspath(args.output)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {output}", file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+端到端基准测试
+
+启动本地模拟服务器，通过 CommanderAgent 依次运行脚本化任务，统计每个阶段的耗时、
+模型调用/代码执行/notebook读写的耗时、每秒生成的cell数和峰值内存，结果写入JSON文件。
+指定 --replay 时再用本次记录的API日志回放同样的任务，回放中有任务失败时以非零状态退出。
+
+用法（在仓库根目录下）:
+    python -m benchmarks.run_benchmark --backend kernel nbconvert --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+from agentnote.core.config import config
+from agentnote.core.metrics import metrics
+from agentnote.core.registry import get_registry
+from agentnote.core.api_log import get_api_log_writer
+from agentnote.agents.commander_agent import CommanderAgent
+
+from .mock_server import MockOpenAIServer
+from .missions import MISSIONS, mission_prompt
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit() -> str:
+    """当前代码的提交号，便于跨提交比较结果"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_mission(name: str, backend: str) -> dict:
+    """运行一个任务并收集指标"""
+    config.executor.backend = backend
+    metrics.reset()
+    start = time.perf_counter()
+    commander = CommanderAgent(config.deepseek.api_key)
+    success = commander.execute_mission(mission_prompt(name))
+    wall_time = time.perf_counter() - start
+
+    snapshot = metrics.snapshot()
+    cells = snapshot['counters'].get('cells', 0)
+    return {
+        'mission': name,
+        'backend': backend,
+        'replay': config.deepseek.backend == 'replay',
+        'stream': config.deepseek.stream,
+        'speculative': config.ooda.speculative_phases,
+        'lean': config.ooda.lean_mode,
+        'rule_based': config.evaluation.rule_based,
+        'success': success,
+        'wall_time': round(wall_time, 4),
+        'llm_time': snapshot['timings'].get('llm', 0.0),
+        'llm_calls': snapshot['calls'].get('llm', 0),
+        'execution_time': snapshot['timings'].get('execution', 0.0),
+        'executions': snapshot['calls'].get('execution', 0),
+        'notebook_io_time': snapshot['timings'].get('notebook_io', 0.0),
+        'cells': cells,
+        'cells_per_second': round(cells / wall_time, 3) if wall_time else None,
+        'prefetch_hits': snapshot['counters'].get('prefetch_hits', 0),
+        'prefetch_discarded': snapshot['counters'].get('prefetch_discarded', 0),
+        'local_evaluations': snapshot['counters'].get('phase_eval_local', 0),
+        'usage': commander.ledger.snapshot()['totals'],
+        'phases': snapshot['phases'],
+    }
+
+
+def use_replay_backend():
+    """切换到回放后端，回放当前工作目录中已记录的API日志（不等待记录的延迟）"""
+    get_api_log_writer().flush()
+    config.deepseek.backend = 'replay'
+    config.deepseek.replay_log = config.api_log.path
+    config.deepseek.replay_latency_scale = 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AgentNote 端到端基准测试')
+    parser.add_argument('--missions', nargs='+', default=list(MISSIONS), choices=list(MISSIONS))
+    parser.add_argument('--backend', nargs='+', default=['kernel'], choices=['kernel', 'nbconvert'])
+    parser.add_argument('--repeat', type=int, default=1, help='每个任务重复运行的次数')
+    parser.add_argument('--latency', type=float, default=0.2, help='模拟的首字延迟（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help='模拟的生成速度，0表示不限速')
+    parser.add_argument('--stream', action='store_true', help='使用流式生成')
+    parser.add_argument('--speculative', action='store_true', help='评估阶段的同时预取下一阶段的指挥官响应')
+    parser.add_argument('--lean', action='store_true', help='精简模式：每个阶段一次模型调用')
+    parser.add_argument('--rule-based', action='store_true', help='先用规则在本地评估阶段，无法确定时再调用模型')
+    parser.add_argument('--replay', action='store_true', help='运行结束后用记录的API日志回放同样的任务')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果文件')
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output)
+
+    server = MockOpenAIServer(latency=args.latency, tokens_per_second=args.tokens_per_second).start()
+    config.deepseek.base_url = server.base_url
+    config.deepseek.api_key = 'benchmark'
+    config.deepseek.backend = 'api'
+    config.deepseek.stream = args.stream
+    config.ooda.speculative_phases = args.speculative
+    config.ooda.lean_mode = args.lean
+    config.evaluation.rule_based = args.rule_based
+    # 缓存会让重复运行跳过模型调用，基准测试中关闭
+    config.cache.enabled = False
+    get_registry().clear()
+
+    # notebook、日志等运行产物写入临时目录
+    workdir = tempfile.mkdtemp(prefix='agentnote_bench_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        for replay in ([False, True] if args.replay else [False]):
+            if replay:
+                use_replay_backend()
+            for backend in args.backend:
+                for name in args.missions:
+                    for _ in range(args.repeat):
+                        result = run_mission(name, backend)
+                        results.append(result)
+                        print(f"[{backend}{', replay' if replay else ''}] {name}: {result['wall_time']:.2f}s, "
+                              f"llm {result['llm_time']:.2f}s, exec {result['execution_time']:.2f}s, "
+                              f"io {result['notebook_io_time']:.3f}s, {result['cells']} cells", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'latency': args.latency,
+            'tokens_per_second': args.tokens_per_second,
+            'stream': args.stream,
+            'speculative': args.speculative,
+            'lean': args.lean,
+            'rule_based': args.rule_based,
+            'replay': args.replay,
+            'repeat': args.repeat,
+            'kernel_pool_size': config.executor.pool_size,
+            'durability': config.notebook.durability,
+        },
+        'results': results,
+        'peak_rss_mb': metrics.peak_rss_mb(),
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {output}", file=sys.stderr)
+    failed = [r['mission'] for r in results if r['replay'] and not r['success']]
+    if failed:
+        raise SystemExit(f"回放失败的任务: {', '.join(failed)}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+import pytest
+
+from agentnote.core.config import config
+
+
+@pytest.fixture(autouse=True)
+def isolated_workdir(tmp_path, monkeypatch):
+    """每个测试在临时目录中运行，不预启动内核，不使用共享的响应缓存"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config.executor, 'pool_size', 0)
+    monkeypatch.setattr(config.cache, 'enabled', False)
+    return tmp_path
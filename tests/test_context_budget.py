@@ -0,0 +1,69 @@
+import pytest
+
+from agentnote.core.context_budget import ContextBudgeter, TRUNCATED_MARK
+
+
+@pytest.fixture
+def budgeter():
+    return ContextBudgeter(min_section_tokens=8)
+
+
+def total_tokens(budgeter, fitted):
+    return sum(budgeter.count_tokens(text) for text in fitted.values())
+
+
+def test_under_budget_is_unchanged(budgeter):
+    sections = {'mission': '计算平均值', 'instruction': 'write code'}
+    fitted, cuts = budgeter.fit(1000, sections, {'total_errors': 0, 'recent_errors': ['a', 'b']})
+    assert fitted['mission'] == '计算平均值'
+    assert fitted['instruction'] == 'write code'
+    assert fitted['context'] == "total_errors: 0\nrecent_errors: - a\n- b"
+    assert cuts == []
+
+
+def test_low_priority_context_is_cut_before_mission(budgeter):
+    mission = '统计数据集中每一列的均值'
+    context = {'circle_context': 'x' * 400, 'previous_outputs_count': 'y' * 400}
+    fitted, cuts = budgeter.fit(budgeter.count_tokens(mission) + 40, {'mission': mission}, context)
+
+    assert fitted['mission'] == mission
+    assert {cut['section'] for cut in cuts} == {'context.circle_context', 'context.previous_outputs_count'}
+    assert all(cut['kept'] < cut['tokens'] for cut in cuts)
+    assert total_tokens(budgeter, fitted) <= budgeter.count_tokens(mission) + 40
+
+
+def test_required_section_is_not_shrunk_while_others_can_be_dropped(budgeter):
+    mission = 'm' * 400
+    fitted, cuts = budgeter.fit(budgeter.count_tokens(mission), {'mission': mission},
+                                {'error_context': 'e' * 400})
+    assert fitted['mission'] == mission
+    assert fitted['context'] == '无'
+    assert cuts == [{'section': 'context.error_context', 'action': 'dropped',
+                     'tokens': budgeter.count_tokens('error_context: ' + 'e' * 400), 'kept': 0}]
+
+
+def test_required_section_is_truncated_as_last_resort(budgeter):
+    fitted, cuts = budgeter.fit(20, {'mission': 'm' * 400})
+    assert fitted['mission'].endswith(TRUNCATED_MARK)
+    assert budgeter.count_tokens(fitted['mission']) <= 20
+    assert cuts[0]['section'] == 'mission' and cuts[0]['action'] == 'truncated'
+
+
+def test_tail_sections_keep_most_recent_text(budgeter):
+    history = 'old ' * 100 + 'latest error'
+    fitted, _ = budgeter.fit(30, {'mission': 'task'}, {'error_history': history})
+    assert fitted['context'].startswith('error_history: ' + TRUNCATED_MARK)
+    assert fitted['context'].endswith('latest error')
+
+
+def test_fit_is_deterministic(budgeter):
+    sections = {'mission': '任务' * 50, 'instruction': 'i' * 300}
+    context = {'cell_context': 'c' * 500, 'circle_goal': 'g' * 200, 'error_context': 'e' * 300}
+    first = budgeter.fit(150, sections, context)
+    assert all(budgeter.fit(150, dict(sections), dict(context)) == first for _ in range(3))
+
+
+def test_excluded_keys_are_not_repeated_in_context(budgeter):
+    fitted, _ = budgeter.fit(1000, {'mission': 'task'}, {'mission': 'task', 'total_errors': 1},
+                             exclude=['mission'])
+    assert fitted['context'] == 'total_errors: 1'
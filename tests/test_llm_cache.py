@@ -0,0 +1,42 @@
+import sqlite3
+
+from agentnote.core.llm_cache import LLMCache
+
+
+def make_key(prompt):
+    return LLMCache.make_key('deepseek-chat', 'system', prompt, 0.0, False)
+
+
+def test_round_trip_survives_reopen(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = LLMCache(path)
+    assert cache.get(make_key('q')) is None
+    cache.put(make_key('q'), 'answer')
+    cache.close()
+
+    reopened = LLMCache(path)
+    assert reopened.get(make_key('q')) == 'answer'
+    assert reopened.stats()['hits'] == 1
+    reopened.close()
+
+
+def test_locked_database_does_not_fail_calls(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = LLMCache(path, busy_timeout=0.05)
+    cache.put(make_key('stored'), 'answer')
+    cache._memory.clear()
+
+    # 另一个进程持有写锁
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        cache.put(make_key('new'), 'fresh')
+        assert cache.get(make_key('new')) == 'fresh'  # 写入失败时仍保留在内存层
+        assert cache.get(make_key('stored')) == 'answer'  # WAL模式下写锁不阻塞读取
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+    cache._memory.clear()
+    assert cache.get(make_key('new')) is None
+    cache.close()
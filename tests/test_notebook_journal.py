@@ -0,0 +1,94 @@
+import json
+
+import nbformat as nbf
+import pytest
+
+from agentnote.core.config import config
+from agentnote.core.notebook_journal import NotebookJournal
+from agentnote.core.notebook_manager import NotebookManager
+
+
+@pytest.fixture
+def journaled(monkeypatch):
+    monkeypatch.setattr(config.notebook, 'journal', True)
+    monkeypatch.setattr(config.notebook, 'journal_compact_every', 1000)
+
+
+def open_manager(path):
+    manager = NotebookManager(str(path))
+    return manager, manager.initialize_notebook()
+
+
+def sources(nb):
+    return [cell.source for cell in nb.cells]
+
+
+def test_replay_applies_cell_level_ops(tmp_path):
+    journal = NotebookJournal(str(tmp_path / 'nb.ipynb'))
+    journal.append({'op': 'add_cell', 'cell': nbf.v4.new_code_cell('x = 1')})
+    journal.append({'op': 'set_source', 'index': 0, 'source': 'x = 2'})
+    journal.append({'op': 'set_outputs', 'index': 0, 'execution_count': 3,
+                    'outputs': [nbf.v4.new_output('stream', name='stdout', text='2\n')]})
+    journal.append({'op': 'add_cell', 'cell': nbf.v4.new_markdown_cell('done')})
+    journal.append({'op': 'keep_last', 'count': 1})
+    journal.close()
+
+    nb = journal.replay(nbf.v4.new_notebook())
+    assert sources(nb) == ['done']
+    assert journal.seq == 5
+
+
+def test_replay_stops_at_torn_last_record(tmp_path):
+    journal = NotebookJournal(str(tmp_path / 'nb.ipynb'))
+    journal.append({'op': 'add_cell', 'cell': nbf.v4.new_markdown_cell('kept')})
+    journal.close()
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add_cell", "cell": {"cell_ty')
+
+    nb = journal.replay(nbf.v4.new_notebook())
+    assert sources(nb) == ['kept']
+
+
+def test_recovers_uncompacted_ops_after_crash(tmp_path, journaled):
+    path = tmp_path / 'nb.ipynb'
+    manager, nb = open_manager(path)
+    manager.add_markdown_cell(nb, 'a')
+    manager.add_code_cell(nb, 'b = 1')
+    manager.journal.close()  # 模拟崩溃：只留下操作日志
+
+    _, recovered = open_manager(path)
+    assert sources(recovered)[1:] == ['a', 'b = 1']
+
+
+def test_interrupted_compaction_does_not_duplicate_cells(tmp_path, journaled):
+    path = tmp_path / 'nb.ipynb'
+    manager, nb = open_manager(path)
+    for text in ('a', 'b', 'c'):
+        manager.add_markdown_cell(nb, text)
+    # 模拟在写出notebook之后、清空日志之前崩溃
+    with manager._write_lock, manager._lock:
+        manager.journal.stamp(manager.nb)
+        manager._write_notebook()
+    manager.add_markdown_cell(nb, 'd')
+    manager.journal.close()
+
+    recovered_manager, recovered = open_manager(path)
+    assert sources(recovered)[1:] == ['a', 'b', 'c', 'd']
+    assert recovered_manager.journal.seq == len(recovered.cells)
+
+
+def test_numbering_resumes_after_reopening(tmp_path, journaled):
+    path = tmp_path / 'nb.ipynb'
+    manager, nb = open_manager(path)
+    manager.add_markdown_cell(nb, 'a')
+    manager.close()
+
+    reopened, nb = open_manager(path)
+    reopened.add_markdown_cell(nb, 'b')
+    with open(reopened.journal.path, encoding='utf-8') as f:
+        seqs = [json.loads(line)['seq'] for line in f]
+    assert seqs[0] > nb.metadata['agentnote']['journal_seq']
+    reopened.journal.close()
+
+    _, recovered = open_manager(path)
+    assert sources(recovered)[1:] == ['a', 'b']
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+import pytest
+
+from agentnote.core.replay_client import ReplayDeepSeekClient, ReplayMiss
+
+
+def write_log(path, *records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for system_prompt, user_prompt, content in records:
+            entry = {'request': {'system_prompt': system_prompt, 'user_prompt': user_prompt},
+                     'response': {'content': content, 'model': 'deepseek-chat', 'latency': 0.5}}
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = str(tmp_path / 'api_log.jsonl')
+    write_log(path,
+              ('sys', '2024-05-01 10:00:00 执行任务', 'first'),
+              ('sys', '2024-05-01 10:00:00 执行任务', 'second'),
+              ('sys', 'other', 'other answer'))
+    replay = ReplayDeepSeekClient(log_file=path)
+    replay.latency_scale = 0
+    return replay
+
+
+def test_records_are_served_in_order_then_repeated(client):
+    assert client.generate_content('sys', '2024-05-01 10:00:00 执行任务') == 'first'
+    assert client.generate_content('sys', '2024-05-01 10:00:00 执行任务') == 'second'
+    assert client.generate_content('sys', '2024-05-01 10:00:00 执行任务') == 'second'
+
+
+def test_timestamps_do_not_affect_matching(client):
+    assert client.generate_content('sys', '2026-10-17T08:30:12.123 执行任务') == 'first'
+
+
+def test_async_generation(client):
+    assert asyncio.run(client.agenerate_content('sys', 'other')) == 'other answer'
+
+
+def test_unknown_request_raises(client):
+    with pytest.raises(ReplayMiss):
+        client.generate_content('sys', 'never recorded')
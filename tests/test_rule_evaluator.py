@@ -0,0 +1,110 @@
+import time
+from types import SimpleNamespace
+
+import nbformat as nbf
+import pytest
+
+from agentnote.core.context import Context
+from agentnote.core.evaluator import PhaseEvaluator
+from agentnote.core.rule_evaluator import RuleBasedPhaseEvaluator
+
+
+class RecordingEvaluator(PhaseEvaluator):
+    """记录调用次数的模型评估器替身"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def evaluate_phase_success(self, phase_type, context, goal, cell_context):
+        self.calls += 1
+        return True, "fallback"
+
+    async def aevaluate_phase_success(self, phase_type, context, goal, cell_context):
+        return self.evaluate_phase_success(phase_type, context, goal, cell_context)
+
+
+def code_cell(source, outputs=(), execution_count=1, rolled_back=False):
+    cell = nbf.v4.new_code_cell(source, execution_count=execution_count)
+    cell.outputs = list(outputs)
+    if rolled_back:
+        cell.metadata['agentnote'] = {'rolled_back': True}
+    return cell
+
+
+def stdout(text):
+    return nbf.v4.new_output('stream', name='stdout', text=text)
+
+
+def error(ename='ValueError', evalue='bad'):
+    return nbf.v4.new_output('error', ename=ename, evalue=evalue, traceback=[])
+
+
+@pytest.fixture
+def make_evaluator(tmp_path):
+    def make(cells, trust_clean_execution=False, **phase_context):
+        nb = nbf.v4.new_notebook()
+        nb.cells = [nbf.v4.new_markdown_cell('# header')] + list(cells)
+        context = Context()
+        context.set_phase_context('act', {'start_cell_index': 1, 'start_time': time.time() - 1, **phase_context})
+        manager = SimpleNamespace(nb=nb, notebook_path=str(tmp_path / 'nb.ipynb'))
+        return RuleBasedPhaseEvaluator(RecordingEvaluator(), manager, context, trust_clean_execution)
+    return make
+
+
+def test_error_output_fails_phase(make_evaluator):
+    evaluator = make_evaluator([code_cell('x = 1', [stdout('ok')]), code_cell('int("a")', [error()])])
+    success, reasons = evaluator.judge('act', {}, 'goal')
+    assert success is False
+    assert 'cell 2' in reasons[0] and 'ValueError' in reasons[0]
+
+
+def test_rolled_back_cells_are_ignored(make_evaluator):
+    evaluator = make_evaluator([code_cell('int("a")', [error()], rolled_back=True),
+                                code_cell('assert 1 + 1 == 2')])
+    assert evaluator.judge('act', {}, 'goal')[0] is True
+
+
+def test_cells_before_current_attempt_are_ignored(make_evaluator):
+    evaluator = make_evaluator([code_cell('int("a")', [error()]), code_cell('assert True')],
+                               attempt_start_cell_index=2)
+    assert evaluator.judge('act', {}, 'goal')[0] is True
+
+
+def test_passing_assertions_succeed(make_evaluator):
+    evaluator = make_evaluator([code_cell('assert sum([1, 2]) == 3')])
+    success, reasons = evaluator.judge('act', {}, 'goal')
+    assert success is True
+    assert '[1]' in reasons[0]
+
+
+def test_required_artifact_produced(make_evaluator, tmp_path):
+    (tmp_path / 'summary.csv').write_text('a,b\n1,2\n')
+    evaluator = make_evaluator([code_cell('df.to_csv("summary.csv")')])
+    success, reasons = evaluator.judge('act', {'mission': '把结果写入 summary.csv'}, 'goal')
+    assert success is True
+    assert 'summary.csv' in reasons[0]
+
+
+def test_no_output_and_no_files_fails(make_evaluator):
+    evaluator = make_evaluator([code_cell('x = 1')])
+    assert evaluator.judge('act', {}, 'goal')[0] is False
+
+
+def test_clean_execution_is_trusted_only_when_enabled(make_evaluator):
+    cells = [code_cell('print(1)', [stdout('1\n')])]
+    assert make_evaluator(cells).judge('act', {}, 'goal')[0] is None
+    assert make_evaluator(cells, trust_clean_execution=True).judge('act', {}, 'goal')[0] is True
+
+
+def test_undecided_phase_uses_fallback(make_evaluator):
+    evaluator = make_evaluator([nbf.v4.new_markdown_cell('决定下一步')])
+    assert evaluator.evaluate_phase_success('act', {}, 'goal', '') == (True, "fallback")
+    assert evaluator.fallback.calls == 1
+
+
+def test_local_verdict_skips_fallback(make_evaluator):
+    evaluator = make_evaluator([code_cell('int("a")', [error()])])
+    success, report = evaluator.evaluate_phase_success('act', {}, 'goal', '')
+    assert success is False
+    assert report.startswith('规则评估:') and report.endswith('否')
+    assert evaluator.fallback.calls == 0